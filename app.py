@@ -5,6 +5,7 @@ from flask_login import LoginManager, UserMixin, login_user, login_required, log
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime, timedelta
 import os
+import click
 from flask_migrate import Migrate
 
 # Khởi tạo ứng dụng Flask
@@ -15,6 +16,50 @@ app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
     "connect_args": {"ssl": {"fake_flag_to_enable_tls": True}}
 }
 
+# Cache cho dashboard và báo cáo: 'memory' (mỗi worker) hoặc 'file' (dùng chung giữa các worker)
+app.config['CACHE_BACKEND'] = os.environ.get('CACHE_BACKEND', 'memory')
+app.config['CACHE_DIR'] = os.environ.get('CACHE_DIR', os.path.join(app.instance_path, 'cache'))
+app.config['CACHE_TTL'] = int(os.environ.get('CACHE_TTL', 300))
+app.config['CACHE_MAX_ENTRIES'] = int(os.environ.get('CACHE_MAX_ENTRIES', 512))
+
+# Cache file xuất Excel trên đĩa, giới hạn theo dung lượng (LRU)
+app.config['EXPORT_CACHE_DIR'] = os.environ.get('EXPORT_CACHE_DIR', os.path.join(app.instance_path, 'exports'))
+app.config['EXPORT_CACHE_MAX_BYTES'] = int(os.environ.get('EXPORT_CACHE_MAX_MB', 512)) * 1024 * 1024
+
+# Ảnh QR điểm danh đã vẽ, dùng chung cho mọi worker
+app.config['QR_CACHE_DIR'] = os.environ.get('QR_CACHE_DIR', os.path.join(app.instance_path, 'qr'))
+# Token trong mã QR tự chấm công đổi sau mỗi khoảng này (giây)
+app.config['QR_TOKEN_SECONDS'] = int(os.environ.get('QR_TOKEN_SECONDS', 30))
+
+# Nhập dữ liệu chấm công hàng loạt từ máy chấm công (CSV/XLSX)
+app.config['IMPORT_DIR'] = os.environ.get('IMPORT_DIR', os.path.join(app.instance_path, 'imports'))
+app.config['IMPORT_CHUNK_ROWS'] = int(os.environ.get('IMPORT_CHUNK_ROWS', 2000))
+# Đối soát sao kê ngân hàng: chỉ so với các khoản thanh toán trong số ngày gần đây này
+app.config['RECONCILE_LOOKBACK_DAYS'] = int(os.environ.get('RECONCILE_LOOKBACK_DAYS', 120))
+
+# Tác vụ nền (tính lương, thanh toán hàng loạt)
+app.config['JOB_WORKERS'] = int(os.environ.get('JOB_WORKERS', 2))
+app.config['JOB_CHUNK_SIZE'] = int(os.environ.get('JOB_CHUNK_SIZE', 500))
+app.config['JOB_STALE_SECONDS'] = int(os.environ.get('JOB_STALE_SECONDS', 300))
+app.config['JOB_POLL_SECONDS'] = int(os.environ.get('JOB_POLL_SECONDS', 10))
+
+# Chấm công: 'direct' (ghi ngay mỗi request) hoặc 'batched' (gom nhiều lượt vào một lần ghi)
+app.config['ATTENDANCE_INGEST_MODE'] = os.environ.get('ATTENDANCE_INGEST_MODE', 'direct')
+app.config['INGEST_BATCH_SIZE'] = int(os.environ.get('INGEST_BATCH_SIZE', 200))
+app.config['INGEST_BATCH_MS'] = int(os.environ.get('INGEST_BATCH_MS', 50))
+app.config['INGEST_QUEUE_SIZE'] = int(os.environ.get('INGEST_QUEUE_SIZE', 5000))
+app.config['INGEST_ACK_TIMEOUT'] = int(os.environ.get('INGEST_ACK_TIMEOUT', 10))
+
+# Số tiến trình tính lương song song (lệnh `flask generate-payroll`)
+app.config['PAYROLL_WORKERS'] = int(os.environ.get('PAYROLL_WORKERS', 4))
+
+# Change feed đồng bộ tăng dần: độ trễ (giây) phải lớn hơn giao dịch ghi dài nhất
+app.config['CHANGE_FEED_LAG_SECONDS'] = int(os.environ.get('CHANGE_FEED_LAG_SECONDS', 30))
+app.config['CHANGE_FEED_PAGE_SIZE'] = int(os.environ.get('CHANGE_FEED_PAGE_SIZE', 500))
+
+# Số dòng mỗi trang của danh sách chấm công, thanh toán và nhân viên
+app.config['LIST_PAGE_SIZE'] = int(os.environ.get('LIST_PAGE_SIZE', 50))
+
 # Khởi tạo SQLAlchemy và Migrate
 db = SQLAlchemy(app)
 migrate = Migrate(app, db)
@@ -41,7 +86,14 @@ def format_currency(value):
         return "0 ₫"
 
 # Import routes sau khi khởi tạo db
-from routes import auth, employees, attendance, payroll, payments, reports
+from routes import auth, employees, attendance, payroll, payments, reports, jobs, exports, feeds
+from services.cache import init_cache
+from services.jobs import runner
+from services.ingest import ingestor
+
+init_cache(app)
+runner.init_app(app)
+ingestor.init_app(app)
 
 # Register blueprints
 app.register_blueprint(auth.bp)
@@ -50,141 +102,48 @@ app.register_blueprint(attendance.bp)
 app.register_blueprint(payroll.bp)
 app.register_blueprint(payments.bp)
 app.register_blueprint(reports.bp)
+app.register_blueprint(jobs.bp)
+app.register_blueprint(exports.bp)
+app.register_blueprint(feeds.bp)
+
+@app.cli.command('rebuild-rollups')
+def rebuild_rollups():
+    """Recompute the monthly attendance, payroll and payment rollups from raw rows"""
+    from services.rollups import rebuild
+    rebuild()
+    print("✓ Đã tính lại bảng tổng hợp tháng")
+
+@app.cli.command('generate-payroll')
+@click.option('--month', type=int, required=True)
+@click.option('--year', type=int, required=True)
+@click.option('--workers', type=int, default=None, help='Defaults to PAYROLL_WORKERS')
+def generate_payroll(month, year, workers):
+    """Generate missing payrolls of a period for every active employee in parallel"""
+    from services.payroll_engine import run_payroll
+    
+    workers = workers or app.config['PAYROLL_WORKERS']
+    created_keys, skipped_ids, _ = run_payroll(month, year, workers)
+    print(f"✓ Đã tạo {len(created_keys)} bảng lương, bỏ qua {len(skipped_ids)} đã tồn tại ({workers} tiến trình)")
+
+@app.cli.command('recompute-payroll')
+def recompute_payroll():
+    """Recalculate unpaid payrolls whose attendance changed after generation"""
+    from models import db as models_db
+    from services.payroll_engine import recompute_dirty
+    recomputed, skipped = recompute_dirty()
+    models_db.session.commit()
+    print(f"✓ Đã tính lại {recomputed} bảng lương, bỏ qua {skipped}")
 
 @app.route('/')
 @login_required
 def index():
-    # Import models here to avoid circular import
-    from models import Employee, Attendance, Payroll, Payment, Department
+    # Import here to avoid circular import
+    from services.dashboard import dashboard_context
     
     # Get current date info (Việt Nam time +07)
     now = datetime.utcnow() + timedelta(hours=7)  # Múi giờ Việt Nam
-    current_month = now.month
-    current_year = now.year
-    
-    # Employee statistics
-    total_employees = Employee.query.filter_by(is_active=True).count()
-    new_employees_this_month = Employee.query.filter(
-        db.extract('month', Employee.hire_date) == current_month,
-        db.extract('year', Employee.hire_date) == current_year
-    ).count()
-    
-    # Department statistics
-    total_departments = Department.query.count()
-    
-    # Attendance statistics for current month
-    current_month_attendance = Attendance.query.filter(
-        db.extract('month', Attendance.date) == current_month,
-        db.extract('year', Attendance.date) == current_year
-    ).all()
-    
-    total_work_hours = sum(a.total_hours or 0 for a in current_month_attendance)
-    total_overtime_hours = sum(a.overtime_hours or 0 for a in current_month_attendance)
-    attendance_records = len(current_month_attendance)
-    
-    # Payroll statistics for current month
-    current_month_payroll = Payroll.query.filter_by(
-        month=current_month, 
-        year=current_year
-    ).all()
-    
-    total_salary = sum(p.total_salary for p in current_month_payroll)
-    total_allowances = sum(p.allowance for p in current_month_payroll)
-    total_deductions = sum(p.deductions for p in current_month_payroll)
-    total_overtime_pay = sum(p.overtime_pay for p in current_month_payroll)
-    
-    # Payment statistics for current month
-    current_month_payments = Payment.query.filter(
-        db.extract('month', Payment.payment_date) == current_month,
-        db.extract('year', Payment.payment_date) == current_year
-    ).all()
-    
-    total_payments = sum(p.amount for p in current_month_payments if p.status == 'completed')
-    pending_payments = sum(p.amount for p in current_month_payments if p.status == 'pending')
-    failed_payments = sum(p.amount for p in current_month_payments if p.status == 'failed')
-    
-    # Calculate average salary
-    if total_employees > 0:
-        avg_salary = total_salary / total_employees
-    else:
-        avg_salary = 0
-    
-    # Recent activities (last 5 records)
-    recent_attendances = Attendance.query.order_by(Attendance.date.desc()).limit(5).all()
-    recent_payments = Payment.query.order_by(Payment.payment_date.desc()).limit(5).all()
-    
-    # Department distribution
-    departments = Department.query.all()
-    dept_stats = []
-    for dept in departments:
-        emp_count = Employee.query.filter_by(department_id=dept.id, is_active=True).count()
-        if emp_count > 0:
-            dept_salary = sum(emp.salary for emp in Employee.query.filter_by(department_id=dept.id, is_active=True).all())
-            dept_stats.append({
-                'name': dept.name,
-                'count': emp_count,
-                'total_salary': dept_salary
-            })
-    
-    # Monthly trends (last 6 months)
-    monthly_trends = []
-    for i in range(6):
-        month = (now.month - i - 1) % 12 + 1
-        year = now.year - ((i + 1) // 12)
-        
-        month_attendance = Attendance.query.filter(
-            db.extract('month', Attendance.date) == month,
-            db.extract('year', Attendance.date) == year
-        ).count()
-        
-        month_payroll = Payroll.query.filter_by(month=month, year=year).all()
-        month_salary = sum(p.total_salary for p in month_payroll)
-        
-        monthly_trends.append({
-            'month': month,
-            'year': year,
-            'attendance': month_attendance,
-            'salary': month_salary
-        })
-    
-    monthly_trends.reverse()
     
-    return render_template('dashboard.html',
-                         # Employee stats
-                         total_employees=total_employees,
-                         new_employees_this_month=new_employees_this_month,
-                         total_departments=total_departments,
-                         
-                         # Attendance stats
-                         total_work_hours=total_work_hours,
-                         total_overtime_hours=total_overtime_hours,
-                         attendance_records=attendance_records,
-                         
-                         # Payroll stats
-                         total_salary=total_salary,
-                         total_allowances=total_allowances,
-                         total_deductions=total_deductions,
-                         total_overtime_pay=total_overtime_pay,
-                         avg_salary=avg_salary,
-                         
-                         # Payment stats
-                         total_payments=total_payments,
-                         pending_payments=pending_payments,
-                         failed_payments=failed_payments,
-                         
-                         # Current month/year
-                         current_month=current_month,
-                         current_year=current_year,
-                         
-                         # Recent activities
-                         recent_attendances=recent_attendances,
-                         recent_payments=recent_payments,
-                         
-                         # Department distribution
-                         dept_stats=dept_stats,
-                         
-                         # Monthly trends
-                         monthly_trends=monthly_trends)
+    return render_template('dashboard.html', **dashboard_context(now))
 
 if __name__ == '__main__':
     # Không cần db.create_all() tại đây, đã xử lý trong init_db.py
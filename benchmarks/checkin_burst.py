@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""Benchmark a morning check-in burst: direct writes vs batched write-behind
+
+    python benchmarks/checkin_burst.py --employees 500 --pool-size 5
+
+Every employee checks in at the same moment from its own thread through the
+real attendance.check_in view, once with ATTENDANCE_INGEST_MODE=direct and
+once with batched. The connection pool is capped at --pool-size to mimic a
+saturated MySQL pool. Reports throughput and p50/p99 request latency.
+Pass --database-url to benchmark against MySQL instead of a SQLite file.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from flask_login import LoginManager
+from sqlalchemy import insert
+from models import db, Department, Position, Employee, Attendance, DataVersion
+from services.ingest import ingestor
+
+
+def make_app(database_url, mode, pool_size):
+    from routes import attendance
+
+    app = Flask(__name__, root_path=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    app.config.update(
+        SQLALCHEMY_DATABASE_URI=database_url,
+        SQLALCHEMY_TRACK_MODIFICATIONS=False,
+        SQLALCHEMY_ENGINE_OPTIONS={'pool_size': pool_size, 'max_overflow': 0, 'pool_timeout': 60},
+        SECRET_KEY='benchmark',
+        LOGIN_DISABLED=True,
+        ATTENDANCE_INGEST_MODE=mode,
+        INGEST_BATCH_SIZE=200,
+        INGEST_BATCH_MS=50,
+        INGEST_QUEUE_SIZE=5000,
+        INGEST_ACK_TIMEOUT=60
+    )
+    db.init_app(app)
+    LoginManager(app).user_loader(lambda user_id: None)
+    app.register_blueprint(attendance.bp)
+    ingestor.init_app(app)
+    return app
+
+
+def seed(employees):
+    db.session.add(Department(name='Phòng 1'))
+    db.session.add(Position(title='Nhân viên', base_salary=10000000))
+    db.session.flush()
+    db.session.execute(insert(Employee), [{
+        'employee_id': f'NV{i:05d}',
+        'first_name': 'Nhân viên',
+        'last_name': str(i),
+        'email': f'nv{i}@example.com',
+        'department_id': 1,
+        'position_id': 1,
+        'hire_date': date(2020, 1, 1),
+        'salary': 10000000.0,
+        'is_active': True
+    } for i in range(employees)])
+    db.session.add(DataVersion(name='attendances', version=0))
+    db.session.commit()
+
+
+def burst(app, employee_ids):
+    latencies = []
+    errors = []
+    start = threading.Barrier(len(employee_ids))
+
+    def check_in(employee_id):
+        client = app.test_client()
+        start.wait()
+        began = time.perf_counter()
+        response = client.post('/attendance/check-in', data={'employee_id': employee_id})
+        latencies.append(time.perf_counter() - began)
+        if response.status_code != 302:
+            errors.append(response.status_code)
+
+    threads = [threading.Thread(target=check_in, args=(employee_id,)) for employee_id in employee_ids]
+    began = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - began, sorted(latencies), errors
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--employees', type=int, default=500)
+    parser.add_argument('--pool-size', type=int, default=5)
+    parser.add_argument('--database-url', default=None)
+    args = parser.parse_args()
+
+    print(f'{"mode":>8} {"seconds":>8} {"req/s":>8} {"p50 ms":>8} {"p99 ms":>8} {"rows":>6} {"errors":>6}')
+    for mode in ('direct', 'batched'):
+        database_url = args.database_url or 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'checkin_bench.db')
+        app = make_app(database_url, mode, args.pool_size)
+        with app.app_context():
+            db.drop_all()
+            db.create_all()
+            seed(args.employees)
+            employee_ids = [employee_id for employee_id, in db.session.query(Employee.id)]
+
+        elapsed, latencies, errors = burst(app, employee_ids)
+        with app.app_context():
+            rows = db.session.query(Attendance).count()
+        print(f'{mode:>8} {elapsed:>8.2f} {len(latencies) / elapsed:>8.0f} '
+              f'{percentile(latencies, 0.5) * 1000:>8.0f} {percentile(latencies, 0.99) * 1000:>8.0f} '
+              f'{rows:>6} {len(errors):>6}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""Benchmark the parallel payroll run against a synthetic dataset
+
+    python benchmarks/payroll_parallel.py --employees 50000 --workers 1 2 4 8
+
+Builds (or reuses) a SQLite database with the requested number of employees
+and one month of attendance, then times generate_payrolls_parallel for each
+worker count. Every run is rolled back so all runs compute the same payrolls;
+the script exits non-zero if any worker count creates different payrolls or
+salaries than the first.
+Pass --database-url to benchmark against MySQL instead.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from sqlalchemy import event, insert
+from models import db, Department, Position, Employee, Attendance, Payroll
+from services.payroll_engine import generate_payrolls_parallel
+
+YEAR, MONTH = 2024, 1
+
+
+def make_app(database_url):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    return app
+
+
+def use_savepoints(engine):
+    """Make SQLite honour savepoints, so rolling back a run also undoes its inserts
+
+    pysqlite only opens a transaction before DML, so the savepoint that
+    insert_payrolls opens first starts one of its own and commits on release.
+    """
+    @event.listens_for(engine, 'connect')
+    def _connect(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, 'begin')
+    def _begin(conn):
+        conn.exec_driver_sql('BEGIN')
+
+
+def seed(employees, departments):
+    random.seed(42)
+    db.session.execute(insert(Department), [{'name': f'Phòng {i + 1}'} for i in range(departments)])
+    db.session.add(Position(title='Nhân viên', base_salary=10000000))
+    db.session.flush()
+    department_ids = [department_id for department_id, in db.session.query(Department.id)]
+    position_id = db.session.query(Position.id).scalar()
+
+    batch = []
+    for i in range(employees):
+        batch.append({
+            'employee_id': f'NV{i:06d}',
+            'first_name': 'Nhân viên',
+            'last_name': str(i),
+            'email': f'nv{i}@example.com',
+            'department_id': department_ids[i % departments],
+            'position_id': position_id,
+            'hire_date': date(2020, 1, 1),
+            'salary': random.randint(8, 50) * 1000000.0,
+            'allowance': random.randint(0, 10) * 100000.0,
+            'is_active': True
+        })
+        if len(batch) == 5000:
+            db.session.execute(insert(Employee), batch)
+            batch = []
+    if batch:
+        db.session.execute(insert(Employee), batch)
+
+    working_days = [date(YEAR, MONTH, day) for day in range(1, 32) if date(YEAR, MONTH, day).weekday() < 5]
+    batch = []
+    for employee_id, in db.session.query(Employee.id):
+        for day in working_days:
+            status = random.choice(['present'] * 8 + ['absent', 'late'])
+            check_in = datetime.combine(day, datetime.min.time()) + timedelta(hours=8, minutes=random.randint(0, 30))
+            total_hours = round(random.uniform(6, 11), 2)
+            batch.append({
+                'employee_id': employee_id,
+                'date': day,
+                'check_in': check_in,
+                'check_out': check_in + timedelta(hours=total_hours),
+                'total_hours': total_hours,
+                'overtime_hours': round(max(total_hours - 8, 0), 2),
+                'status': status
+            })
+            if len(batch) == 20000:
+                db.session.execute(insert(Attendance), batch)
+                batch = []
+    if batch:
+        db.session.execute(insert(Attendance), batch)
+    db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--employees', type=int, default=50000)
+    parser.add_argument('--departments', type=int, default=40)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--database-url', default=None)
+    args = parser.parse_args()
+
+    database_url = args.database_url or 'sqlite:///' + os.path.abspath(f'payroll_bench_{args.employees}.db')
+    app = make_app(database_url)
+
+    with app.app_context():
+        if db.engine.dialect.name == 'sqlite':
+            use_savepoints(db.engine)
+        db.create_all()
+        if not db.session.query(Employee.id).first():
+            print(f'Seeding {args.employees} employees...')
+            started = time.perf_counter()
+            seed(args.employees, args.departments)
+            print(f'  done in {time.perf_counter() - started:.1f}s')
+
+        employee_ids = [employee_id for employee_id, in db.session.query(Employee.id)]
+        db.session.query(Payroll).filter_by(month=MONTH, year=YEAR).delete()
+        db.session.commit()
+
+        print(f'{"workers":>8} {"seconds":>9} {"payrolls":>9} {"total salary":>18}')
+        baseline = None
+        reference = None
+        mismatches = []
+        for workers in args.workers:
+            started = time.perf_counter()
+            created_keys, _, _ = generate_payrolls_parallel(MONTH, YEAR, employee_ids, workers)
+            elapsed = time.perf_counter() - started
+            salaries = dict(db.session.query(Payroll.employee_id, Payroll.total_salary).filter_by(month=MONTH, year=YEAR))
+            total_salary = sum(salaries.values())
+            db.session.rollback()
+
+            baseline = baseline or elapsed
+            print(f'{workers:>8} {elapsed:>9.2f} {len(created_keys):>9} {total_salary:>18,.2f}'
+                  f'  x{baseline / elapsed:.2f}')
+
+            # Every worker count must produce exactly the payrolls of the first run
+            if reference is None:
+                reference = (args.workers[0], sorted(created_keys), salaries)
+            elif sorted(created_keys) != reference[1]:
+                mismatches.append(f'{workers} workers created different payrolls than {reference[0]}')
+            elif salaries != reference[2]:
+                differing = sum(1 for employee_id, salary in salaries.items() if reference[2][employee_id] != salary)
+                mismatches.append(f'{workers} workers computed {differing} salaries differently than {reference[0]}')
+
+    if mismatches:
+        for mismatch in mismatches:
+            print(f'MISMATCH: {mismatch}', file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+"""unique attendance per employee and day
+
+Revision ID: 9a6e1d4c7b25
+Revises: 5f0c3b8e9a17
+Create Date: 2026-10-17 13:41:27.582913
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from datetime import date, datetime
+
+
+# revision identifiers, used by Alembic.
+revision = '9a6e1d4c7b25'
+down_revision = '5f0c3b8e9a17'
+branch_labels = None
+depends_on = None
+
+attendances = sa.table('attendances', sa.column('id'), sa.column('employee_id'), sa.column('date', sa.Date),
+                       sa.column('check_in', sa.DateTime), sa.column('check_out', sa.DateTime),
+                       sa.column('status'), sa.column('total_hours', sa.Float), sa.column('overtime_hours', sa.Float))
+employees = sa.table('employees', sa.column('id'), sa.column('department_id'))
+payrolls = sa.table('payrolls', sa.column('employee_id'), sa.column('year'), sa.column('month'), sa.column('status'))
+attendance_rollups = sa.table('attendance_rollups', sa.column('year'), sa.column('month'),
+                              sa.column('department_id'), sa.column('employee_id'), sa.column('records'),
+                              sa.column('present_days'), sa.column('absent_days'), sa.column('total_hours'),
+                              sa.column('overtime_hours'), sa.column('updated_at', sa.DateTime))
+payroll_dirty = sa.table('payroll_dirty', sa.column('employee_id'), sa.column('year'), sa.column('month'),
+                         sa.column('marked_at', sa.DateTime))
+data_versions = sa.table('data_versions', sa.column('name'), sa.column('version'))
+
+
+def _merged_values(keep, rows):
+    """Fields of the duplicates that the surviving (oldest) row lacks or that a later row corrected
+
+    Later rows are often manual corrections, so the latest row with a
+    check_out, or else with hours, supplies check_out and both hour fields.
+    """
+    values = {}
+    if keep.check_in is None:
+        check_ins = [row.check_in for row in rows if row.check_in is not None]
+        if check_ins:
+            values['check_in'] = min(check_ins)
+    source = next((row for row in reversed(rows) if row.check_out is not None), None)
+    if source is None:
+        source = next((row for row in reversed(rows) if row.total_hours), None)
+    if source is not None and source.id != keep.id:
+        values.update(check_out=source.check_out, total_hours=source.total_hours,
+                      overtime_hours=source.overtime_hours)
+    return values
+
+
+def remove_duplicates():
+    # Keep the oldest row of each employee and day: it is the one check-in
+    # and check-out kept updating through .first(). Later rows were races or
+    # manual corrections, so their check-out and hours are merged into it
+    # before they are deleted. Returns the (employee_id, year, month) keys
+    # whose rows changed.
+    conn = op.get_bind()
+    duplicated = sa.select(attendances.c.employee_id, attendances.c.date).group_by(
+        attendances.c.employee_id, attendances.c.date
+    ).having(sa.func.count(attendances.c.id) > 1).subquery()
+    rows = conn.execute(
+        sa.select(attendances).join(
+            duplicated, sa.and_(attendances.c.employee_id == duplicated.c.employee_id,
+                                attendances.c.date == duplicated.c.date)
+        ).order_by(attendances.c.id)
+    )
+    groups = {}
+    for row in rows:
+        groups.setdefault((row.employee_id, row.date), []).append(row)
+
+    extra_ids = []
+    for group in groups.values():
+        keep = group[0]
+        extra_ids.extend(row.id for row in group[1:])
+        values = _merged_values(keep, group)
+        if values:
+            conn.execute(attendances.update().where(attendances.c.id == keep.id).values(**values))
+    for i in range(0, len(extra_ids), 1000):
+        conn.execute(attendances.delete().where(attendances.c.id.in_(extra_ids[i:i + 1000])))
+    return sorted({(employee_id, day.year, day.month) for employee_id, day in groups})
+
+
+def _month_range(year, month):
+    start = date(year, month, 1)
+    return start, date(year + month // 12, month % 12 + 1, 1)
+
+
+def refresh_periods(keys):
+    # The rollups counted the deleted rows, and payrolls generated from them
+    # need recalculating, as services.changes.attendance_changed would do
+    conn = op.get_bind()
+    now = datetime.utcnow()
+    for employee_id, year, month in keys:
+        start, end = _month_range(year, month)
+        in_month = (attendances.c.employee_id == employee_id, attendances.c.date >= start,
+                    attendances.c.date < end)
+        rollup = (attendance_rollups.c.employee_id == employee_id, attendance_rollups.c.year == year,
+                  attendance_rollups.c.month == month)
+        totals = conn.execute(
+            sa.select(
+                sa.func.count(attendances.c.id),
+                sa.func.coalesce(sa.func.sum(sa.case((attendances.c.status == 'present', 1), else_=0)), 0),
+                sa.func.coalesce(sa.func.sum(sa.case((attendances.c.status == 'absent', 1), else_=0)), 0),
+                sa.func.coalesce(sa.func.sum(attendances.c.total_hours), 0),
+                sa.func.coalesce(sa.func.sum(attendances.c.overtime_hours), 0)
+            ).where(*in_month)
+        ).one()
+        department_id = conn.execute(
+            sa.select(employees.c.department_id).where(employees.c.id == employee_id)
+        ).scalar()
+        conn.execute(attendance_rollups.delete().where(*rollup))
+        conn.execute(attendance_rollups.insert().values(
+            year=year, month=month, department_id=department_id, employee_id=employee_id,
+            records=totals[0], present_days=totals[1], absent_days=totals[2],
+            total_hours=totals[3], overtime_hours=totals[4], updated_at=now
+        ))
+
+        unpaid = conn.execute(
+            sa.select(payrolls.c.employee_id).where(
+                payrolls.c.employee_id == employee_id, payrolls.c.year == year,
+                payrolls.c.month == month, payrolls.c.status != 'paid'
+            )
+        ).first()
+        if unpaid is None:
+            continue
+        dirty = (payroll_dirty.c.employee_id == employee_id, payroll_dirty.c.year == year,
+                 payroll_dirty.c.month == month)
+        if conn.execute(payroll_dirty.update().where(*dirty).values(marked_at=now)).rowcount == 0:
+            conn.execute(payroll_dirty.insert().values(employee_id=employee_id, year=year, month=month,
+                                                       marked_at=now))
+
+    if keys:
+        conn.execute(data_versions.update().where(data_versions.c.name == 'attendances')
+                     .values(version=data_versions.c.version + 1))
+
+
+def upgrade():
+    refresh_periods(remove_duplicates())
+    # The unique constraint's index also serves the employee/date lookups and
+    # the employee_id foreign key, so it is created before the old index goes
+    with op.batch_alter_table('attendances') as batch_op:
+        batch_op.create_unique_constraint('uq_attendances_employee_date', ['employee_id', 'date'])
+        batch_op.drop_index('ix_attendances_employee_date')
+
+
+def downgrade():
+    with op.batch_alter_table('attendances') as batch_op:
+        batch_op.create_index('ix_attendances_employee_date', ['employee_id', 'date'], unique=False)
+        batch_op.drop_constraint('uq_attendances_employee_date', type_='unique')
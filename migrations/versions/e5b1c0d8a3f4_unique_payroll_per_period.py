@@ -0,0 +1,94 @@
+"""unique payroll per employee and period
+
+Revision ID: e5b1c0d8a3f4
+Revises: d4c9e2a7f150
+Create Date: 2026-10-18 09:12:44.306218
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from datetime import datetime
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5b1c0d8a3f4'
+down_revision = 'd4c9e2a7f150'
+branch_labels = None
+depends_on = None
+
+PAYROLL_FIELDS = ('basic_salary', 'allowance', 'overtime_pay', 'bonus', 'deductions', 'total_salary', 'overtime_hours')
+
+payrolls = sa.table('payrolls', sa.column('id'), sa.column('employee_id'), sa.column('year'),
+                    sa.column('month'), sa.column('status'), *[sa.column(name) for name in PAYROLL_FIELDS])
+payments = sa.table('payments', sa.column('id'), sa.column('payroll_id'))
+payroll_rollups = sa.table('payroll_rollups', sa.column('employee_id'), sa.column('year'), sa.column('month'),
+                           sa.column('payrolls'), sa.column('paid_payrolls'),
+                           *[sa.column(name) for name in PAYROLL_FIELDS])
+deleted_rows = sa.table('deleted_rows', sa.column('table_name'), sa.column('row_id'), sa.column('deleted_at'))
+
+
+def _chunks(ids, size=1000):
+    for i in range(0, len(ids), size):
+        yield ids[i:i + size]
+
+
+def remove_duplicates():
+    # Concurrent generation jobs could create two payrolls for the same
+    # employee and period. Keep the paid one, else the one with payments,
+    # else the oldest; payments of the others move to it.
+    conn = op.get_bind()
+    duplicated = sa.select(payrolls.c.employee_id, payrolls.c.year, payrolls.c.month).group_by(
+        payrolls.c.employee_id, payrolls.c.year, payrolls.c.month
+    ).having(sa.func.count(payrolls.c.id) > 1).subquery()
+    paid_for = sa.select(payments.c.payroll_id).distinct().subquery()
+    rows = conn.execute(
+        sa.select(payrolls, paid_for.c.payroll_id.isnot(None).label('has_payments')).join(
+            duplicated, sa.and_(payrolls.c.employee_id == duplicated.c.employee_id,
+                                payrolls.c.year == duplicated.c.year,
+                                payrolls.c.month == duplicated.c.month)
+        ).outerjoin(paid_for, paid_for.c.payroll_id == payrolls.c.id).order_by(payrolls.c.id)
+    ).all()
+    if not rows:
+        return
+
+    groups = {}
+    for row in rows:
+        groups.setdefault((row.employee_id, row.year, row.month), []).append(row)
+
+    extra_ids = []
+    survivors = []
+    for group in groups.values():
+        keep = min(group, key=lambda row: (row.status != 'paid', not row.has_payments, row.id))
+        survivors.append(keep)
+        others = [row.id for row in group if row.id != keep.id]
+        extra_ids.extend(others)
+        for ids in _chunks(others):
+            conn.execute(payments.update().where(payments.c.payroll_id.in_(ids)).values(payroll_id=keep.id))
+
+    for ids in _chunks(extra_ids):
+        conn.execute(payrolls.delete().where(payrolls.c.id.in_(ids)))
+    now = datetime.utcnow()
+    conn.execute(deleted_rows.insert(), [{'table_name': 'payrolls', 'row_id': row_id, 'deleted_at': now}
+                                         for row_id in extra_ids])
+
+    # The monthly rollup summed the duplicates; each key now has one payroll
+    for keep in survivors:
+        conn.execute(
+            payroll_rollups.update().where(
+                payroll_rollups.c.employee_id == keep.employee_id,
+                payroll_rollups.c.year == keep.year,
+                payroll_rollups.c.month == keep.month
+            ).values(payrolls=1, paid_payrolls=int(keep.status == 'paid'),
+                     **{name: getattr(keep, name) or 0 for name in PAYROLL_FIELDS})
+        )
+
+
+def upgrade():
+    remove_duplicates()
+    with op.batch_alter_table('payrolls') as batch_op:
+        batch_op.create_unique_constraint('uq_payrolls_employee_period', ['employee_id', 'year', 'month'])
+
+
+def downgrade():
+    with op.batch_alter_table('payrolls') as batch_op:
+        batch_op.drop_constraint('uq_payrolls_employee_period', type_='unique')
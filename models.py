@@ -60,6 +60,10 @@ class Employee(db.Model):
     salary = db.Column(db.Float, nullable=False)
     allowance = db.Column(db.Float, default=0.0)
     is_active = db.Column(db.Boolean, default=True)
+    checkin_pin_hash = db.Column(db.String(255))  # QR self check-in PIN, unset disables self check-in
+    checkin_window = db.Column(db.Integer)  # last QR token window used for self check-in
+    checkin_failures = db.Column(db.Integer, nullable=False, default=0)  # wrong PINs since the last self check-in
+    checkin_retry_at = db.Column(db.DateTime)  # no PIN is checked before this after repeated failures
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
@@ -68,6 +72,10 @@ class Employee(db.Model):
     payrolls = db.relationship('Payroll', backref='employee', lazy=True)
     payments = db.relationship('Payment', backref='employee', lazy=True)
 
+    __table_args__ = (
+        db.Index('ix_employees_active_department', 'is_active', 'department_id'),
+    )
+
 class Attendance(db.Model):
     __tablename__ = 'attendances'
     id = db.Column(db.Integer, primary_key=True)
@@ -80,6 +88,13 @@ class Attendance(db.Model):
     status = db.Column(db.String(20), default='present')  # present, absent, late, half-day
     notes = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('employee_id', 'date', name='uq_attendances_employee_date'),
+        db.Index('ix_attendances_date', 'date'),
+        db.Index('ix_attendances_updated', 'updated_at', 'id'),
+    )
 
 class Payroll(db.Model):
     __tablename__ = 'payrolls'
@@ -102,6 +117,12 @@ class Payroll(db.Model):
 
     payments = db.relationship('Payment', backref='payroll', lazy=True)
 
+    __table_args__ = (
+        db.UniqueConstraint('employee_id', 'year', 'month', name='uq_payrolls_employee_period'),
+        db.Index('ix_payrolls_period_employee', 'year', 'month', 'employee_id'),
+        db.Index('ix_payrolls_updated', 'updated_at', 'id'),
+    )
+
 class Payment(db.Model):
     __tablename__ = 'payments'
     id = db.Column(db.Integer, primary_key=True)
@@ -112,5 +133,133 @@ class Payment(db.Model):
     payment_method = db.Column(db.String(50), default='bank_transfer')  # bank_transfer, cash, check
     reference_number = db.Column(db.String(100))
     status = db.Column(db.String(20), default='pending')  # pending, completed, failed
+    batch_id = db.Column(db.String(20))  # bank transfer batch file the payment was sent in
     notes = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_payments_batch_id', 'batch_id', 'id'),
+        db.Index('ix_payments_date_status', 'payment_date', 'status'),
+        db.Index('ix_payments_date_id', 'payment_date', 'id'),
+        db.Index('ix_payments_reference_number', 'reference_number'),
+        db.Index('ix_payments_payroll_id', 'payroll_id'),
+        db.Index('ix_payments_updated', 'updated_at', 'id'),
+    )
+
+class AttendanceRollup(db.Model):
+    __tablename__ = 'attendance_rollups'
+    id = db.Column(db.Integer, primary_key=True)
+    year = db.Column(db.Integer, nullable=False)
+    month = db.Column(db.Integer, nullable=False)
+    department_id = db.Column(db.Integer, db.ForeignKey('departments.id'))
+    employee_id = db.Column(db.Integer, db.ForeignKey('employees.id'), nullable=False)
+    records = db.Column(db.Integer, default=0)
+    present_days = db.Column(db.Integer, default=0)
+    absent_days = db.Column(db.Integer, default=0)
+    total_hours = db.Column(db.Float, default=0.0)
+    overtime_hours = db.Column(db.Float, default=0.0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('year', 'month', 'employee_id', name='uq_attendance_rollups_period_employee'),
+        db.Index('ix_attendance_rollups_period_department', 'year', 'month', 'department_id'),
+    )
+
+class PayrollRollup(db.Model):
+    __tablename__ = 'payroll_rollups'
+    id = db.Column(db.Integer, primary_key=True)
+    year = db.Column(db.Integer, nullable=False)
+    month = db.Column(db.Integer, nullable=False)
+    department_id = db.Column(db.Integer, db.ForeignKey('departments.id'))
+    employee_id = db.Column(db.Integer, db.ForeignKey('employees.id'), nullable=False)
+    payrolls = db.Column(db.Integer, default=0)
+    paid_payrolls = db.Column(db.Integer, default=0)
+    basic_salary = db.Column(db.Float, default=0.0)
+    allowance = db.Column(db.Float, default=0.0)
+    overtime_pay = db.Column(db.Float, default=0.0)
+    bonus = db.Column(db.Float, default=0.0)
+    deductions = db.Column(db.Float, default=0.0)
+    total_salary = db.Column(db.Float, default=0.0)
+    overtime_hours = db.Column(db.Float, default=0.0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('year', 'month', 'employee_id', name='uq_payroll_rollups_period_employee'),
+        db.Index('ix_payroll_rollups_period_department', 'year', 'month', 'department_id'),
+    )
+
+class PaymentRollup(db.Model):
+    __tablename__ = 'payment_rollups'
+    id = db.Column(db.Integer, primary_key=True)
+    year = db.Column(db.Integer, nullable=False)  # period of payment_date
+    month = db.Column(db.Integer, nullable=False)
+    department_id = db.Column(db.Integer, db.ForeignKey('departments.id'))
+    employee_id = db.Column(db.Integer, db.ForeignKey('employees.id'), nullable=False)
+    payments = db.Column(db.Integer, default=0)
+    total_amount = db.Column(db.Float, default=0.0)
+    completed_count = db.Column(db.Integer, default=0)
+    completed_amount = db.Column(db.Float, default=0.0)
+    pending_count = db.Column(db.Integer, default=0)
+    pending_amount = db.Column(db.Float, default=0.0)
+    failed_count = db.Column(db.Integer, default=0)
+    failed_amount = db.Column(db.Float, default=0.0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('year', 'month', 'employee_id', name='uq_payment_rollups_period_employee'),
+        db.Index('ix_payment_rollups_period_department', 'year', 'month', 'department_id'),
+    )
+
+class DataVersion(db.Model):
+    __tablename__ = 'data_versions'
+    name = db.Column(db.String(50), primary_key=True)  # table name
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+class PayrollDirty(db.Model):
+    __tablename__ = 'payroll_dirty'  # payrolls whose attendance changed after generation
+    id = db.Column(db.Integer, primary_key=True)
+    employee_id = db.Column(db.Integer, db.ForeignKey('employees.id'), nullable=False)
+    year = db.Column(db.Integer, nullable=False)
+    month = db.Column(db.Integer, nullable=False)
+    marked_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    version = db.Column(db.Integer, nullable=False, default=1)  # bumped on every re-mark
+
+    __table_args__ = (
+        db.UniqueConstraint('year', 'month', 'employee_id', name='uq_payroll_dirty_period_employee'),
+    )
+
+class Job(db.Model):
+    __tablename__ = 'jobs'
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)  # payroll.generate, payments.bulk_payment
+    status = db.Column(db.String(20), default='queued')  # queued, running, completed, failed
+    params = db.Column(db.Text, nullable=False)  # JSON, includes the work items
+    total = db.Column(db.Integer, default=0)
+    processed = db.Column(db.Integer, default=0)
+    failed = db.Column(db.Integer, default=0)
+    cursor = db.Column(db.Integer, default=0)  # index of the next unprocessed item
+    result = db.Column(db.Text)  # JSON counters reported by the handler
+    error = db.Column(db.Text)
+    created_by = db.Column(db.Integer, db.ForeignKey('users.id'))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    heartbeat_at = db.Column(db.DateTime)
+    claimed_at = db.Column(db.DateTime)  # when the current run picked the job up; the ETA baseline
+    claimed_processed = db.Column(db.Integer, default=0)  # processed when the current run picked it up
+    finished_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index('ix_jobs_status_heartbeat', 'status', 'heartbeat_at'),
+    )
+
+class DeletedRow(db.Model):
+    __tablename__ = 'deleted_rows'  # tombstones for the change feed
+    id = db.Column(db.Integer, primary_key=True)
+    table_name = db.Column(db.String(50), nullable=False)  # attendances, payrolls, payments
+    row_id = db.Column(db.Integer, nullable=False)
+    deleted_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_deleted_rows_table_deleted', 'table_name', 'deleted_at', 'id'),
+    )
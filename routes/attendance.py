@@ -1,67 +1,119 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, send_file
+from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, send_file, current_app, Response, stream_with_context, abort
 from flask_login import login_required, current_user
-from models import db, Attendance, Employee
+from models import db, Attendance, Department, Employee, Job
+from routes.jobs import job_accepted, current_user_id
+from services import attendance_import, attendance_writes, changes, ingest, jobs, pagination, qr_codes, qr_tokens, rollups
+from services.periods import month_range
 from datetime import datetime, date, timedelta
-from sqlalchemy import and_
-import qrcode
+from sqlalchemy import and_, or_, update
+from sqlalchemy.orm import joinedload
 from io import BytesIO
+import json
 
 bp = Blueprint('attendance', __name__, url_prefix='/attendance')
 
+def batched_ingest():
+    return current_app.config.get('ATTENDANCE_INGEST_MODE') == 'batched'
+
+def flash_ingest_result(result, success_message, already_done_message):
+    if result == ingest.RECORDED:
+        flash(success_message, 'success')
+    elif result == ingest.ALREADY_DONE:
+        flash(already_done_message, 'error')
+    elif result == ingest.NOT_FOUND:
+        flash('No check-in record found for today!', 'error')
+    elif result == ingest.BUSY:
+        flash('Attendance is busy; check the record before trying again.', 'warning')
+    else:
+        flash('Error recording attendance!', 'error')
+
 @bp.route('/')
 @login_required
 def index():
-    selected_date = request.args.get('date', date.today().strftime('%Y-%m-%d'))
-    selected_employee = request.args.get('employee_id', '')
-    
-    query = Attendance.query.join(Employee)
+    # With no date chosen the page shows today, as before
+    if not any(name in request.args for name in ('date', 'date_from', 'date_to')):
+        date_from = date_to = date.today().strftime('%Y-%m-%d')
+    else:
+        date_from = request.args.get('date_from', request.args.get('date', ''))
+        date_to = request.args.get('date_to', request.args.get('date', ''))
+    filters = {
+        'date_from': date_from,
+        'date_to': date_to,
+        'employee_id': request.args.get('employee_id', ''),
+        'department_id': request.args.get('department_id', ''),
+        'status': request.args.get('status', '')
+    }
     
-    if selected_date:
-        query = query.filter(Attendance.date == datetime.strptime(selected_date, '%Y-%m-%d').date())
+    query = Attendance.query.options(joinedload(Attendance.employee))
+    try:
+        if date_from:
+            query = query.filter(Attendance.date >= datetime.strptime(date_from, '%Y-%m-%d').date())
+        if date_to:
+            query = query.filter(Attendance.date <= datetime.strptime(date_to, '%Y-%m-%d').date())
+        if filters['employee_id']:
+            query = query.filter(Attendance.employee_id == int(filters['employee_id']))
+        if filters['department_id']:
+            query = query.join(Employee).filter(Employee.department_id == int(filters['department_id']))
+        if filters['status']:
+            query = query.filter(Attendance.status == filters['status'])
+        
+        # Newest day first; id breaks ties within a day
+        attendances, next_cursor = pagination.keyset_page(
+            query, [(Attendance.date, True), (Attendance.id, True)],
+            request.args.get('cursor'), pagination.page_size()
+        )
+    except ValueError as e:
+        if pagination.wants_json():
+            return jsonify({'success': False, 'message': str(e)}), 400
+        flash(f'Invalid filter: {str(e)}', 'error')
+        return redirect(url_for('attendance.index'))
     
-    if selected_employee:
-        query = query.filter(Attendance.employee_id == selected_employee)
+    if pagination.wants_json():
+        return jsonify({
+            'success': True,
+            'attendances': [{
+                'id': att.id,
+                'employee_id': att.employee_id,
+                'employee_name': f'{att.employee.first_name} {att.employee.last_name}',
+                'date': att.date.isoformat(),
+                'check_in': att.check_in.isoformat() if att.check_in else None,
+                'check_out': att.check_out.isoformat() if att.check_out else None,
+                'total_hours': att.total_hours,
+                'overtime_hours': att.overtime_hours,
+                'status': att.status,
+                'notes': att.notes
+            } for att in attendances],
+            'next_cursor': next_cursor
+        })
     
-    attendances = query.all()
-    employees = Employee.query.filter_by(is_active=True).all()
+    employees = Employee.query.filter_by(is_active=True).order_by(Employee.first_name, Employee.last_name).all()
+    departments = Department.query.order_by(Department.name).all()
     
     return render_template('attendance/index.html', 
                          attendances=attendances, 
                          employees=employees,
-                         selected_date=selected_date,
-                         selected_employee=selected_employee)
+                         departments=departments,
+                         filters=filters,
+                         next_cursor=next_cursor)
 
 @bp.route('/check-in', methods=['POST'])
 @login_required
 def check_in():
     employee_id = request.form.get('employee_id')
     checkin_date = request.args.get('date', date.today().isoformat())
+    checkin_day = datetime.strptime(checkin_date, '%Y-%m-%d').date()
     check_in_time = datetime.now()
     
-    # Check if already checked in today
-    existing_attendance = Attendance.query.filter(
-        and_(
-            Attendance.employee_id == employee_id,
-            Attendance.date == checkin_date
-        )
-    ).first()
+    if batched_ingest():
+        result = ingest.ingestor.submit('check_in', employee_id, checkin_day, check_in_time)
+        flash_ingest_result(result, 'Check-in recorded successfully!', 'Employee already checked in today!')
+        return redirect(url_for('attendance.index'))
     
-    if existing_attendance and existing_attendance.check_in:
+    if attendance_writes.check_in(employee_id, checkin_day, check_in_time) == attendance_writes.ALREADY_DONE:
         flash('Employee already checked in today!', 'error')
         return redirect(url_for('attendance.index'))
     
-    if existing_attendance:
-        existing_attendance.check_in = check_in_time
-        existing_attendance.status = 'present'
-    else:
-        attendance = Attendance(
-            employee_id=employee_id,
-            date=checkin_date,
-            check_in=check_in_time,
-            status='present'
-        )
-        db.session.add(attendance)
-    
+    changes.attendance_changed([rollups.period_key(employee_id, checkin_day)])
     db.session.commit()
     flash('Check-in recorded successfully!', 'success'+ checkin_date)
     return redirect(url_for('attendance.index'))
@@ -72,32 +124,22 @@ def check_out():
     employee_id = request.form.get('employee_id')
     check_out_time = datetime.now()
     
-    attendance = Attendance.query.filter(
-        and_(
-            Attendance.employee_id == employee_id,
-            Attendance.date == check_out_time.date()
-        )
-    ).first()
+    if batched_ingest():
+        result = ingest.ingestor.submit('check_out', employee_id, check_out_time.date(), check_out_time)
+        flash_ingest_result(result, 'Check-out recorded successfully!', 'Employee already checked out today!')
+        return redirect(url_for('attendance.index'))
     
-    if not attendance:
+    result = attendance_writes.check_out(employee_id, check_out_time.date(), check_out_time)
+    
+    if result == attendance_writes.NOT_FOUND:
         flash('No check-in record found for today!', 'error')
         return redirect(url_for('attendance.index'))
     
-    if attendance.check_out:
+    if result == attendance_writes.ALREADY_DONE:
         flash('Employee already checked out today!', 'error')
         return redirect(url_for('attendance.index'))
     
-    attendance.check_out = check_out_time
-    
-    # Calculate total hours and overtime
-    if attendance.check_in:
-        total_hours = (check_out_time - attendance.check_in).total_seconds() / 3600
-        attendance.total_hours = round(total_hours, 2)
-        
-        # Calculate overtime (assuming 8 hours workday)
-        if total_hours > 8:
-            attendance.overtime_hours = round(total_hours - 8, 2)
-    
+    changes.attendance_changed([rollups.period_key(employee_id, check_out_time.date())])
     db.session.commit()
     flash('Check-out recorded successfully!', 'success')
     return redirect(url_for('attendance.index'))
@@ -107,24 +149,30 @@ def check_out():
 def manual_entry():
     if request.method == 'POST':
         try:
-            attendance = Attendance(
-                employee_id=request.form.get('employee_id'),
-                date=datetime.strptime(request.form.get('date'), '%Y-%m-%d').date(),
-                check_in=datetime.strptime(request.form.get('check_in'), '%Y-%m-%d %H:%M') if request.form.get('check_in') else None,
-                check_out=datetime.strptime(request.form.get('check_out'), '%Y-%m-%d %H:%M') if request.form.get('check_out') else None,
-                status=request.form.get('status'),
-                notes=request.form.get('notes')
-            )
+            check_in = request.form.get('check_in')
+            check_out = request.form.get('check_out')
+            attendance = {
+                'employee_id': int(request.form.get('employee_id')),
+                'date': datetime.strptime(request.form.get('date'), '%Y-%m-%d').date(),
+                'check_in': datetime.strptime(check_in, '%Y-%m-%d %H:%M') if check_in else None,
+                'check_out': datetime.strptime(check_out, '%Y-%m-%d %H:%M') if check_out else None,
+                'status': request.form.get('status'),
+                'notes': request.form.get('notes'),
+                'total_hours': 0.0,
+                'overtime_hours': 0.0
+            }
             
             # Calculate hours if both check-in and check-out are provided
-            if attendance.check_in and attendance.check_out:
-                total_hours = (attendance.check_out - attendance.check_in).total_seconds() / 3600
-                attendance.total_hours = round(total_hours, 2)
+            if attendance['check_in'] and attendance['check_out']:
+                total_hours = (attendance['check_out'] - attendance['check_in']).total_seconds() / 3600
+                attendance['total_hours'] = round(total_hours, 2)
                 
                 if total_hours > 8:
-                    attendance.overtime_hours = round(total_hours - 8, 2)
+                    attendance['overtime_hours'] = round(total_hours - 8, 2)
             
-            db.session.add(attendance)
+            # Replaces the day's existing record instead of adding a second one
+            attendance_writes.save(attendance)
+            changes.attendance_changed([rollups.period_key(attendance['employee_id'], attendance['date'])])
             db.session.commit()
             
             flash('Attendance record created successfully!', 'success')
@@ -137,6 +185,47 @@ def manual_entry():
     employees = Employee.query.filter_by(is_active=True).all()
     return render_template('attendance/manual_entry.html', employees=employees)
 
+@bp.route('/import', methods=['GET', 'POST'])
+@login_required
+def import_file():
+    if request.method == 'POST':
+        upload = request.files.get('file')
+        if not upload or not upload.filename:
+            flash('Please choose a file to import!', 'error')
+            return redirect(url_for('attendance.import_file'))
+        try:
+            params = attendance_import.save_upload(upload)
+        except ValueError as e:
+            flash(str(e), 'error')
+            return redirect(url_for('attendance.import_file'))
+        
+        # The file is scanned and imported chunk by chunk in the background
+        job = jobs.enqueue('attendance.import', None, created_by=current_user_id(), **params)
+        return job_accepted(job, url_for('attendance.import_status', job_id=job.id),
+                            f'Import of {upload.filename} started')
+    
+    return render_template('attendance/import.html', job=None)
+
+def _import_job(job_id):
+    job = Job.query.get_or_404(job_id)
+    if job.kind != 'attendance.import':
+        abort(404)
+    return job
+
+@bp.route('/import/<int:job_id>')
+@login_required
+def import_status(job_id):
+    job = _import_job(job_id)
+    return render_template('attendance/import.html', job=job, progress=jobs.progress(job),
+                           filename=json.loads(job.params).get('filename'))
+
+@bp.route('/import/<int:job_id>/errors.csv')
+@login_required
+def import_errors(job_id):
+    directory = json.loads(_import_job(job_id).params)['directory']
+    return Response(stream_with_context(attendance_import.errors_csv(directory)), mimetype='text/csv',
+                    headers={'Content-Disposition': f'attachment; filename=import_errors_{job_id}.csv'})
+
 @bp.route('/report')
 @login_required
 def report():
@@ -145,16 +234,12 @@ def report():
     employee_id = request.args.get('employee_id', '')
     
     # Get attendance data for the month
-    start_date = date(int(year), int(month), 1)
-    if int(month) == 12:
-        end_date = date(int(year) + 1, 1, 1) - timedelta(days=1)
-    else:
-        end_date = date(int(year), int(month) + 1, 1) - timedelta(days=1)
+    start_date, end_date = month_range(int(year), int(month))
     
     query = Attendance.query.join(Employee).filter(
         and_(
             Attendance.date >= start_date,
-            Attendance.date <= end_date
+            Attendance.date < end_date
         )
     )
     
@@ -202,22 +287,129 @@ def api_attendance(employee_id):
         'status': att.status
     } for att in attendances])
 
+@bp.route('/api/events', methods=['POST'])
+@login_required
+def api_events():
+    """Apply a badge reader's buffered taps in one transaction
+    
+    Takes JSON [{"employee_id", "timestamp", "direction": "in"|"out"}, ...]
+    or {"events": [...]}; returns one result per event, in the same order.
+    """
+    payload = request.get_json(silent=True)
+    events = payload.get('events') if isinstance(payload, dict) else payload
+    if not isinstance(events, list) or not events:
+        return jsonify({'success': False, 'message': 'Expected a non-empty list of events'}), 400
+    if len(events) > ingest.MAX_BATCH_EVENTS:
+        return jsonify({'success': False, 'message': f'At most {ingest.MAX_BATCH_EVENTS} events per request'}), 400
+    
+    try:
+        results = ingest.record_events(events)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': str(e)}), 500
+    
+    return jsonify({
+        'success': True,
+        'recorded': sum(1 for result in results if result['result'] == ingest.RECORDED),
+        'results': results
+    })
+
 @bp.route('/qr')
 @login_required
 def qr_code():
-    today = date.today().isoformat()
-    # Tạo URL điểm danh, ví dụ: /attendance/checkin?date=yyyy-mm-dd
-    checkin_url = url_for('attendance.checkin', date=today, _external=True)
-    # Tạo mã QR
-    img = qrcode.make(checkin_url)
-    buf = BytesIO()
-    img.save(buf, format='PNG')
-    buf.seek(0)
-    return send_file(buf, mimetype='image/png')
+    # Mã QR trỏ tới trang tự chấm công, kèm token ký HMAC đổi mỗi QR_TOKEN_SECONDS giây
+    window = qr_tokens.current_window()
+    checkin_url = url_for('attendance.self_check_in', token=qr_tokens.issue(window), _external=True)
+    # Vẽ sẵn mã của lượt kế tiếp để màn hình không phải chờ khi token đổi
+    qr_codes.prerender(url_for('attendance.self_check_in', token=qr_tokens.issue(window + 1), _external=True))
+    
+    png, etag = qr_codes.qr_png(checkin_url)
+    # The image is valid until the token rotates
+    return send_file(BytesIO(png), mimetype='image/png', etag=etag, max_age=qr_tokens.seconds_left())
+
+FREE_PIN_FAILURES = 3  # wrong PINs allowed before the backoff starts
+MAX_PIN_BACKOFF_SECONDS = 3600
+
+
+def _claim_window(employee_id, window):
+    """Record a successful self check-in with the token of `window`; False if the employee already used it"""
+    result = db.session.execute(
+        update(Employee).where(
+            Employee.id == employee_id,
+            or_(Employee.checkin_window.is_(None), Employee.checkin_window < window)
+        # updated_at is kept: claiming a token is not an edit of the employee
+        ).values(checkin_window=window, checkin_failures=0, checkin_retry_at=None,
+                 updated_at=Employee.updated_at).execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+
+def _record_pin_failure(employee, now):
+    """Count a wrong PIN; past FREE_PIN_FAILURES each one doubles the wait before the next try"""
+    failures = employee.checkin_failures + 1
+    retry_at = None
+    if failures > FREE_PIN_FAILURES:
+        delay = current_app.config['QR_TOKEN_SECONDS'] * 2 ** (failures - FREE_PIN_FAILURES - 1)
+        retry_at = now + timedelta(seconds=min(delay, MAX_PIN_BACKOFF_SECONDS))
+    db.session.execute(
+        update(Employee).where(Employee.id == employee.id).values(
+            checkin_failures=Employee.checkin_failures + 1,
+            checkin_retry_at=retry_at, updated_at=Employee.updated_at
+        ).execution_options(synchronize_session=False)
+    )
+
+
+@bp.route('/self-check-in', methods=['GET', 'POST'])
+def self_check_in():
+    """Check-in from a phone that scanned the kiosk QR code with the employee's code and PIN
+    
+    The token is verified before anything touches the database or session,
+    so stale or forged scans are turned away at CPU cost only. A token is
+    used up only by a successful check-in, so it works once per employee.
+    Wrong PINs are counted per employee and, after FREE_PIN_FAILURES, back
+    off exponentially; guessing is slowed without letting a wrong PIN spend
+    a colleague's token. Unknown codes, wrong PINs, backoff and reused
+    tokens get the same answer, so codes cannot be enumerated.
+    """
+    token = request.values.get('token', '')
+    window = qr_tokens.token_window(token)
+    if window is None:
+        return render_template('attendance/self_check_in.html', token=None, result='expired'), 403
+    if request.method == 'GET':
+        return render_template('attendance/self_check_in.html', token=token, result=None)
+    
+    employee = Employee.query.filter_by(
+        employee_id=request.form.get('employee_code', '').strip(), is_active=True
+    ).first()
+    pin = request.form.get('pin', '')
+    check_in_time = datetime.now()
+    if employee is None or (employee.checkin_retry_at and check_in_time < employee.checkin_retry_at):
+        qr_tokens.check_pin(None, pin)
+        return render_template('attendance/self_check_in.html', token=token, result='invalid'), 403
+    if not qr_tokens.check_pin(employee.checkin_pin_hash, pin):
+        _record_pin_failure(employee, check_in_time)
+        db.session.commit()
+        return render_template('attendance/self_check_in.html', token=token, result='invalid'), 403
+    if not _claim_window(employee.id, window):
+        return render_template('attendance/self_check_in.html', token=token, result='invalid'), 403
+    
+    if batched_ingest():
+        db.session.commit()
+        result = ingest.ingestor.submit('check_in', employee.id, check_in_time.date(), check_in_time)
+    else:
+        result = attendance_writes.check_in(employee.id, check_in_time.date(), check_in_time)
+        if result == attendance_writes.RECORDED:
+            changes.attendance_changed([rollups.period_key(employee.id, check_in_time.date())])
+        db.session.commit()
+    
+    return render_template('attendance/self_check_in.html', token=token, result=result,
+                           employee=employee, check_in_time=check_in_time)
 
 @bp.route('/qr_screen')
 def qr_screen():
     now = datetime.now()
-    return render_template('attendance/qr_screen.html', now=now)
+    return render_template('attendance/qr_screen.html', now=now,
+                           refresh_seconds=current_app.config['QR_TOKEN_SECONDS'])
 
 
@@ -1,6 +1,9 @@
 from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify
 from flask_login import login_required, current_user
 from models import db, Employee, Department, Position
+from services import changes, pagination, qr_tokens
+from sqlalchemy import or_
+from sqlalchemy.orm import joinedload
 from datetime import datetime
 
 bp = Blueprint('employees', __name__, url_prefix='/employees')
@@ -8,8 +11,55 @@ bp = Blueprint('employees', __name__, url_prefix='/employees')
 @bp.route('/')
 @login_required
 def index():
-    employees = Employee.query.filter_by(is_active=True).all()
-    return render_template('employees/index.html', employees=employees)
+    filters = {
+        'q': request.args.get('q', '').strip(),
+        'department_id': request.args.get('department_id', ''),
+        'status': request.args.get('status', 'active')
+    }
+    
+    query = Employee.query.options(joinedload(Employee.department), joinedload(Employee.position))
+    try:
+        if filters['status'] in ('active', 'inactive'):
+            query = query.filter(Employee.is_active == (filters['status'] == 'active'))
+        if filters['department_id']:
+            query = query.filter(Employee.department_id == int(filters['department_id']))
+        if filters['q']:
+            # Prefix matches so the employee_id and email indexes can be used
+            query = query.filter(or_(*[
+                column.startswith(filters['q'], autoescape=True)
+                for column in (Employee.employee_id, Employee.first_name, Employee.last_name, Employee.email)
+            ]))
+        
+        employees, next_cursor = pagination.keyset_page(
+            query, [(Employee.id, False)], request.args.get('cursor'), pagination.page_size()
+        )
+    except ValueError as e:
+        if pagination.wants_json():
+            return jsonify({'success': False, 'message': str(e)}), 400
+        flash(f'Invalid filter: {str(e)}', 'error')
+        return redirect(url_for('employees.index'))
+    
+    if pagination.wants_json():
+        return jsonify({
+            'success': True,
+            'employees': [{
+                'id': employee.id,
+                'employee_id': employee.employee_id,
+                'first_name': employee.first_name,
+                'last_name': employee.last_name,
+                'email': employee.email,
+                'phone': employee.phone,
+                'department': employee.department.name if employee.department else None,
+                'position': employee.position.title if employee.position else None,
+                'salary': employee.salary,
+                'is_active': employee.is_active
+            } for employee in employees],
+            'next_cursor': next_cursor
+        })
+    
+    departments = Department.query.order_by(Department.name).all()
+    return render_template('employees/index.html', employees=employees, departments=departments,
+                           filters=filters, next_cursor=next_cursor)
 
 @bp.route('/create', methods=['GET', 'POST'])
 @login_required
@@ -31,6 +81,7 @@ def create():
             )
             
             db.session.add(employee)
+            changes.employees_changed()
             db.session.commit()
             
             flash('Employee created successfully!', 'success')
@@ -69,8 +120,14 @@ def edit(id):
             employee.salary = float(request.form.get('salary'))
             employee.allowance = float(request.form.get('allowance', 0))
             employee.is_active = 'is_active' in request.form
+            pin = request.form.get('checkin_pin', '').strip()
+            if pin:
+                if not pin.isdigit() or len(pin) < 4:
+                    raise ValueError('Check-in PIN must be at least 4 digits')
+                employee.checkin_pin_hash = qr_tokens.pin_hash(pin)
             employee.updated_at = datetime.utcnow()
             
+            changes.employees_changed()
             db.session.commit()
             
             flash('Employee updated successfully!', 'success')
@@ -91,6 +148,7 @@ def delete(id):
     
     try:
         employee.is_active = False
+        changes.employees_changed()
         db.session.commit()
         flash('Employee deleted successfully!', 'success')
     except Exception as e:
@@ -106,6 +164,7 @@ def delete_api(id):
     
     try:
         employee.is_active = False
+        changes.employees_changed()
         db.session.commit()
         return jsonify({'success': True, 'message': 'Employee deleted successfully'})
     except Exception as e:
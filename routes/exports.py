@@ -0,0 +1,53 @@
+from flask import Blueprint, Response, request, abort, stream_with_context
+from flask_login import login_required
+from services import exports
+from datetime import datetime, date, timedelta
+
+bp = Blueprint('exports', __name__, url_prefix='/exports')
+
+FORMATS = {
+    'csv': (exports.csv_stream, 'text/csv; charset=utf-8'),
+    'ndjson': (exports.ndjson_stream, 'application/x-ndjson; charset=utf-8')
+}
+
+def date_range():
+    start_date = request.args.get('start_date', (date.today() - timedelta(days=30)).strftime('%Y-%m-%d'))
+    end_date = request.args.get('end_date', date.today().strftime('%Y-%m-%d'))
+    try:
+        return (datetime.strptime(start_date, '%Y-%m-%d').date(),
+                datetime.strptime(end_date, '%Y-%m-%d').date())
+    except ValueError:
+        abort(400, 'Dates must use the YYYY-MM-DD format')
+
+def build_dataset(name):
+    start_date, end_date = date_range()
+    if name == 'attendance':
+        return exports.attendance_dataset(start_date, end_date)
+    if name == 'payments':
+        return exports.payments_dataset(start_date, end_date)
+    if name == 'payroll':
+        # Payroll is monthly: every period touched by the date range
+        return exports.payroll_dataset((start_date.year, start_date.month), (end_date.year, end_date.month))
+    abort(404)
+
+@bp.route('/<name>.<fmt>')
+@login_required
+def export(name, fmt):
+    """Stream attendance, payroll or payments over a date range as CSV or NDJSON
+    
+    Rows are fetched with a server-side cursor and sent in chunks as they are
+    produced, so memory stays constant whatever the range.
+    """
+    if fmt not in FORMATS:
+        abort(404)
+    dataset = build_dataset(name)
+    write, mimetype = FORMATS[fmt]
+    
+    return Response(
+        stream_with_context(write(dataset)),
+        mimetype=mimetype,
+        headers={
+            'Content-Disposition': f'attachment; filename={dataset.filename}.{fmt}',
+            'X-Accel-Buffering': 'no'
+        }
+    )
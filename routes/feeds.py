@@ -0,0 +1,35 @@
+from flask import Blueprint, current_app, request, jsonify, abort
+from flask_login import login_required
+from services import change_feed
+
+bp = Blueprint('feeds', __name__, url_prefix='/api/changes')
+
+MAX_PAGE_SIZE = 5000
+
+@bp.route('/<table_name>')
+@login_required
+def feed(table_name):
+    """Rows of attendances, payrolls or payments changed or deleted after `cursor`
+    
+    Clients start without a cursor, apply `changes` in order and keep the
+    returned `cursor` for the next call; `has_more` means the next page is
+    ready now.
+    """
+    if table_name not in change_feed.FEEDS:
+        abort(404)
+    
+    try:
+        limit = min(int(request.args.get('limit', current_app.config['CHANGE_FEED_PAGE_SIZE'])), MAX_PAGE_SIZE)
+        if limit < 1:
+            raise ValueError('limit must be positive')
+        changes, cursor, has_more = change_feed.changes_since(table_name, request.args.get('cursor'), limit)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    return jsonify({
+        'success': True,
+        'table': table_name,
+        'changes': changes,
+        'cursor': cursor,
+        'has_more': has_more
+    })
@@ -0,0 +1,35 @@
+from flask import Blueprint, redirect, flash, request, jsonify, url_for
+from flask_login import login_required, current_user
+from models import Job
+from services import jobs
+
+bp = Blueprint('jobs', __name__, url_prefix='/jobs')
+
+def job_accepted(job, redirect_url, message):
+    """Answer a job-starting POST with 202 + job id for API clients, or flash and redirect"""
+    if request.is_json or request.accept_mimetypes.best == 'application/json':
+        return jsonify({
+            'job_id': job.id,
+            'status_url': url_for('jobs.show', id=job.id)
+        }), 202
+    
+    flash(f'{message} (job #{job.id})', 'info')
+    return redirect(redirect_url)
+
+def active_job_id():
+    """The ?job= id while that job is still queued or running, so a finished job's page stops polling"""
+    job_id = request.args.get('job', type=int)
+    if job_id is None:
+        return None
+    job = Job.query.get(job_id)
+    return job_id if job and job.status in ('queued', 'running') else None
+
+def current_user_id():
+    user_id = current_user.get_id() if current_user else None
+    return int(user_id) if user_id else None
+
+@bp.route('/<int:id>')
+@login_required
+def show(id):
+    job = Job.query.get_or_404(id)
+    return jsonify(jobs.progress(job))
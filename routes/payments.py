@@ -1,11 +1,12 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, send_file
+from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, send_file, abort, Response, stream_with_context
 from flask_login import login_required, current_user
-from models import db, Payment, Payroll, Employee
+from models import db, Payment, Payroll, Employee, Department
+from routes.jobs import active_job_id, job_accepted, current_user_id
+from services import bank_batches, cache, changes, export_cache, exports, jobs, pagination, payment_stats, reconciliation, rollups, uploads
+from services import bulk_payments  # registers the bulk payment job handler
 from datetime import datetime, date, timedelta
-from sqlalchemy import and_
-import openpyxl
-from openpyxl.styles import Font, Alignment, PatternFill
-from io import BytesIO
+from sqlalchemy.orm import contains_eager, joinedload
+import os
 
 bp = Blueprint('payments', __name__, url_prefix='/payments')
 
@@ -19,33 +20,92 @@ def index():
     current_month = now.month
     current_year = now.year
     
-    # Get all payments
-    payments = Payment.query.join(Employee).join(Payroll).order_by(Payment.payment_date.desc()).all()
+    filters = {
+        'date_from': request.args.get('date_from', ''),
+        'date_to': request.args.get('date_to', ''),
+        'employee_id': request.args.get('employee_id', ''),
+        'department_id': request.args.get('department_id', ''),
+        'status': request.args.get('status', ''),
+        'payment_method': request.args.get('payment_method', '')
+    }
     
-    # Calculate statistics for current month
-    current_month_payments = Payment.query.join(Employee).join(Payroll).filter(
-        db.extract('month', Payment.payment_date) == current_month,
-        db.extract('year', Payment.payment_date) == current_year
-    ).all()
+    query = Payment.query.options(joinedload(Payment.employee), joinedload(Payment.payroll))
+    try:
+        if filters['date_from']:
+            query = query.filter(Payment.payment_date >= datetime.strptime(filters['date_from'], '%Y-%m-%d').date())
+        if filters['date_to']:
+            query = query.filter(Payment.payment_date <= datetime.strptime(filters['date_to'], '%Y-%m-%d').date())
+        if filters['employee_id']:
+            query = query.filter(Payment.employee_id == int(filters['employee_id']))
+        if filters['department_id']:
+            query = query.join(Employee).filter(Employee.department_id == int(filters['department_id']))
+        if filters['status']:
+            query = query.filter(Payment.status == filters['status'])
+        if filters['payment_method']:
+            query = query.filter(Payment.payment_method == filters['payment_method'])
+        
+        # Only one page of payments is loaded, newest first
+        payments, next_cursor = pagination.keyset_page(
+            query, [(Payment.payment_date, True), (Payment.id, True)],
+            request.args.get('cursor'), pagination.page_size()
+        )
+    except ValueError as e:
+        if pagination.wants_json():
+            return jsonify({'success': False, 'message': str(e)}), 400
+        flash(f'Invalid filter: {str(e)}', 'error')
+        return redirect(url_for('payments.index'))
     
-    total_monthly_payments = sum(p.amount for p in current_month_payments)
-    paid_count = len([p for p in current_month_payments if p.status == 'completed'])
-    pending_count = len([p for p in current_month_payments if p.status == 'pending'])
-    failed_count = len([p for p in current_month_payments if p.status == 'failed'])
+    if pagination.wants_json():
+        return jsonify({
+            'success': True,
+            'payments': [{
+                'id': payment.id,
+                'employee_id': payment.employee_id,
+                'employee_name': f'{payment.employee.first_name} {payment.employee.last_name}',
+                'payroll_id': payment.payroll_id,
+                'month': payment.payroll.month,
+                'year': payment.payroll.year,
+                'amount': payment.amount,
+                'payment_date': payment.payment_date.isoformat(),
+                'payment_method': payment.payment_method,
+                'reference_number': payment.reference_number,
+                'status': payment.status,
+                'notes': payment.notes
+            } for payment in payments],
+            'next_cursor': next_cursor
+        })
+    
+    # Statistics for current month come from the pre-summed monthly rollup
+    totals = rollups.payment_totals(current_year, current_month)
+    total_monthly_payments = totals['total_amount']
+    paid_count = totals['completed_count']
+    pending_count = totals['pending_count']
+    failed_count = totals['failed_count']
+    
+    employees = Employee.query.filter_by(is_active=True).order_by(Employee.first_name, Employee.last_name).all()
+    departments = Department.query.order_by(Department.name).all()
     
     return render_template('payments/index.html', 
                          payments=payments,
+                         next_cursor=next_cursor,
+                         filters=filters,
+                         employees=employees,
+                         departments=departments,
                          total_monthly_payments=total_monthly_payments,
                          paid_count=paid_count,
                          pending_count=pending_count,
                          failed_count=failed_count,
-                         current_month=current_month)
+                         current_month=current_month,
+                         job_id=active_job_id())
 
 @bp.route('/create', methods=['GET', 'POST'])
 @login_required
 def create():
     if request.method == 'POST':
         try:
+            existing = bulk_payments.active_payment(int(request.form.get('payroll_id')))
+            if existing:
+                raise ValueError(f'This payroll already has payment #{existing}')
             payment = Payment(
                 employee_id=request.form.get('employee_id'),
                 payroll_id=request.form.get('payroll_id'),
@@ -58,6 +118,7 @@ def create():
             )
             
             db.session.add(payment)
+            changes.payments_changed([rollups.period_key(payment.employee_id, payment.payment_date)])
             db.session.commit()
             
             flash('Payment created successfully!', 'success')
@@ -83,6 +144,7 @@ def edit(id):
     
     if request.method == 'POST':
         try:
+            old_key = rollups.period_key(payment.employee_id, payment.payment_date)
             payment.amount = float(request.form.get('amount'))
             payment.payment_date = datetime.strptime(request.form.get('payment_date'), '%Y-%m-%d').date()
             payment.payment_method = request.form.get('payment_method')
@@ -90,6 +152,7 @@ def edit(id):
             payment.status = request.form.get('status')
             payment.notes = request.form.get('notes')
             
+            changes.payments_changed([old_key, rollups.period_key(payment.employee_id, payment.payment_date)])
             db.session.commit()
             flash('Payment updated successfully!', 'success')
             return redirect(url_for('payments.show', id=payment.id))
@@ -109,6 +172,7 @@ def mark_as_paid(id):
     
     try:
         payment.status = 'completed'
+        changes.payments_changed([rollups.period_key(payment.employee_id, payment.payment_date)])
         db.session.commit()
         
         if request.headers.get('Content-Type') == 'application/json':
@@ -133,7 +197,10 @@ def delete(id):
     payment = Payment.query.get_or_404(id)
     
     try:
+        key = rollups.period_key(payment.employee_id, payment.payment_date)
         db.session.delete(payment)
+        changes.payments_changed([key])
+        changes.rows_deleted('payments', [id])
         db.session.commit()
         
         if request.method == 'DELETE':
@@ -192,53 +259,21 @@ def bulk_payment():
             flash('Please select at least one payroll!', 'error')
             return redirect(url_for('payments.bulk_payment'))
         
-        success_count = 0
-        error_count = 0
-        
-        for payroll_id in payroll_ids:
-            try:
-                payroll = Payroll.query.get(payroll_id)
-                if not payroll:
-                    continue
-                
-                # Check if payment already exists
-                existing_payment = Payment.query.filter_by(payroll_id=payroll_id).first()
-                if existing_payment:
-                    flash(f'Payment for payroll {payroll_id} already exists', 'warning')
-                    continue
-                
-                payment = Payment(
-                    employee_id=payroll.employee_id,
-                    payroll_id=payroll_id,
-                    amount=payroll.total_salary,
-                    payment_date=payment_date,
-                    payment_method=payment_method,
-                    status='completed'
-                )
-                
-                # Update payroll status
-                payroll.status = 'paid'
-                
-                db.session.add(payment)
-                success_count += 1
-                
-            except Exception as e:
-                error_count += 1
-                flash(f'Error processing payment for payroll {payroll_id}: {str(e)}', 'error')
-        
-        db.session.commit()
-        
-        if success_count > 0:
-            flash(f'Successfully processed {success_count} payments!', 'success')
-        if error_count > 0:
-            flash(f'Failed to process {error_count} payments!', 'error')
-        
-        return redirect(url_for('payments.index'))
+        # A payroll ticked twice is paid once; the job reports the rest in bulk
+        unique_ids = list(dict.fromkeys(int(payroll_id) for payroll_id in payroll_ids))
+        job = jobs.enqueue('payments.bulk_payment', unique_ids,
+                           created_by=current_user_id(),
+                           payment_date=payment_date.isoformat(),
+                           payment_method=payment_method)
+        message = f'Processing {len(unique_ids)} payment(s)'
+        if len(unique_ids) < len(payroll_ids):
+            message += f', {len(payroll_ids) - len(unique_ids)} duplicate selection(s) ignored'
+        return job_accepted(job, url_for('payments.index', job=job.id), message)
     
     # Get pending payrolls (approved or calculated status)
     pending_payrolls = Payroll.query.filter(
         Payroll.status.in_(['approved', 'calculated'])
-    ).join(Employee).order_by(Payroll.month.desc(), Payroll.year.desc()).all()
+    ).join(Employee).options(contains_eager(Payroll.employee)).order_by(Payroll.month.desc(), Payroll.year.desc()).all()
     
     return render_template('payments/bulk_payment.html', pending_payrolls=pending_payrolls)
 
@@ -248,102 +283,140 @@ def export_excel():
     start_date = request.args.get('start_date', (date.today() - timedelta(days=30)).strftime('%Y-%m-%d'))
     end_date = request.args.get('end_date', date.today().strftime('%Y-%m-%d'))
     
-    payments = Payment.query.join(Employee).join(Payroll).filter(
-        and_(
-            Payment.payment_date >= datetime.strptime(start_date, '%Y-%m-%d').date(),
-            Payment.payment_date <= datetime.strptime(end_date, '%Y-%m-%d').date()
-        )
-    ).order_by(Payment.payment_date.desc()).all()
-    
-    # Create Excel workbook
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = f"Payments {start_date} to {end_date}"
-    
-    # Headers
-    headers = ['Payment ID', 'Employee ID', 'Employee Name', 'Payroll Period', 'Amount', 
-               'Payment Date', 'Payment Method', 'Status', 'Reference Number']
-    
-    for col, header in enumerate(headers, 1):
-        cell = ws.cell(row=1, column=col, value=header)
-        cell.font = Font(bold=True)
-        cell.fill = PatternFill(start_color="CCCCCC", end_color="CCCCCC", fill_type="solid")
-        cell.alignment = Alignment(horizontal="center")
-    
-    # Data
-    for row, payment in enumerate(payments, 2):
-        ws.cell(row=row, column=1, value=payment.id)
-        ws.cell(row=row, column=2, value=payment.employee.employee_id)
-        ws.cell(row=row, column=3, value=f"{payment.employee.first_name} {payment.employee.last_name}")
-        ws.cell(row=row, column=4, value=f"{payment.payroll.month}/{payment.payroll.year}")
-        ws.cell(row=row, column=5, value=payment.amount)
-        ws.cell(row=row, column=6, value=payment.payment_date.strftime('%Y-%m-%d'))
-        ws.cell(row=row, column=7, value=payment.payment_method)
-        ws.cell(row=row, column=8, value=payment.status)
-        ws.cell(row=row, column=9, value=payment.reference_number or '')
-    
-    # Auto-adjust column widths
-    for column in ws.columns:
-        max_length = 0
-        column_letter = column[0].column_letter
-        for cell in column:
-            try:
-                if len(str(cell.value)) > max_length:
-                    max_length = len(str(cell.value))
-            except:
-                pass
-        adjusted_width = min(max_length + 2, 50)
-        ws.column_dimensions[column_letter].width = adjusted_width
-    
-    # Save to BytesIO
-    excel_file = BytesIO()
-    wb.save(excel_file)
-    excel_file.seek(0)
-    
+    dataset = exports.payments_dataset(datetime.strptime(start_date, '%Y-%m-%d').date(),
+                                       datetime.strptime(end_date, '%Y-%m-%d').date())
+    # Repeat downloads of unchanged data are served from disk, or as 304 via the ETag
+    path, etag = export_cache.cached_file(dataset, 'xlsx', exports.write_xlsx)
     return send_file(
-        excel_file,
-        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        path,
+        mimetype=exports.XLSX_MIMETYPE,
         as_attachment=True,
-        download_name=f'payments_{start_date}_to_{end_date}.xlsx'
+        download_name=f'{dataset.filename}.xlsx',
+        etag=etag,
+        max_age=0
     )
 
-@bp.route('/report')
+@bp.route('/reconcile', methods=['GET', 'POST'])
 @login_required
-def report():
-    month = request.args.get('month', datetime.now().month)
-    year = request.args.get('year', datetime.now().year)
+def reconcile():
+    """Settle payments from the bank's statement instead of one mark-paid click each"""
+    if request.method == 'POST':
+        upload = request.files.get('file')
+        if not upload or not upload.filename:
+            flash('Please choose a statement file!', 'error')
+            return redirect(url_for('payments.reconcile'))
+        try:
+            directory, path = uploads.save_upload(upload)
+            result = reconciliation.reconcile(directory, path)
+            db.session.commit()
+        except ValueError as e:
+            db.session.rollback()
+            flash(str(e), 'error')
+            return redirect(url_for('payments.reconcile'))
+        except Exception as e:
+            db.session.rollback()
+            flash(f'Error reconciling statement: {str(e)}', 'error')
+            return redirect(url_for('payments.reconcile'))
+        
+        upload_id = os.path.basename(directory)
+        if request.is_json or request.accept_mimetypes.best == 'application/json':
+            return jsonify(dict(result, success=True, upload_id=upload_id))
+        return render_template('payments/reconcile.html', result=result, upload_id=upload_id,
+                               filename=upload.filename)
     
-    payments = Payment.query.join(Employee).join(Payroll).filter(
-        and_(
-            Payroll.month == int(month),
-            Payroll.year == int(year)
-        )
-    ).all()
+    return render_template('payments/reconcile.html', result=None)
+
+@bp.route('/reconcile/<upload_id>/unmatched.csv')
+@login_required
+def reconcile_unmatched(upload_id):
+    directory = uploads.upload_directory(upload_id)
+    if directory is None:
+        abort(404)
+    return send_file(os.path.join(directory, reconciliation.UNMATCHED_FILE), mimetype='text/csv',
+                     as_attachment=True, download_name=f'unmatched_{upload_id[:8]}.csv')
+
+@bp.route('/batches', methods=['GET', 'POST'])
+@login_required
+def batches():
+    """Collect a period's pending bank transfers into a batch file for the bank"""
+    if request.method == 'POST':
+        try:
+            month = int(request.form['month'])
+            year = int(request.form['year'])
+            if not 1 <= month <= 12:
+                raise ValueError
+        except (KeyError, ValueError):
+            flash('Invalid pay period!', 'error')
+            return redirect(url_for('payments.batches'))
+        
+        try:
+            batch_id, count = bank_batches.create_batch(year, month)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            flash(f'Error creating batch: {str(e)}', 'error')
+            return redirect(url_for('payments.batches'))
+        
+        if request.is_json or request.accept_mimetypes.best == 'application/json':
+            return jsonify({'success': True, 'batch_id': batch_id if count else None, 'payments': count})
+        if count:
+            flash(f'Batch {batch_id} created with {count} payments!', 'success')
+        else:
+            flash(f'No pending bank transfers to batch for {month}/{year}!', 'warning')
+        return redirect(url_for('payments.batches'))
     
-    # Calculate summary statistics
-    total_payments = len(payments)
-    total_amount = sum([p.amount for p in payments])
-    completed_payments = len([p for p in payments if p.status == 'completed'])
-    pending_payments = len([p for p in payments if p.status == 'pending'])
+    return render_template('payments/batches.html',
+                         batches=bank_batches.recent_batches(),
+                         formats=bank_batches.FORMATS,
+                         current_month=datetime.now().month,
+                         current_year=datetime.now().year)
+
+@bp.route('/batches/<batch_id>.<fmt>')
+@login_required
+def batch_file(batch_id, fmt):
+    if fmt not in bank_batches.FORMATS or not bank_batches.batch_exists(batch_id):
+        abort(404)
+    return Response(
+        stream_with_context(bank_batches.batch_file(batch_id, fmt)),
+        mimetype='text/csv' if fmt == 'csv' else 'text/plain',
+        headers={
+            'Content-Disposition': f'attachment; filename=batch_{batch_id}.{fmt}',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+@bp.route('/report')
+@login_required
+def report():
+    month = request.args.get('month', datetime.now().month, type=int)
+    year = request.args.get('year', datetime.now().year, type=int)
+    criterion = payment_stats.in_pay_period(year, month)
     
-    # Payment method breakdown
-    payment_methods = {}
-    for payment in payments:
-        method = payment.payment_method
-        if method not in payment_methods:
-            payment_methods[method] = {'count': 0, 'amount': 0}
-        payment_methods[method]['count'] += 1
-        payment_methods[method]['amount'] += payment.amount
+    # Totals and the method breakdown come from one GROUP BY; rows only for the detail table
+    stats = cache.cached('payments.report', ('payments', 'payrolls', 'employees', 'departments'),
+                         (year, month), lambda: payment_stats.breakdown(criterion))
+    payments, next_cursor = [], None
+    if request.args.get('details'):
+        try:
+            payments, next_cursor = pagination.keyset_page(
+                Payment.query.options(joinedload(Payment.employee), joinedload(Payment.payroll)).filter(criterion),
+                [(Payment.id, False)], request.args.get('cursor'), pagination.page_size()
+            )
+        except ValueError as e:
+            flash(str(e), 'error')
+            return redirect(url_for('payments.report', month=month, year=year))
     
     return render_template('payments/report.html',
                          payments=payments,
+                         next_cursor=next_cursor,
                          month=month,
                          year=year,
-                         total_payments=total_payments,
-                         total_amount=total_amount,
-                         completed_payments=completed_payments,
-                         pending_payments=pending_payments,
-                         payment_methods=payment_methods)
+                         total_payments=stats['count'],
+                         total_amount=stats['amount'],
+                         completed_payments=payment_stats.status_total(stats, 'completed', 'count'),
+                         pending_payments=payment_stats.status_total(stats, 'pending', 'count'),
+                         failed_payments=payment_stats.status_total(stats, 'failed', 'count'),
+                         payment_methods=stats['by_method'])
 
 @bp.route('/api/payrolls/<int:employee_id>')
 @login_required
@@ -1,66 +1,15 @@
 from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, send_file
 from flask_login import login_required, current_user
-from models import db, Payroll, Employee, Attendance
+from models import db, Payroll, Employee
+from routes.jobs import active_job_id, job_accepted, current_user_id
+from services import changes, export_cache, exports, jobs, payroll_dirty, payroll_simulation, rollups
+from services.payroll_engine import recompute_dirty
 from datetime import datetime, date, timedelta
 from sqlalchemy import and_, func
 import calendar
-import openpyxl
-from openpyxl.styles import Font, Alignment, PatternFill
-from io import BytesIO
 
 bp = Blueprint('payroll', __name__, url_prefix='/payroll')
 
-def calculate_payroll(employee_id, month, year):
-    """Calculate payroll for an employee for a specific month"""
-    # Get employee
-    employee = Employee.query.get(employee_id)
-    if not employee:
-        return None
-    
-    # Get month boundaries
-    start_date = date(year, month, 1)
-    if month == 12:
-        end_date = date(year + 1, 1, 1) - timedelta(days=1)
-    else:
-        end_date = date(year, month + 1, 1) - timedelta(days=1)
-    
-    # Get attendance records for the month
-    attendances = Attendance.query.filter(
-        and_(
-            Attendance.employee_id == employee_id,
-            Attendance.date >= start_date,
-            Attendance.date <= end_date
-        )
-    ).all()
-    
-    # Calculate working days and hours
-    working_days = len([a for a in attendances if a.status == 'present'])
-    absent_days = len([a for a in attendances if a.status == 'absent'])
-    total_hours = sum([a.total_hours or 0 for a in attendances])
-    overtime_hours = sum([a.overtime_hours or 0 for a in attendances])
-    
-    # Calculate salary components
-    daily_salary = employee.salary / 22  # Assuming 22 working days per month
-    basic_salary = daily_salary * working_days
-    allowance = employee.allowance
-    overtime_pay = overtime_hours * (daily_salary / 8) * 1.5  # 1.5x for overtime
-    bonus = 0  # Can be configured
-    deductions = absent_days * daily_salary
-    
-    total_salary = basic_salary + allowance + overtime_pay + bonus - deductions
-    
-    return {
-        'basic_salary': round(basic_salary, 2),
-        'allowance': allowance,
-        'overtime_pay': round(overtime_pay, 2),
-        'bonus': bonus,
-        'deductions': round(deductions, 2),
-        'total_salary': round(total_salary, 2),
-        'working_days': working_days,
-        'absent_days': absent_days,
-        'overtime_hours': overtime_hours
-    }
-
 @bp.route('/')
 @login_required
 def index():
@@ -74,11 +23,12 @@ def index():
         )
     ).join(Employee).all()
     
-    # Calculate summary statistics
-    total_monthly_salary = sum([p.total_salary for p in payrolls])
-    paid_employees = len([p for p in payrolls if p.status == 'paid'])
-    total_overtime = sum([p.overtime_hours for p in payrolls])
-    total_allowances = sum([p.allowance for p in payrolls])
+    # Summary statistics come from the pre-summed monthly rollup
+    totals = rollups.payroll_totals(int(year), int(month))
+    total_monthly_salary = totals['total_salary']
+    paid_employees = totals['paid_payrolls']
+    total_overtime = totals['overtime_hours']
+    total_allowances = totals['allowance']
     
     return render_template('payroll/index.html', 
                          payrolls=payrolls, 
@@ -88,7 +38,9 @@ def index():
                          total_monthly_salary=total_monthly_salary,
                          paid_employees=paid_employees,
                          total_overtime=total_overtime,
-                         total_allowances=total_allowances)
+                         total_allowances=total_allowances,
+                         dirty_count=payroll_dirty.pending_count(),
+                         job_id=active_job_id())
 
 @bp.route('/generate', methods=['GET', 'POST'])
 @login_required
@@ -102,65 +54,70 @@ def generate():
             flash('Please select at least one employee!', 'error')
             return redirect(url_for('payroll.generate'))
         
-        success_count = 0
-        error_count = 0
-        
-        for employee_id in employee_ids:
-            try:
-                # Check if payroll already exists
-                existing_payroll = Payroll.query.filter(
-                    and_(
-                        Payroll.employee_id == employee_id,
-                        Payroll.month == month,
-                        Payroll.year == year
-                    )
-                ).first()
-                
-                if existing_payroll:
-                    flash(f'Payroll for employee {employee_id} already exists for {month}/{year}', 'warning')
-                    continue
-                
-                # Calculate payroll
-                payroll_data = calculate_payroll(employee_id, month, year)
-                if not payroll_data:
-                    error_count += 1
-                    continue
-                
-                # Create payroll record
-                payroll = Payroll(
-                    employee_id=employee_id,
-                    month=month,
-                    year=year,
-                    basic_salary=payroll_data['basic_salary'],
-                    allowance=payroll_data['allowance'],
-                    overtime_pay=payroll_data['overtime_pay'],
-                    bonus=payroll_data['bonus'],
-                    deductions=payroll_data['deductions'],
-                    total_salary=payroll_data['total_salary'],
-                    working_days=payroll_data['working_days'],
-                    absent_days=payroll_data['absent_days'],
-                    overtime_hours=payroll_data['overtime_hours']
-                )
-                
-                db.session.add(payroll)
-                success_count += 1
-                
-            except Exception as e:
-                error_count += 1
-                flash(f'Error generating payroll for employee {employee_id}: {str(e)}', 'error')
-        
-        db.session.commit()
-        
-        if success_count > 0:
-            flash(f'Successfully generated {success_count} payroll records!', 'success')
-        if error_count > 0:
-            flash(f'Failed to generate {error_count} payroll records!', 'error')
-        
-        return redirect(url_for('payroll.index', month=month, year=year))
+        # Large selections run in the background; the payroll page shows progress.
+        # An employee ticked twice is counted once.
+        unique_ids = sorted({int(employee_id) for employee_id in employee_ids})
+        job = jobs.enqueue('payroll.generate', unique_ids,
+                           created_by=current_user_id(), month=month, year=year)
+        message = f'Payroll generation for {len(unique_ids)} employee(s) started'
+        if len(unique_ids) < len(employee_ids):
+            message += f', {len(employee_ids) - len(unique_ids)} duplicate selection(s) ignored'
+        return job_accepted(job, url_for('payroll.index', month=month, year=year, job=job.id), message)
     
     employees = Employee.query.filter_by(is_active=True).all()
     return render_template('payroll/generate.html', employees=employees)
 
+@bp.route('/recompute', methods=['POST'])
+@login_required
+def recompute():
+    """Recalculate payrolls whose attendance changed after they were generated"""
+    try:
+        recomputed, skipped = recompute_dirty()
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Error recomputing payroll: {str(e)}', 'error')
+        return redirect(url_for('payroll.index'))
+    
+    flash(f'Recomputed {recomputed} payroll record(s)!', 'success')
+    if skipped:
+        flash(f'Skipped {skipped} payroll record(s) that were paid or deleted', 'warning')
+    
+    return redirect(url_for('payroll.index', month=request.form.get('month'), year=request.form.get('year')))
+
+@bp.route('/simulate', methods=['GET', 'POST'])
+@login_required
+def simulate():
+    """What-if totals for one or more parameter sets without writing payrolls
+    
+    GET takes a single scenario as query parameters; POST takes JSON
+    {"month", "year", "limit", "scenarios": [{...}, ...]}.
+    """
+    if request.method == 'POST':
+        payload = request.get_json(silent=True) or {}
+        scenarios = payload.get('scenarios') or [{}]
+    else:
+        payload = request.args.to_dict()
+        scenarios = [{name: value for name, value in payload.items() if name not in ('month', 'year', 'limit')}]
+    month = int(payload.get('month', datetime.now().month))
+    year = int(payload.get('year', datetime.now().year))
+    limit = int(payload.get('limit', 100))
+    
+    try:
+        if len(scenarios) > payroll_simulation.MAX_SCENARIOS:
+            raise ValueError(f'At most {payroll_simulation.MAX_SCENARIOS} scenarios per request')
+        params = [payroll_simulation.scenario_params(scenario) for scenario in scenarios]
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    inputs = payroll_simulation.load_inputs(month, year)
+    return jsonify({
+        'success': True,
+        'month': month,
+        'year': year,
+        'scenarios': [payroll_simulation.simulate(inputs, p, limit) for p in params]
+    })
+
 @bp.route('/<int:id>')
 @login_required
 def show(id):
@@ -183,6 +140,7 @@ def edit(id):
             payroll.status = request.form.get('status')
             payroll.updated_at = datetime.utcnow()
             
+            changes.payroll_changed([(payroll.employee_id, payroll.year, payroll.month)])
             db.session.commit()
             flash('Payroll updated successfully!', 'success')
             return redirect(url_for('payroll.show', id=payroll.id))
@@ -199,7 +157,10 @@ def delete(id):
     payroll = Payroll.query.get_or_404(id)
     
     try:
+        key = (payroll.employee_id, payroll.year, payroll.month)
         db.session.delete(payroll)
+        changes.payroll_changed([key])
+        changes.rows_deleted('payrolls', [id])
         db.session.commit()
         flash('Payroll deleted successfully!', 'success')
     except Exception as e:
@@ -214,65 +175,16 @@ def export_excel():
     month = request.args.get('month', datetime.now().month)
     year = request.args.get('year', datetime.now().year)
     
-    payrolls = Payroll.query.filter(
-        and_(
-            Payroll.month == int(month),
-            Payroll.year == int(year)
-        )
-    ).join(Employee).all()
-    
-    # Create Excel workbook
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = f"Payroll {month}_{year}"
-    
-    # Headers
-    headers = ['Employee ID', 'Name', 'Department', 'Basic Salary', 'Allowance', 
-               'Overtime Pay', 'Bonus', 'Deductions', 'Total Salary', 'Working Days', 'Status']
-    
-    for col, header in enumerate(headers, 1):
-        cell = ws.cell(row=1, column=col, value=header)
-        cell.font = Font(bold=True)
-        cell.fill = PatternFill(start_color="CCCCCC", end_color="CCCCCC", fill_type="solid")
-        cell.alignment = Alignment(horizontal="center")
-    
-    # Data
-    for row, payroll in enumerate(payrolls, 2):
-        ws.cell(row=row, column=1, value=payroll.employee.employee_id)
-        ws.cell(row=row, column=2, value=f"{payroll.employee.first_name} {payroll.employee.last_name}")
-        ws.cell(row=row, column=3, value=payroll.employee.department.name)
-        ws.cell(row=row, column=4, value=payroll.basic_salary)
-        ws.cell(row=row, column=5, value=payroll.allowance)
-        ws.cell(row=row, column=6, value=payroll.overtime_pay)
-        ws.cell(row=row, column=7, value=payroll.bonus)
-        ws.cell(row=row, column=8, value=payroll.deductions)
-        ws.cell(row=row, column=9, value=payroll.total_salary)
-        ws.cell(row=row, column=10, value=payroll.working_days)
-        ws.cell(row=row, column=11, value=payroll.status)
-    
-    # Auto-adjust column widths
-    for column in ws.columns:
-        max_length = 0
-        column_letter = column[0].column_letter
-        for cell in column:
-            try:
-                if len(str(cell.value)) > max_length:
-                    max_length = len(str(cell.value))
-            except:
-                pass
-        adjusted_width = min(max_length + 2, 50)
-        ws.column_dimensions[column_letter].width = adjusted_width
-    
-    # Save to BytesIO
-    excel_file = BytesIO()
-    wb.save(excel_file)
-    excel_file.seek(0)
-    
+    dataset = exports.payroll_dataset((int(year), int(month)))
+    # Repeat downloads of unchanged data are served from disk, or as 304 via the ETag
+    path, etag = export_cache.cached_file(dataset, 'xlsx', exports.write_xlsx)
     return send_file(
-        excel_file,
-        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        path,
+        mimetype=exports.XLSX_MIMETYPE,
         as_attachment=True,
-        download_name=f'payroll_{month}_{year}.xlsx'
+        download_name=f'{dataset.filename}.xlsx',
+        etag=etag,
+        max_age=0
     )
 
 @bp.route('/report')
@@ -288,14 +200,15 @@ def report():
         )
     ).join(Employee).all()
     
-    # Calculate summary statistics
-    total_employees = len(payrolls)
-    total_salary = sum([p.total_salary for p in payrolls])
-    total_basic_salary = sum([p.basic_salary for p in payrolls])
-    total_allowance = sum([p.allowance for p in payrolls])
-    total_overtime = sum([p.overtime_pay for p in payrolls])
-    total_bonus = sum([p.bonus for p in payrolls])
-    total_deductions = sum([p.deductions for p in payrolls])
+    # Summary statistics come from the pre-summed monthly rollup
+    totals = rollups.payroll_totals(int(year), int(month))
+    total_employees = totals['payrolls']
+    total_salary = totals['total_salary']
+    total_basic_salary = totals['basic_salary']
+    total_allowance = totals['allowance']
+    total_overtime = totals['overtime_pay']
+    total_bonus = totals['bonus']
+    total_deductions = totals['deductions']
     
     return render_template('payroll/report.html',
                          payrolls=payrolls,
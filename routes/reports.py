@@ -1,26 +1,40 @@
-from flask import Blueprint, render_template, request, jsonify, send_file
+from flask import Blueprint, render_template, request, jsonify, send_file, flash, redirect, url_for
 from flask_login import login_required
 from models import db, Employee, Attendance, Payroll, Payment, Department
+from services import cache, pagination, payment_stats, rollups, timeseries
+from services.periods import month_range
 from datetime import datetime, timedelta
+from sqlalchemy.orm import joinedload
 import io
 import csv
 import json
 
 bp = Blueprint('reports', __name__, url_prefix='/reports')
 
-@bp.route('/')
-@login_required
-def index():
-    """Reports dashboard"""
-    # Get basic statistics
+TREND_MONTHS = 6
+
+def _index_stats():
     total_employees = Employee.query.filter_by(is_active=True).count()
-    active_employees = Employee.query.filter_by(is_active=True).count()
     total_departments = Department.query.count()
     
     # Calculate average salary
     avg_salary = db.session.query(db.func.avg(Employee.salary)).scalar() or 0
     avg_salary = round(avg_salary / 1000000, 1)  # Convert to millions
     
+    return {
+        'total_employees': total_employees,
+        'active_employees': total_employees,
+        'total_departments': total_departments,
+        'avg_salary': avg_salary
+    }
+
+@bp.route('/')
+@login_required
+def index():
+    """Reports dashboard"""
+    # Get basic statistics
+    stats = cache.cached('reports.index', ('employees', 'departments'), (), _index_stats)
+    
     # Get current month/year
     now = datetime.now()
     current_month = now.strftime('%B %Y')
@@ -29,12 +43,9 @@ def index():
     recent_activities = []
     
     return render_template('reports/index.html',
-                         total_employees=total_employees,
-                         active_employees=active_employees,
-                         total_departments=total_departments,
-                         avg_salary=avg_salary,
                          current_month=current_month,
-                         recent_activities=recent_activities)
+                         recent_activities=recent_activities,
+                         **stats)
 
 @bp.route('/employee')
 @login_required
@@ -53,6 +64,33 @@ def employee_report():
                          departments=departments,
                          dept_stats=dept_stats)
 
+def _attendance_context(start_dt, end_dt):
+    rows = db.session.query(
+        Attendance.date, Attendance.check_in, Attendance.check_out,
+        Attendance.total_hours, Attendance.overtime_hours, Attendance.status, Attendance.notes,
+        Employee.first_name, Employee.last_name
+    ).join(Employee, Attendance.employee_id == Employee.id).filter(
+        Attendance.date >= start_dt,
+        Attendance.date <= end_dt
+    ).order_by(Attendance.date, Attendance.id).all()
+    
+    attendances = [{
+        'date': row.date,
+        'check_in': row.check_in,
+        'check_out': row.check_out,
+        'total_hours': row.total_hours,
+        'overtime_hours': row.overtime_hours,
+        'status': row.status,
+        'notes': row.notes,
+        'employee': {'first_name': row.first_name, 'last_name': row.last_name}
+    } for row in rows]
+    
+    return {
+        'attendances': attendances,
+        'total_hours': sum(a['total_hours'] or 0 for a in attendances),
+        'total_overtime': sum(a['overtime_hours'] or 0 for a in attendances)
+    }
+
 @bp.route('/attendance')
 @login_required
 def attendance_report():
@@ -61,101 +99,126 @@ def attendance_report():
     start_date = request.args.get('start_date', (datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d'))
     end_date = request.args.get('end_date', datetime.now().strftime('%Y-%m-%d'))
     
-    # Convert to datetime objects
-    start_dt = datetime.strptime(start_date, '%Y-%m-%d')
-    end_dt = datetime.strptime(end_date, '%Y-%m-%d')
+    # Convert to date objects
+    start_dt = datetime.strptime(start_date, '%Y-%m-%d').date()
+    end_dt = datetime.strptime(end_date, '%Y-%m-%d').date()
     
-    # Get attendance records
-    attendances = Attendance.query.filter(
-        Attendance.date >= start_dt,
-        Attendance.date <= end_dt
-    ).all()
+    context = cache.cached('reports.attendance', ('attendances', 'employees'), (start_dt, end_dt),
+                           lambda: _attendance_context(start_dt, end_dt))
     
     # Calculate statistics
     total_days = (end_dt - start_dt).days + 1
-    total_hours = sum(a.total_hours or 0 for a in attendances)
-    total_overtime = sum(a.overtime_hours or 0 for a in attendances)
     
     return render_template('reports/attendance.html',
-                         attendances=attendances,
                          start_date=start_date,
                          end_date=end_date,
                          total_days=total_days,
-                         total_hours=total_hours,
-                         total_overtime=total_overtime)
+                         **context)
+
+def _payroll_context(month, year):
+    rows = db.session.query(
+        Payroll.basic_salary, Payroll.overtime_hours, Payroll.overtime_pay, Payroll.allowance,
+        Payroll.deductions, Payroll.total_salary, Payroll.status,
+        Employee.first_name, Employee.last_name
+    ).join(Employee, Payroll.employee_id == Employee.id).filter(
+        Payroll.month == month,
+        Payroll.year == year
+    ).order_by(Payroll.id).all()
+    
+    payrolls = [{
+        'base_salary': row.basic_salary,
+        'overtime_hours': row.overtime_hours,
+        'overtime_pay': row.overtime_pay,
+        'allowances': row.allowance,
+        'deductions': row.deductions,
+        'net_salary': row.total_salary,
+        'status': row.status,
+        'employee': {'first_name': row.first_name, 'last_name': row.last_name}
+    } for row in rows]
+    
+    # Totals come from the pre-summed monthly rollup
+    totals = rollups.payroll_totals(year, month)
+    return {
+        'payrolls': payrolls,
+        'total_salary': totals['total_salary'],
+        'total_allowances': totals['allowance'],
+        'total_deductions': totals['deductions'],
+        'total_overtime': totals['overtime_pay']
+    }
 
 @bp.route('/payroll')
 @login_required
 def payroll_report():
     """Payroll report"""
-    month = request.args.get('month', datetime.now().month)
-    year = request.args.get('year', datetime.now().year)
-    
-    # Get payroll records for the month
-    payrolls = Payroll.query.filter_by(month=month, year=year).all()
+    month = int(request.args.get('month', datetime.now().month))
+    year = int(request.args.get('year', datetime.now().year))
     
-    # Calculate totals
-    total_salary = sum(p.net_salary for p in payrolls)
-    total_allowances = sum(p.allowances for p in payrolls)
-    total_deductions = sum(p.deductions for p in payrolls)
-    total_overtime = sum(p.overtime_pay for p in payrolls)
+    context = cache.cached('reports.payroll', ('payrolls', 'employees'), (month, year),
+                           lambda: _payroll_context(month, year))
     
     return render_template('reports/payroll.html',
-                         payrolls=payrolls,
                          month=month,
                          year=year,
-                         total_salary=total_salary,
-                         total_allowances=total_allowances,
-                         total_deductions=total_deductions,
-                         total_overtime=total_overtime)
+                         **context)
 
 @bp.route('/financial')
 @login_required
 def financial_report():
     """Financial report"""
-    month = request.args.get('month', datetime.now().month)
-    year = request.args.get('year', datetime.now().year)
+    month = request.args.get('month', datetime.now().month, type=int)
+    year = request.args.get('year', datetime.now().year, type=int)
+    criterion = payment_stats.in_month(year, month)
     
-    # Get payments for the month
-    payments = Payment.query.filter_by(month=month, year=year).all()
+    # Payments dated in the month, summed by status, method and department in SQL
+    stats, trend = cache.cached('reports.financial', ('payments', 'employees', 'departments'), (year, month),
+                                lambda: (payment_stats.breakdown(criterion),
+                                         payment_stats.monthly(year, month, TREND_MONTHS)))
     
-    # Calculate statistics
-    total_payments = sum(p.amount for p in payments if p.status == 'completed')
-    pending_payments = sum(p.amount for p in payments if p.status == 'pending')
-    failed_payments = sum(p.amount for p in payments if p.status == 'failed')
-    
-    # Payment method breakdown
-    method_stats = {}
-    for payment in payments:
-        method = payment.payment_method
-        if method not in method_stats:
-            method_stats[method] = 0
-        method_stats[method] += payment.amount
+    # Individual payments only when the detail table is opened
+    payments, next_cursor = [], None
+    if request.args.get('details'):
+        try:
+            payments, next_cursor = pagination.keyset_page(
+                Payment.query.options(joinedload(Payment.employee)).filter(criterion),
+                [(Payment.payment_date, False), (Payment.id, False)],
+                request.args.get('cursor'), pagination.page_size()
+            )
+        except ValueError as e:
+            flash(str(e), 'error')
+            return redirect(url_for('reports.financial_report', month=month, year=year))
     
     return render_template('reports/financial.html',
                          payments=payments,
+                         next_cursor=next_cursor,
                          month=month,
                          year=year,
-                         total_payments=total_payments,
-                         pending_payments=pending_payments,
-                         failed_payments=failed_payments,
-                         method_stats=method_stats)
+                         payment_count=stats['count'],
+                         total_payments=payment_stats.status_total(stats, 'completed'),
+                         pending_payments=payment_stats.status_total(stats, 'pending'),
+                         failed_payments=payment_stats.status_total(stats, 'failed'),
+                         method_stats={method: data['amount'] for method, data in stats['by_method'].items()},
+                         department_stats=stats['by_department'],
+                         trend=trend)
 
 @bp.route('/monthly')
 @login_required
 def monthly_report():
     """Monthly comprehensive report"""
-    month = request.args.get('month', datetime.now().month)
-    year = request.args.get('year', datetime.now().year)
+    month = int(request.args.get('month', datetime.now().month))
+    year = int(request.args.get('year', datetime.now().year))
+    start_date, end_date = month_range(year, month)
     
     # Get all data for the month
     employees = Employee.query.filter_by(is_active=True).all()
     attendances = Attendance.query.filter(
-        db.extract('month', Attendance.date) == month,
-        db.extract('year', Attendance.date) == year
+        Attendance.date >= start_date,
+        Attendance.date < end_date
     ).all()
     payrolls = Payroll.query.filter_by(month=month, year=year).all()
-    payments = Payment.query.filter_by(month=month, year=year).all()
+    payments = Payment.query.filter(
+        Payment.payment_date >= start_date,
+        Payment.payment_date < end_date
+    ).all()
     
     return render_template('reports/monthly.html',
                          month=month,
@@ -181,36 +244,35 @@ def export_pdf():
     # For now, return a placeholder
     return jsonify({'message': 'PDF export functionality will be implemented'})
 
-@bp.route('/api/stats')
-@login_required
-def api_stats():
-    """API endpoint for statistics"""
+def _api_stats(year, month):
     # Get basic stats
     total_employees = Employee.query.filter_by(is_active=True).count()
     total_departments = Department.query.count()
     
-    # Get monthly attendance data
-    now = datetime.now()
-    monthly_data = []
-    for i in range(12):
-        month = (now.month - i - 1) % 12 + 1
-        year = now.year - ((i + 1) // 12)
-        
-        attendances = Attendance.query.filter(
-            db.extract('month', Attendance.date) == month,
-            db.extract('year', Attendance.date) == year
-        ).count()
-        
-        monthly_data.append({
-            'month': month,
-            'year': year,
-            'attendance': attendances
-        })
-    
-    monthly_data.reverse()
-    
-    return jsonify({
+    # Attendance per month for the last year from one grouped query
+    monthly_data = [{
+        'month': point['month'],
+        'year': point['year'],
+        'attendance': point['count']
+    } for point in timeseries.monthly('attendances', year, month, 12)]
+    
+    return {
         'total_employees': total_employees,
         'total_departments': total_departments,
         'monthly_attendance': monthly_data
-    })
+    }
+
+@bp.route('/api/stats')
+@login_required
+def api_stats():
+    """API endpoint for statistics"""
+    now = datetime.now()
+    stats = cache.cached('reports.api_stats', ('attendances', 'employees', 'departments'),
+                         (now.year, now.month), lambda: _api_stats(now.year, now.month))
+    return jsonify(stats)
+
+@bp.route('/api/cache-stats')
+@login_required
+def api_cache_stats():
+    """Hit/miss/eviction counters of this worker's view cache"""
+    return jsonify(cache.stats())
@@ -0,0 +1,208 @@
+"""Bulk import of attendance dumps from fingerprint terminals (CSV or XLSX)
+
+An upload is saved under IMPORT_DIR and processed by the 'attendance.import'
+job. Planning streams the file once: an XLSX workbook is converted to CSV
+with openpyxl's read-only mode, and the byte offset of every
+IMPORT_CHUNK_ROWS-th record becomes a job item. Each item then seeks to its
+offset and reads, validates and upserts one chunk in its own commit, so
+neither step holds more than a chunk in memory and an interrupted import
+resumes at the first uncommitted chunk.
+
+Rows are validated against a cached employee-code map, hours and overtime
+are computed for the whole chunk with NumPy, and rejected rows are written
+to a per-chunk error file that errors_csv() stitches into one report.
+"""
+from flask import current_app
+from models import db, Employee
+from services import attendance_writes, cache, changes, jobs, rollups, uploads
+from services.uploads import cell, parse_date
+from datetime import datetime, time
+from itertools import islice
+from sqlalchemy import select
+import csv
+import io
+import os
+import numpy as np
+
+STATUSES = ('present', 'absent', 'late', 'half-day')
+HOURS_PER_DAY = 8
+
+# Accepted header names for each field
+COLUMNS = {
+    'employee_code': ('employee_id', 'employee_code', 'code'),
+    'date': ('date',),
+    'check_in': ('check_in', 'time_in', 'in'),
+    'check_out': ('check_out', 'time_out', 'out'),
+    'status': ('status',),
+    'notes': ('notes', 'note')
+}
+REQUIRED_COLUMNS = ('employee_code', 'date')
+ERROR_HEADERS = ['Row', 'Employee ID', 'Error']
+
+
+def save_upload(file_storage):
+    """Store an uploaded dump; returns job params for enqueue() or raises ValueError"""
+    directory, path = uploads.save_upload(file_storage)
+    return {'directory': directory, 'path': path, 'filename': file_storage.filename,
+            'chunk_rows': current_app.config['IMPORT_CHUNK_ROWS']}
+
+
+# Planning
+
+def _record_offsets(path, chunk_rows):
+    """Byte offset and row number of every chunk_rows-th record after the header
+
+    A newline inside a quoted field does not end a CSV record; records end
+    where the number of quotes seen so far is even. Blank lines are records
+    too, as csv.reader yields them, so the boundaries match the reader that
+    consumes each chunk.
+    """
+    items = []
+    with open(path, 'rb') as f:
+        quotes = 0
+        records = 0
+        offset = 0
+        for line in f:
+            if quotes == 0 and records > 0 and (records - 1) % chunk_rows == 0:
+                items.append([offset, records + 1])
+            offset += len(line)
+            quotes = (quotes + line.count(b'"')) % 2
+            if quotes == 0:
+                records += 1
+    return items
+
+
+@jobs.planner('attendance.import')
+def plan_import(params):
+    if params['path'].endswith('.xlsx'):
+        csv_path = os.path.join(params['directory'], 'staged.csv')
+        uploads.xlsx_to_csv(params['path'], csv_path)
+        params['path'] = csv_path
+
+    with open(params['path'], encoding='utf-8-sig', newline='') as f:
+        params['columns'] = uploads.column_map(next(csv.reader(f), []), COLUMNS, REQUIRED_COLUMNS)
+    return _record_offsets(params['path'], params['chunk_rows'])
+
+
+# Chunk processing
+
+def _employee_codes():
+    return dict(db.session.execute(select(Employee.employee_id, Employee.id)).all())
+
+
+def employee_codes():
+    """{employee code: id} of every employee, active or not, cached by data version"""
+    return cache.cached('employee_codes', ('employees',), None, _employee_codes)
+
+
+def _parse_time(value, day):
+    """A full 'YYYY-MM-DD HH:MM[:SS]' or a bare 'HH:MM[:SS]' on `day`"""
+    try:
+        if len(value) <= 8:
+            return datetime.combine(day, time.fromisoformat(value))
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f'Invalid time {value!r}')
+
+
+def _read_chunk(path, offset, chunk_rows):
+    with open(path, 'rb') as raw:
+        raw.seek(offset)
+        with io.TextIOWrapper(raw, encoding='utf-8-sig', newline='') as f:
+            return list(islice(csv.reader(f), chunk_rows))
+
+
+def import_chunk(params, offset, first_row):
+    """Validate and upsert one chunk; the caller commits. Returns (imported, errors)"""
+    columns = params['columns']
+    codes = employee_codes()
+    rows = []
+    errors = []
+
+    for row_number, row in enumerate(_read_chunk(params['path'], offset, params['chunk_rows']), first_row):
+        if not any(cell.strip() for cell in row):
+            continue
+        code = cell(row, columns, 'employee_code')
+        try:
+            employee_id = codes.get(code)
+            if employee_id is None:
+                raise ValueError('Unknown employee')
+            day = parse_date(cell(row, columns, 'date'))
+            check_in = cell(row, columns, 'check_in')
+            check_out = cell(row, columns, 'check_out')
+            check_in = _parse_time(check_in, day) if check_in else None
+            check_out = _parse_time(check_out, day) if check_out else None
+            status = cell(row, columns, 'status').lower() or ('present' if check_in else 'absent')
+            if status not in STATUSES:
+                raise ValueError(f'Unknown status {status}')
+        except ValueError as e:
+            errors.append((row_number, code, str(e)))
+            continue
+        rows.append((row_number, code, {
+            'employee_id': employee_id,
+            'date': day,
+            'check_in': check_in,
+            'check_out': check_out,
+            'status': status,
+            'notes': cell(row, columns, 'notes') or None
+        }))
+
+    # Hours for the whole chunk at once, as manual_entry computes them row by row
+    check_ins = np.array([values['check_in'] for _, _, values in rows], dtype='datetime64[s]')
+    check_outs = np.array([values['check_out'] for _, _, values in rows], dtype='datetime64[s]')
+    both = ~np.isnat(check_ins) & ~np.isnat(check_outs)
+    hours = np.zeros(len(rows))
+    hours[both] = (check_outs[both] - check_ins[both]).astype(np.float64) / 3600
+    total_hours = np.round(hours, 2)
+    overtime_hours = np.where(hours > HOURS_PER_DAY, np.round(hours - HOURS_PER_DAY, 2), 0.0)
+
+    latest = {}
+    for i, (row_number, code, values) in enumerate(rows):
+        if hours[i] < 0:
+            errors.append((row_number, code, 'check_out is before check_in'))
+            continue
+        values['total_hours'] = float(total_hours[i])
+        values['overtime_hours'] = float(overtime_hours[i])
+        # The last row of a day wins, as it would when imported one by one
+        latest[(values['employee_id'], values['date'])] = values
+
+    if latest:
+        attendance_writes.save_many(list(latest.values()))
+        changes.attendance_changed(sorted({rollups.period_key(employee_id, day) for employee_id, day in latest}))
+
+    _write_errors(params['directory'], first_row, sorted(errors))
+    return len(latest), len(errors)
+
+
+def _error_path(directory, first_row):
+    return os.path.join(directory, f'errors-{first_row:010d}.csv')
+
+
+def _write_errors(directory, first_row, errors):
+    # One file per chunk, rewritten if the chunk is retried after a crash
+    path = _error_path(directory, first_row)
+    if not errors:
+        if os.path.exists(path):
+            os.remove(path)
+        return
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        csv.writer(f).writerows(errors)
+
+
+def errors_csv(directory):
+    """Yield the error report of an import as CSV text"""
+    yield '﻿' + ','.join(ERROR_HEADERS) + '\r\n'
+    for name in sorted(os.listdir(directory)):
+        if name.startswith('errors-'):
+            with open(os.path.join(directory, name), encoding='utf-8') as f:
+                yield f.read()
+
+
+@jobs.handler('attendance.import', chunk_size=1)
+def import_attendance_job(params, items):
+    counters = {'imported': 0, 'invalid': 0}
+    for offset, first_row in items:
+        imported, invalid = import_chunk(params, offset, first_row)
+        counters['imported'] += imported
+        counters['invalid'] += invalid
+    return counters
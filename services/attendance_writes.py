@@ -0,0 +1,121 @@
+"""Atomic attendance writes keyed by the (employee_id, date) unique constraint
+
+A check-in is one INSERT ... ON DUPLICATE KEY UPDATE (MySQL) or INSERT ...
+ON CONFLICT DO UPDATE (SQLite, PostgreSQL) that only fills an empty
+check_in, a check-out is one conditional UPDATE with the hours computed in
+SQL, and a manual entry overwrites the day's row. None of them reads before
+writing, so concurrent taps can neither race nor create duplicate rows.
+"""
+from models import db, Attendance
+from services.sql import hours_between
+from sqlalchemy import case, func, select, update
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+
+# Results of a check-in or check-out
+RECORDED = 'recorded'
+ALREADY_DONE = 'already_done'
+NOT_FOUND = 'not_found'
+
+KEY_COLUMNS = ('employee_id', 'date')
+OVERWRITTEN_COLUMNS = ('check_in', 'check_out', 'status', 'notes', 'total_hours', 'overtime_hours', 'updated_at')
+INSERT_DIALECTS = {'mysql': mysql, 'sqlite': sqlite, 'postgresql': postgresql}
+
+
+def _dialect():
+    return db.session.get_bind().dialect.name
+
+
+def _insert(dialect, rows=None):
+    module = INSERT_DIALECTS.get(dialect)
+    if module is None:
+        raise NotImplementedError(f'Attendance upserts are not supported on {dialect}')
+    stmt = module.insert(Attendance.__table__)
+    return stmt if rows is None else stmt.values(rows)
+
+
+def check_in_statement(rows):
+    """Insert check-in rows; an existing row of the same day only gets an empty check_in filled"""
+    table = Attendance.__table__
+    dialect = _dialect()
+    stmt = _insert(dialect, rows)
+    if dialect == 'mysql':
+        # MySQL assigns left to right and later expressions see the new
+        # values, so status and updated_at have to be decided before
+        # check_in is filled.
+        # LAST_INSERT_ID(0) leaves lastrowid at 0 whenever an existing row was
+        # hit, which is how check_in() tells a repeated tap from an insert.
+        return stmt.on_duplicate_key_update([
+            ('status', case((table.c.check_in.is_(None), stmt.inserted.status), else_=table.c.status)),
+            ('updated_at', case((table.c.check_in.is_(None), stmt.inserted.updated_at), else_=table.c.updated_at)),
+            ('check_in', func.coalesce(table.c.check_in, stmt.inserted.check_in)),
+            ('id', table.c.id + func.last_insert_id(0))
+        ])
+    return stmt.on_conflict_do_update(
+        index_elements=KEY_COLUMNS,
+        set_={'status': stmt.excluded.status, 'check_in': stmt.excluded.check_in,
+              'updated_at': stmt.excluded.updated_at},
+        where=table.c.check_in.is_(None)
+    )
+
+
+def check_in(employee_id, day, at):
+    """Record a check-in in one statement; the caller commits"""
+    result = db.session.execute(check_in_statement([{
+        'employee_id': int(employee_id), 'date': day, 'check_in': at, 'status': 'present',
+        'total_hours': 0.0, 'overtime_hours': 0.0
+    }]))
+    if _dialect() == 'mysql':
+        # Affected rows: 1 inserted, 2 filled an empty check_in, 1 or 0
+        # (depending on CLIENT_FOUND_ROWS) left an existing check_in alone
+        recorded = result.rowcount == 2 or (result.rowcount == 1 and result.lastrowid)
+    else:
+        recorded = result.rowcount == 1
+    return RECORDED if recorded else ALREADY_DONE
+
+
+def check_out(employee_id, day, at):
+    """Record a check-out and its hours in one UPDATE; the caller commits"""
+    hours = hours_between(Attendance.check_in, at)
+    result = db.session.execute(
+        update(Attendance).where(
+            Attendance.employee_id == int(employee_id),
+            Attendance.date == day,
+            Attendance.check_out.is_(None)
+        ).values(
+            check_out=at,
+            total_hours=case((Attendance.check_in.is_(None), Attendance.total_hours),
+                             else_=func.round(hours, 2)),
+            # Overtime beyond an 8 hour workday
+            overtime_hours=case((hours > 8, func.round(hours - 8, 2)), else_=Attendance.overtime_hours)
+        ).execution_options(synchronize_session=False)
+    )
+    if result.rowcount:
+        return RECORDED
+    # Only a refused check-out pays for a read, to pick the right message
+    exists = db.session.execute(
+        select(Attendance.id).where(Attendance.employee_id == int(employee_id), Attendance.date == day)
+    ).first()
+    return ALREADY_DONE if exists else NOT_FOUND
+
+
+def save(values):
+    """Insert the day's row or overwrite its times, status and notes with `values`; the caller commits"""
+    return save_many([values])
+
+
+def save_many(rows):
+    """save() for many rows; rows must not repeat an (employee_id, date)
+
+    The rows are sent as parameter sets of one cached statement, which the
+    driver batches, instead of a multi-row VALUES clause compiled per call.
+    """
+    dialect = _dialect()
+    stmt = _insert(dialect)
+    if dialect == 'mysql':
+        stmt = stmt.on_duplicate_key_update([(name, stmt.inserted[name]) for name in OVERWRITTEN_COLUMNS])
+    else:
+        stmt = stmt.on_conflict_do_update(
+            index_elements=KEY_COLUMNS,
+            set_={name: stmt.excluded[name] for name in OVERWRITTEN_COLUMNS}
+        )
+    return db.session.execute(stmt, rows)
@@ -0,0 +1,165 @@
+"""Bank bulk-transfer files for the pending bank transfers of a pay period
+
+Creating a batch stamps a new batch_id on the period's pending, unbatched
+bank-transfer payments with one UPDATE, and gives the ones without a
+reference_number the reference 'PAY<id>' that the bank will echo back for
+reconciliation. The file is then streamed from the payments carrying that
+batch_id through a server-side cursor, in id order, with the control totals
+and a SHA-256 of every record written before the trailer accumulated as the
+lines go out. The file content depends only on the batch's rows, so every
+download of a batch is byte-for-byte identical and carries the same
+checksum.
+
+Fixed-width records are RECORD_LENGTH ASCII characters:
+    H  batch id (20), period YYYYMM (6)
+    D  sequence (6), employee code (20), name (40), amount in cents (15),
+       payment date YYYYMMDD (8), reference (30)
+    T  record count (6), total in cents (18), SHA-256 hex (64)
+"""
+from models import db, Employee, Payment, Payroll
+from services import changes
+from sqlalchemy import and_, cast, func, literal, select, update, String
+import csv
+import hashlib
+import io
+import unicodedata
+import uuid
+
+FORMATS = ('csv', 'txt')
+YIELD_PER = 1000
+RECORD_LENGTH = 120
+CSV_HEADERS = ['Seq', 'Employee ID', 'Name', 'Amount', 'Payment Date', 'Reference']
+
+
+def _pending_transfers(year, month):
+    return and_(
+        Payment.status == 'pending',
+        Payment.payment_method == 'bank_transfer',
+        Payment.batch_id.is_(None),
+        Payment.payroll_id.in_(select(Payroll.id).where(Payroll.year == year, Payroll.month == month))
+    )
+
+
+def create_batch(year, month):
+    """Stamp a new batch id on the period's pending bank transfers; the caller commits
+
+    Returns (batch_id, payments in the batch); the batch is empty when there
+    was nothing left to pay.
+    """
+    batch_id = f'{year:04d}{month:02d}-{uuid.uuid4().hex[:8].upper()}'
+    result = db.session.execute(
+        update(Payment).where(_pending_transfers(year, month)).values(
+            batch_id=batch_id,
+            reference_number=func.coalesce(Payment.reference_number, literal('PAY') + cast(Payment.id, String))
+        ).execution_options(synchronize_session=False)
+    )
+    # Amounts and statuses are unchanged, so no rollup needs refreshing
+    changes.payments_changed([])
+    return batch_id, result.rowcount
+
+
+def recent_batches(limit=20):
+    """Batch id, payment count and total of the latest batches"""
+    return db.session.execute(
+        select(Payment.batch_id, func.count(Payment.id).label('payments'),
+               func.sum(Payment.amount).label('total_amount'))
+        .where(Payment.batch_id.isnot(None))
+        .group_by(Payment.batch_id)
+        .order_by(Payment.batch_id.desc())
+        .limit(limit)
+    ).all()
+
+
+def batch_exists(batch_id):
+    return db.session.execute(select(Payment.id).where(Payment.batch_id == batch_id).limit(1)).first() is not None
+
+
+def _rows(batch_id):
+    stmt = select(
+        Employee.employee_id, Employee.first_name, Employee.last_name,
+        Payment.amount, Payment.payment_date, Payment.reference_number
+    ).join(Employee, Payment.employee_id == Employee.id).where(
+        Payment.batch_id == batch_id
+    ).order_by(Payment.id)
+    yield from db.session.execute(stmt.execution_options(yield_per=YIELD_PER))
+
+
+def _cents(amount):
+    return int(round(amount * 100))
+
+
+def _amount(cents):
+    return f'{cents // 100}.{cents % 100:02d}'
+
+
+def _ascii(text):
+    # Fixed-width bank formats take plain ASCII: "Đặng Thị Ánh" -> "Dang Thi Anh"
+    text = text.replace('Đ', 'D').replace('đ', 'd')
+    return unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode('ascii')
+
+
+def _field(value, width):
+    return _ascii(str(value or ''))[:width].ljust(width)
+
+
+def _fixed_header(batch_id):
+    return ('H' + _field(batch_id, 20) + batch_id[:6]).ljust(RECORD_LENGTH) + '\r\n'
+
+
+def _fixed_detail(seq, row, cents):
+    return ('D' + f'{seq:06d}' + _field(row.employee_id, 20)
+            + _field(f'{row.first_name} {row.last_name}', 40)
+            + f'{cents:015d}' + row.payment_date.strftime('%Y%m%d')
+            + _field(row.reference_number, 30)) + '\r\n'
+
+
+def _fixed_trailer(count, total, checksum):
+    return ('T' + f'{count:06d}' + f'{total:018d}' + checksum).ljust(RECORD_LENGTH) + '\r\n'
+
+
+def _csv_line(writer, buffer, values):
+    buffer.seek(0)
+    buffer.truncate()
+    writer.writerow(values)
+    return buffer.getvalue()
+
+
+def batch_file(batch_id, fmt):
+    """Yield the batch file as text chunks of up to YIELD_PER records
+
+    The last record carries the record count, the total in cents and the
+    SHA-256 of everything before it.
+    """
+    digest = hashlib.sha256()
+    count = total = 0
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\r\n')
+
+    if fmt == 'txt':
+        header = _fixed_header(batch_id)
+    else:
+        header = _csv_line(writer, buffer, CSV_HEADERS)
+    digest.update(header.encode('utf-8'))
+    chunk = [header]
+
+    for row in _rows(batch_id):
+        cents = _cents(row.amount)
+        count += 1
+        total += cents
+        if fmt == 'txt':
+            line = _fixed_detail(count, row, cents)
+        else:
+            line = _csv_line(writer, buffer, [count, row.employee_id, f'{row.first_name} {row.last_name}',
+                                              _amount(cents), row.payment_date.isoformat(), row.reference_number])
+        digest.update(line.encode('utf-8'))
+        chunk.append(line)
+        if len(chunk) >= YIELD_PER:
+            yield ''.join(chunk)
+            chunk = []
+
+    checksum = digest.hexdigest()
+    if fmt == 'txt':
+        chunk.append(_fixed_trailer(count, total, checksum))
+    else:
+        chunk.append(_csv_line(writer, buffer, ['TOTAL', count, '', _amount(total), '', checksum]))
+    yield ''.join(chunk)
@@ -0,0 +1,91 @@
+from models import db, Payment, Payroll
+from services import changes, jobs
+from services.rollups import period_key
+from datetime import date
+from sqlalchemy import insert, select, update
+
+IN_CHUNK = 1000
+
+
+def _chunks(ids, size=IN_CHUNK):
+    ids = sorted(ids)
+    for i in range(0, len(ids), size):
+        yield ids[i:i + size]
+
+
+def create_payments(payroll_ids, payment_date, payment_method):
+    """Create completed payments for the given payrolls and mark them paid; the caller commits
+
+    Each chunk of ids costs one SELECT ... FOR UPDATE of the payrolls, one
+    SELECT of their existing payments, one conditional UPDATE and one
+    multi-row INSERT, however many rows it has. The row locks make a second
+    bulk job or a single payment for the same payrolls wait for this
+    transaction and then see them paid, so no payroll is paid twice.
+    Returns counts plus the ids that were skipped (already paid) or missing.
+    """
+    skipped_ids = []
+    missing_ids = []
+    payroll_keys = []
+    for ids in _chunks(set(payroll_ids)):
+        payrolls = db.session.execute(
+            select(Payroll.id, Payroll.employee_id, Payroll.total_salary, Payroll.year, Payroll.month,
+                   Payroll.status)
+            .where(Payroll.id.in_(ids)).with_for_update()
+        ).all()
+        paid = set(db.session.execute(
+            select(Payment.payroll_id).where(Payment.payroll_id.in_(ids))
+        ).scalars())
+        paid.update(payroll.id for payroll in payrolls if payroll.status == 'paid')
+
+        found = {payroll.id for payroll in payrolls}
+        missing_ids += [payroll_id for payroll_id in ids if payroll_id not in found]
+        skipped_ids += sorted(found & paid)
+        payable = [payroll for payroll in payrolls if payroll.id not in paid]
+        if not payable:
+            continue
+
+        result = db.session.execute(
+            update(Payroll).where(Payroll.id.in_([payroll.id for payroll in payable]), Payroll.status != 'paid')
+            .values(status='paid').execution_options(synchronize_session=False)
+        )
+        if result.rowcount != len(payable):
+            # The FOR UPDATE locks rule this out; refuse rather than pay a payroll twice
+            raise RuntimeError('Payrolls were paid by a concurrent transaction, retry the payment')
+        db.session.execute(insert(Payment), [{
+            'employee_id': payroll.employee_id,
+            'payroll_id': payroll.id,
+            'amount': payroll.total_salary,
+            'payment_date': payment_date,
+            'payment_method': payment_method,
+            'status': 'completed'
+        } for payroll in payable])
+        payroll_keys += [(payroll.employee_id, payroll.year, payroll.month) for payroll in payable]
+
+    changes.payroll_changed(payroll_keys)
+    changes.payments_changed([period_key(employee_id, payment_date) for employee_id, _, _ in payroll_keys])
+    return {
+        'created': len(payroll_keys),
+        'skipped': len(skipped_ids),
+        'missing': len(missing_ids),
+        'skipped_ids': skipped_ids,
+        'missing_ids': missing_ids
+    }
+
+
+def active_payment(payroll_id):
+    """Lock a payroll as create_payments does; returns its pending or completed payment id, if any
+
+    A single payment checks this in its own transaction, so it waits for a
+    bulk job paying the same payroll and then sees that job's payment.
+    """
+    db.session.execute(select(Payroll.id).where(Payroll.id == payroll_id).with_for_update())
+    return db.session.execute(
+        select(Payment.id).where(Payment.payroll_id == payroll_id, Payment.status.in_(('pending', 'completed')))
+    ).scalar()
+
+
+@jobs.handler('payments.bulk_payment')
+def bulk_payment_job(params, payroll_ids):
+    counters = create_payments(payroll_ids, date.fromisoformat(params['payment_date']), params['payment_method'])
+    counters['failed'] = counters.pop('missing')
+    return counters
@@ -0,0 +1,226 @@
+from flask import current_app
+from models import db, DataVersion
+from sqlalchemy import event, insert, select, update
+from sqlalchemy.orm import Session
+from collections import OrderedDict
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+import time
+
+_MISSING = object()
+PENDING_BUMPS = 'pending_version_bumps'
+
+
+class MemoryBackend:
+    """In-process LRU cache, one per worker"""
+
+    def __init__(self, max_entries=512):
+        self.max_entries = max_entries
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.stats['misses'] += 1
+                return _MISSING
+
+            expires_at, value = entry
+            if expires_at < time.time():
+                del self._entries[key]
+                self.stats['evictions'] += 1
+                self.stats['misses'] += 1
+                return _MISSING
+
+            self._entries.move_to_end(key)
+            self.stats['hits'] += 1
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.time() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats['evictions'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class FileBackend:
+    """Pickled entries in a local directory shared by every worker on the host"""
+
+    PRUNE_EVERY = 32
+
+    def __init__(self, directory, max_entries=2048):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+        self._writes = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode('utf-8')).hexdigest() + '.cache')
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            return
+        with self._lock:
+            self.stats['evictions'] += 1
+
+    def _count(self, stat):
+        with self._lock:
+            self.stats[stat] += 1
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                expires_at, stored_key, value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            self._count('misses')
+            return _MISSING
+
+        if stored_key != key:
+            self._count('misses')
+            return _MISSING
+
+        if expires_at < time.time():
+            self._remove(path)
+            self._count('misses')
+            return _MISSING
+
+        # Touch the file so pruning evicts the least recently used entries first
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self._count('hits')
+        return value
+
+    def set(self, key, value, ttl):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump((time.time() + ttl, key, value), f, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self._path(key))
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+
+        with self._lock:
+            self._writes += 1
+            prune = self._writes % self.PRUNE_EVERY == 0
+        if prune:
+            self._prune()
+
+    def _prune(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.cache'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                entries.append((os.path.getmtime(path), path))
+            except OSError:
+                continue
+
+        if len(entries) <= self.max_entries:
+            return
+        entries.sort()
+        for _, path in entries[:len(entries) - self.max_entries]:
+            self._remove(path)
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            if name.endswith('.cache'):
+                self._remove(os.path.join(self.directory, name))
+
+
+def init_cache(app):
+    """Create the view cache backend configured by CACHE_BACKEND"""
+    if app.config.get('CACHE_BACKEND') == 'file':
+        backend = FileBackend(app.config['CACHE_DIR'], app.config['CACHE_MAX_ENTRIES'])
+    else:
+        backend = MemoryBackend(app.config['CACHE_MAX_ENTRIES'])
+    app.extensions['view_cache'] = backend
+    return backend
+
+
+def get_backend():
+    return current_app.extensions['view_cache']
+
+
+def bump(*tables):
+    """Invalidate cached views built from `tables` once the caller's transaction commits
+
+    The bump is only noted on the session; _apply_bumps writes it after the
+    commit in a short transaction of its own, so the few hot data_versions
+    rows are not locked for the length of every write, and the bumps of one
+    transaction (one ingest flush, say) coalesce into one UPDATE.
+    """
+    session = db.session()
+    if not session.in_transaction():
+        # Start the transaction the bump belongs to, so a rollback can drop it
+        session.begin()
+    session.info.setdefault(PENDING_BUMPS, set()).update(tables)
+
+
+@event.listens_for(Session, 'after_commit')
+def _note_commit(session):
+    session.info['bump_committed'] = True
+
+
+@event.listens_for(Session, 'after_transaction_end')
+def _apply_bumps(session, transaction):
+    # after_commit also fires for savepoints, so a commit only counts once
+    # the outermost transaction ends; a rolled back transaction drops its bumps
+    committed = session.info.pop('bump_committed', False)
+    if transaction.nested or transaction.parent is not None:
+        return
+    tables = session.info.pop(PENDING_BUMPS, None)
+    if not tables or not committed:
+        return
+    tables = sorted(tables)
+    table = DataVersion.__table__
+    with session.get_bind().begin() as conn:
+        updated = conn.execute(
+            update(table).where(table.c.name.in_(tables)).values(version=table.c.version + 1)
+        ).rowcount
+        if updated < len(tables):
+            existing = set(conn.execute(select(table.c.name).where(table.c.name.in_(tables))).scalars())
+            conn.execute(insert(table), [{'name': name, 'version': 1} for name in tables if name not in existing])
+
+
+def versions(tables):
+    rows = dict(db.session.query(DataVersion.name, DataVersion.version).filter(DataVersion.name.in_(tables)))
+    return [(name, rows.get(name, 0)) for name in sorted(tables)]
+
+
+def cached(name, tables, params, build, ttl=None):
+    """Return build() from the cache, keyed by view name, params and table data versions"""
+    backend = get_backend()
+    version_key = ','.join(f'{table}={version}' for table, version in versions(tables))
+    key = f'{name}|{params!r}|{version_key}'
+
+    value = backend.get(key)
+    if value is _MISSING:
+        value = build()
+        backend.set(key, value, ttl or current_app.config['CACHE_TTL'])
+    return value
+
+
+def stats():
+    backend = get_backend()
+    return dict(backend.stats, backend=type(backend).__name__, pid=os.getpid())
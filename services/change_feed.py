@@ -0,0 +1,110 @@
+"""Incremental change feed over attendances, payrolls and payments
+
+Every row carries updated_at, and deletions leave a tombstone in
+deleted_rows. A client keeps the opaque cursor of its last page and asks for
+what changed after it: rows ordered by (updated_at, id) and tombstones
+ordered by (deleted_at, id), merged into one time-ordered page. The cursor
+holds the position in both streams, so a sync costs O(changes) reads.
+
+Timestamps are taken by the application when a row is flushed but only
+become visible at commit. The feed therefore never serves anything newer
+than CHANGE_FEED_LAG_SECONDS, which has to exceed the longest write
+transaction; otherwise a late commit could land behind a client's cursor.
+"""
+from flask import current_app
+from models import db, Attendance, Payroll, Payment, DeletedRow
+from datetime import date, datetime, timedelta
+from sqlalchemy import and_, insert, or_, select
+import base64
+import json
+
+FEEDS = {
+    'attendances': Attendance,
+    'payrolls': Payroll,
+    'payments': Payment
+}
+EPOCH = datetime(1970, 1, 1)
+
+
+def record_deleted(table_name, row_ids):
+    """Leave tombstones for deleted rows; the caller commits"""
+    if row_ids:
+        now = datetime.utcnow()
+        db.session.execute(insert(DeletedRow), [
+            {'table_name': table_name, 'row_id': row_id, 'deleted_at': now} for row_id in row_ids
+        ])
+
+
+def encode_cursor(position):
+    """Opaque cursor for ((updated_at, id), (deleted_at, id))"""
+    (updated_at, row_id), (deleted_at, tombstone_id) = position
+    raw = json.dumps([updated_at.isoformat(), row_id, deleted_at.isoformat(), tombstone_id])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Position of a cursor from encode_cursor, or the start of the feed; raises ValueError"""
+    if not cursor:
+        return (EPOCH, 0), (EPOCH, 0)
+    try:
+        updated_at, row_id, deleted_at, tombstone_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return ((datetime.fromisoformat(updated_at), int(row_id)),
+                (datetime.fromisoformat(deleted_at), int(tombstone_id)))
+    except (TypeError, ValueError):
+        raise ValueError('Invalid cursor')
+
+
+def _after(timestamp_column, id_column, position):
+    timestamp, row_id = position
+    return or_(timestamp_column > timestamp, and_(timestamp_column == timestamp, id_column > row_id))
+
+
+def _plain(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def changes_since(table_name, cursor, limit):
+    """One page of changes after `cursor`; returns (changes, next_cursor, has_more)
+
+    Changes are {'op': 'upsert', 'id', 'row'} or {'op': 'delete', 'id'}.
+    """
+    model = FEEDS[table_name]
+    (row_position, tombstone_position) = decode_cursor(cursor)
+    horizon = datetime.utcnow() - timedelta(seconds=current_app.config['CHANGE_FEED_LAG_SECONDS'])
+
+    rows = db.session.execute(
+        select(model).where(
+            _after(model.updated_at, model.id, row_position),
+            model.updated_at <= horizon
+        ).order_by(model.updated_at, model.id).limit(limit + 1)
+    ).scalars().all()
+    tombstones = db.session.execute(
+        select(DeletedRow.id, DeletedRow.row_id, DeletedRow.deleted_at).where(
+            DeletedRow.table_name == table_name,
+            _after(DeletedRow.deleted_at, DeletedRow.id, tombstone_position),
+            DeletedRow.deleted_at <= horizon
+        ).order_by(DeletedRow.deleted_at, DeletedRow.id).limit(limit + 1)
+    ).all()
+
+    # Merge both streams by time and keep the first `limit` entries
+    merged = sorted(
+        [(row.updated_at, 0, row.id, row) for row in rows]
+        + [(tombstone.deleted_at, 1, tombstone.id, tombstone) for tombstone in tombstones],
+        key=lambda entry: entry[:3]
+    )
+    page = merged[:limit]
+
+    columns = model.__table__.columns
+    changes = []
+    for timestamp, kind, entry_id, entry in page:
+        if kind == 0:
+            row_position = (timestamp, entry_id)
+            changes.append({'op': 'upsert', 'id': entry.id,
+                            'row': {column.key: _plain(getattr(entry, column.key)) for column in columns}})
+        else:
+            tombstone_position = (timestamp, entry_id)
+            changes.append({'op': 'delete', 'id': entry.row_id})
+
+    return changes, encode_cursor((row_position, tombstone_position)), len(merged) > limit
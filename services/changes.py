@@ -0,0 +1,28 @@
+"""Write-side hooks called by the routes after they modify data"""
+from services import cache, change_feed, payroll_dirty, rollups
+
+
+def attendance_changed(keys):
+    """Keys are (employee_id, year, month) periods touched by the write"""
+    rollups.refresh_attendance(keys)
+    payroll_dirty.mark(keys)
+    cache.bump('attendances')
+
+
+def payroll_changed(keys):
+    rollups.refresh_payroll(keys)
+    cache.bump('payrolls')
+
+
+def payments_changed(keys):
+    rollups.refresh_payments(keys)
+    cache.bump('payments')
+
+
+def employees_changed():
+    cache.bump('employees')
+
+
+def rows_deleted(table_name, row_ids):
+    """Tombstones so change feed clients drop the rows too"""
+    change_feed.record_deleted(table_name, row_ids)
@@ -0,0 +1,142 @@
+from models import db, Employee, Attendance, Payment, Department
+from services import cache, rollups, timeseries
+from services.periods import month_range
+from services.sql import total, total_if
+from sqlalchemy import and_, func
+
+TREND_MONTHS = 6
+DASHBOARD_TABLES = ('employees', 'departments', 'attendances', 'payrolls', 'payments')
+
+
+def employee_stats(start, end):
+    """Active headcount and hires in [start, end) in one pass over employees"""
+    row = db.session.query(
+        total_if(Employee.is_active == True),
+        total_if(and_(Employee.hire_date >= start, Employee.hire_date < end))
+    ).one()
+    return {
+        'total_employees': int(row[0]),
+        'new_employees_this_month': int(row[1])
+    }
+
+
+def department_stats():
+    """Headcount and salary mass per department with a single GROUP BY"""
+    rows = db.session.query(
+        Department.name,
+        func.count(Employee.id),
+        total(Employee.salary)
+    ).outerjoin(
+        Employee,
+        and_(Employee.department_id == Department.id, Employee.is_active == True)
+    ).group_by(Department.id, Department.name).order_by(Department.id).all()
+
+    dept_stats = [{
+        'name': name,
+        'count': count,
+        'total_salary': total_salary
+    } for name, count, total_salary in rows if count > 0]
+    return len(rows), dept_stats
+
+
+def attendance_stats(year, month):
+    totals = rollups.attendance_totals(year, month)
+    return {
+        'attendance_records': totals['records'],
+        'total_work_hours': totals['total_hours'],
+        'total_overtime_hours': totals['overtime_hours']
+    }
+
+
+def payroll_stats(year, month):
+    totals = rollups.payroll_totals(year, month)
+    return {
+        'total_salary': totals['total_salary'],
+        'total_allowances': totals['allowance'],
+        'total_deductions': totals['deductions'],
+        'total_overtime_pay': totals['overtime_pay']
+    }
+
+
+def payment_stats(year, month):
+    totals = rollups.payment_totals(year, month)
+    return {
+        'total_payments': totals['completed_amount'],
+        'pending_payments': totals['pending_amount'],
+        'failed_payments': totals['failed_amount']
+    }
+
+
+def recent_activity(limit=5):
+    """Latest attendances and payments as plain dicts, employee names joined in"""
+    attendances = db.session.query(
+        Attendance.date, Attendance.total_hours, Attendance.status,
+        Employee.first_name, Employee.last_name
+    ).join(Employee, Attendance.employee_id == Employee.id).order_by(
+        Attendance.date.desc(), Attendance.id.desc()
+    ).limit(limit).all()
+
+    payments = db.session.query(
+        Payment.payment_date, Payment.amount, Payment.status,
+        Employee.first_name, Employee.last_name
+    ).join(Employee, Payment.employee_id == Employee.id).order_by(
+        Payment.payment_date.desc(), Payment.id.desc()
+    ).limit(limit).all()
+
+    recent_attendances = [{
+        'date': row.date,
+        'total_hours': row.total_hours,
+        'status': row.status,
+        'employee': {'first_name': row.first_name, 'last_name': row.last_name}
+    } for row in attendances]
+    recent_payments = [{
+        'payment_date': row.payment_date,
+        'amount': row.amount,
+        'status': row.status,
+        'employee': {'first_name': row.first_name, 'last_name': row.last_name}
+    } for row in payments]
+    return recent_attendances, recent_payments
+
+
+def monthly_trends(year, month, count=TREND_MONTHS):
+    """Attendance count and salary total for the `count` months up to (year, month)"""
+    attendance = timeseries.monthly('attendances', year, month, count)
+    salary = timeseries.monthly('payrolls', year, month, count, sums=('total_salary',))
+    return [{
+        'month': a['month'],
+        'year': a['year'],
+        'attendance': a['count'],
+        'salary': s['total_salary']
+    } for a, s in zip(attendance, salary)]
+
+
+def build_dashboard(now):
+    """Assemble the full dashboard context with a fixed number of grouped queries"""
+    current_month = now.month
+    current_year = now.year
+    start, end = month_range(current_year, current_month)
+
+    context = {
+        'current_month': current_month,
+        'current_year': current_year
+    }
+    context.update(employee_stats(start, end))
+    context['total_departments'], context['dept_stats'] = department_stats()
+    context.update(attendance_stats(current_year, current_month))
+    context.update(payroll_stats(current_year, current_month))
+    context.update(payment_stats(current_year, current_month))
+
+    if context['total_employees'] > 0:
+        context['avg_salary'] = context['total_salary'] / context['total_employees']
+    else:
+        context['avg_salary'] = 0
+
+    context['recent_attendances'], context['recent_payments'] = recent_activity()
+    context['monthly_trends'] = monthly_trends(current_year, current_month)
+    return context
+
+
+def dashboard_context(now):
+    """Cached build_dashboard, invalidated whenever one of its tables is written"""
+    return cache.cached('dashboard', DASHBOARD_TABLES, (now.year, now.month),
+                        lambda: build_dashboard(now))
@@ -0,0 +1,78 @@
+"""Content-addressed cache of generated export files on local disk
+
+A file is named after the sha256 of (export type and parameters, format,
+data fingerprint), so a changed dataset gets a new name and the old file
+simply ages out. The name doubles as the HTTP ETag.
+"""
+from flask import current_app
+from models import db
+from services import cache
+import hashlib
+import json
+import os
+import tempfile
+
+
+def _directory():
+    directory = current_app.config['EXPORT_CACHE_DIR']
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+
+def cache_key(dataset, fmt):
+    """sha256 of the export's identity and the current fingerprint of its data"""
+    fingerprint = list(db.session.execute(dataset.fingerprint).one())
+    identity = [dataset.filename, fmt, fingerprint, cache.versions(dataset.tables)]
+    return hashlib.sha256(json.dumps(identity, default=str).encode('utf-8')).hexdigest()
+
+
+def cached_file(dataset, fmt, write):
+    """Path and ETag of the export file, calling write(dataset, file) only on a miss"""
+    directory = _directory()
+    key = cache_key(dataset, fmt)
+    path = os.path.join(directory, f'{key}.{fmt}')
+
+    try:
+        # Touch the file so pruning evicts the least recently used exports first
+        os.utime(path)
+        return path, key
+    except OSError:
+        pass
+
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            write(dataset, f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    _prune(directory, current_app.config['EXPORT_CACHE_MAX_BYTES'], keep=path)
+    return path, key
+
+
+def _prune(directory, max_bytes, keep):
+    entries = []
+    for name in os.listdir(directory):
+        if name.endswith('.tmp'):
+            continue
+        path = os.path.join(directory, name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+
+    used = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if used <= max_bytes:
+            break
+        if path == keep:
+            continue
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        used -= size
@@ -0,0 +1,238 @@
+"""Export datasets streamed from a single projection query
+
+A dataset is a title, a file name stem, the header row, machine field names
+and a lazy iterator of value tuples; the writers below never hold more than
+a bounded sample or batch of rows. `fingerprint` is a cheap aggregate query
+over the same filter and `tables` lists the data versions the rows depend on;
+together they identify the dataset's content for the export file cache.
+"""
+from models import db, Employee, Department, Attendance, Payroll, Payment
+from services.periods import period_between
+from collections import namedtuple
+from datetime import date, datetime
+from itertools import chain, islice
+from sqlalchemy import and_, func, select
+import csv
+import io
+import json
+import openpyxl
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, Alignment, PatternFill
+from openpyxl.utils import get_column_letter
+
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+YIELD_PER = 1000
+WIDTH_SAMPLE_ROWS = 1000
+MAX_COLUMN_WIDTH = 50
+STREAM_BATCH_ROWS = 500
+
+Dataset = namedtuple('Dataset', ['title', 'filename', 'headers', 'fields', 'rows', 'fingerprint', 'tables'])
+
+
+def _stream(stmt):
+    """Yield the rows of `stmt` fetched in batches; nothing runs until iteration starts"""
+    yield from db.session.execute(stmt.execution_options(yield_per=YIELD_PER))
+
+
+def payroll_dataset(start, end=None):
+    """Payrolls of the (year, month) periods from start to end, inclusive"""
+    end = end or start
+    in_range = period_between(Payroll.year, Payroll.month, start, end)
+    stmt = select(
+        Employee.employee_id,
+        Employee.first_name,
+        Employee.last_name,
+        Department.name,
+        Payroll.month,
+        Payroll.year,
+        Payroll.basic_salary,
+        Payroll.allowance,
+        Payroll.overtime_pay,
+        Payroll.bonus,
+        Payroll.deductions,
+        Payroll.total_salary,
+        Payroll.working_days,
+        Payroll.status
+    ).join(Employee, Payroll.employee_id == Employee.id).outerjoin(
+        Department, Employee.department_id == Department.id
+    ).where(in_range).order_by(Payroll.year, Payroll.month, Payroll.id)
+
+    if start == end:
+        year, month = start
+        title, filename = f"Payroll {month}_{year}", f'payroll_{month}_{year}'
+        headers, fields = [], []
+    else:
+        title = f"Payroll {start[1]}_{start[0]} to {end[1]}_{end[0]}"
+        filename = f'payroll_{start[1]}_{start[0]}_to_{end[1]}_{end[0]}'
+        headers, fields = ['Period'], ['period']
+
+    rows = ((code, f"{first_name} {last_name}", department)
+            + ((f"{month}/{year}",) if fields else ()) + tuple(values)
+            for code, first_name, last_name, department, month, year, *values in _stream(stmt))
+
+    return Dataset(
+        title=title,
+        filename=filename,
+        headers=['Employee ID', 'Name', 'Department'] + headers
+                + ['Basic Salary', 'Allowance', 'Overtime Pay', 'Bonus', 'Deductions', 'Total Salary',
+                   'Working Days', 'Status'],
+        fields=['employee_code', 'name', 'department'] + fields
+               + ['basic_salary', 'allowance', 'overtime_pay', 'bonus', 'deductions', 'total_salary',
+                  'working_days', 'status'],
+        rows=rows,
+        fingerprint=select(func.count(Payroll.id), func.max(Payroll.id), func.max(Payroll.updated_at)).where(in_range),
+        tables=('payrolls', 'employees', 'departments')
+    )
+
+
+def attendance_dataset(start_date, end_date):
+    in_range = and_(Attendance.date >= start_date, Attendance.date <= end_date)
+    stmt = select(
+        Attendance.id,
+        Employee.employee_id,
+        Employee.first_name,
+        Employee.last_name,
+        Department.name,
+        Attendance.date,
+        Attendance.check_in,
+        Attendance.check_out,
+        Attendance.total_hours,
+        Attendance.overtime_hours,
+        Attendance.status,
+        Attendance.notes
+    ).join(Employee, Attendance.employee_id == Employee.id).outerjoin(
+        Department, Employee.department_id == Department.id
+    ).where(in_range).order_by(Attendance.date, Attendance.id)
+
+    rows = ((attendance_id, code, f"{first_name} {last_name}") + tuple(values)
+            for attendance_id, code, first_name, last_name, *values in _stream(stmt))
+
+    return Dataset(
+        title=f"Attendance {start_date} to {end_date}",
+        filename=f'attendance_{start_date}_to_{end_date}',
+        headers=['Attendance ID', 'Employee ID', 'Employee Name', 'Department', 'Date', 'Check In',
+                 'Check Out', 'Total Hours', 'Overtime Hours', 'Status', 'Notes'],
+        fields=['attendance_id', 'employee_code', 'employee_name', 'department', 'date', 'check_in',
+                'check_out', 'total_hours', 'overtime_hours', 'status', 'notes'],
+        rows=rows,
+        fingerprint=select(func.count(Attendance.id), func.max(Attendance.id)).where(in_range),
+        tables=('attendances', 'employees', 'departments')
+    )
+
+
+def payments_dataset(start_date, end_date):
+    in_range = and_(Payment.payment_date >= start_date, Payment.payment_date <= end_date)
+    stmt = select(
+        Payment.id,
+        Employee.employee_id,
+        Employee.first_name,
+        Employee.last_name,
+        Payroll.month,
+        Payroll.year,
+        Payment.amount,
+        Payment.payment_date,
+        Payment.payment_method,
+        Payment.status,
+        Payment.reference_number
+    ).join(Employee, Payment.employee_id == Employee.id).join(
+        Payroll, Payment.payroll_id == Payroll.id
+    ).where(in_range).order_by(Payment.payment_date.desc(), Payment.id.desc())
+
+    rows = ((payment_id, code, f"{first_name} {last_name}", f"{month}/{year}", amount,
+             payment_date.strftime('%Y-%m-%d'), method, status, reference or '')
+            for payment_id, code, first_name, last_name, month, year, amount,
+                payment_date, method, status, reference in _stream(stmt))
+
+    return Dataset(
+        title=f"Payments {start_date} to {end_date}",
+        filename=f'payments_{start_date}_to_{end_date}',
+        headers=['Payment ID', 'Employee ID', 'Employee Name', 'Payroll Period', 'Amount',
+                 'Payment Date', 'Payment Method', 'Status', 'Reference Number'],
+        fields=['payment_id', 'employee_code', 'employee_name', 'payroll_period', 'amount',
+                'payment_date', 'payment_method', 'status', 'reference_number'],
+        rows=rows,
+        fingerprint=select(func.count(Payment.id), func.max(Payment.id)).where(in_range),
+        tables=('payments', 'payrolls', 'employees')
+    )
+
+
+def _header_cells(ws, headers):
+    font = Font(bold=True)
+    fill = PatternFill(start_color="CCCCCC", end_color="CCCCCC", fill_type="solid")
+    alignment = Alignment(horizontal="center")
+    cells = []
+    for header in headers:
+        cell = WriteOnlyCell(ws, value=header)
+        cell.font = font
+        cell.fill = fill
+        cell.alignment = alignment
+        cells.append(cell)
+    return cells
+
+
+def write_xlsx(dataset, output):
+    """Write `dataset` to the binary file `output` with openpyxl's write-only mode
+
+    Write-only sheets emit column widths before the first row, so widths are
+    measured on a bounded sample of leading rows that is buffered, sized and
+    then written ahead of the rest of the stream.
+    """
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet(dataset.title)
+
+    rows = iter(dataset.rows)
+    sample = list(islice(rows, WIDTH_SAMPLE_ROWS))
+    widths = [len(header) for header in dataset.headers]
+    for row in sample:
+        for i, value in enumerate(row):
+            if value is not None:
+                widths[i] = max(widths[i], len(str(value)))
+    for i, width in enumerate(widths, 1):
+        ws.column_dimensions[get_column_letter(i)].width = min(width + 2, MAX_COLUMN_WIDTH)
+
+    ws.append(_header_cells(ws, dataset.headers))
+    for row in chain(sample, rows):
+        ws.append(row)
+
+    wb.save(output)
+
+
+def _plain(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def _batches(rows):
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, STREAM_BATCH_ROWS))
+        if not batch:
+            return
+        yield batch
+
+
+def csv_stream(dataset):
+    """Yield the dataset as UTF-8 CSV text, one chunk per batch of rows"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # BOM so Excel detects UTF-8 and shows Vietnamese names correctly
+    buffer.write('\ufeff')
+    writer.writerow(dataset.headers)
+    yield buffer.getvalue()
+
+    for batch in _batches(dataset.rows):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows([_plain(value) for value in row] for row in batch)
+        yield buffer.getvalue()
+
+
+def ndjson_stream(dataset):
+    """Yield the dataset as newline-delimited JSON objects keyed by field name"""
+    fields = dataset.fields
+    for batch in _batches(dataset.rows):
+        yield ''.join(
+            json.dumps(dict(zip(fields, map(_plain, row))), ensure_ascii=False) + '\n'
+            for row in batch
+        )
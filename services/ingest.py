@@ -0,0 +1,271 @@
+"""Write-behind ingestion of check-in and check-out events
+
+Requests put events on a bounded in-process queue and wait; a flusher thread
+drains the queue in batches (INGEST_BATCH_SIZE events or INGEST_BATCH_MS,
+whichever comes first), applies each batch with one read, one multi-row
+insert and one executemany update, commits once and then
+acknowledges every caller in the batch. A request therefore only returns
+after its event is durable, but hundreds of concurrent check-ins share a
+handful of commits.
+
+record_events() applies a badge reader's buffered taps the same way, in the
+reader's own request and transaction.
+"""
+from models import db, Attendance, Employee
+from services import changes, rollups
+from services.attendance_writes import RECORDED, ALREADY_DONE, NOT_FOUND
+from sqlalchemy import insert, select, update
+from sqlalchemy.exc import IntegrityError
+from datetime import datetime
+import logging
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Results reported back to the waiting request, besides those of attendance_writes
+BUSY = 'busy'
+FAILED = 'failed'
+INVALID = 'invalid'
+
+MAX_BATCH_EVENTS = 1000
+DIRECTIONS = {'in': 'check_in', 'out': 'check_out'}
+
+UPDATED_COLUMNS = ('id', 'check_in', 'check_out', 'status', 'total_hours', 'overtime_hours')
+INSERT_ATTEMPTS = 3  # re-plans after losing an insert race before the batch fails
+
+
+class IngestEvent:
+    __slots__ = ('kind', 'employee_id', 'day', 'at', 'result', 'error', 'done')
+
+    def __init__(self, kind, employee_id, day, at):
+        self.kind = kind  # check_in, check_out
+        self.employee_id = int(employee_id)
+        self.day = day
+        self.at = at
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+
+def hours_worked(check_in, check_out):
+    """(total_hours, overtime_hours) the way check_out computes them"""
+    total_hours = (check_out - check_in).total_seconds() / 3600
+    return round(total_hours, 2), round(total_hours - 8, 2) if total_hours > 8 else None
+
+
+def _read_existing(events):
+    existing = {}
+    for day in {event.day for event in events}:
+        employee_ids = {event.employee_id for event in events if event.day == day}
+        for row in db.session.execute(
+            select(Attendance.id, Attendance.employee_id, Attendance.date, Attendance.check_in,
+                   Attendance.check_out, Attendance.status, Attendance.total_hours,
+                   Attendance.overtime_hours).where(
+                Attendance.date == day,
+                Attendance.employee_id.in_(employee_ids)
+            )
+        ):
+            existing[(row.employee_id, row.date)] = dict(row._mapping)
+    return existing
+
+
+def _plan(events, existing):
+    """Set every event's result and return the (inserts, updates) that record them"""
+    inserts = {}
+    updates = {}
+    for event in events:
+        key = (event.employee_id, event.day)
+        record = inserts.get(key) or existing.get(key)
+
+        if event.kind == 'check_in':
+            if record and record['check_in']:
+                event.result = ALREADY_DONE
+                continue
+            if record:
+                record.update(check_in=event.at, status='present')
+                updates[record['id']] = record
+            else:
+                inserts[key] = {'employee_id': event.employee_id, 'date': event.day,
+                                'check_in': event.at, 'check_out': None, 'status': 'present',
+                                'total_hours': 0.0, 'overtime_hours': 0.0}
+        else:
+            if not record:
+                event.result = NOT_FOUND
+                continue
+            if record['check_out']:
+                event.result = ALREADY_DONE
+                continue
+            record['check_out'] = event.at
+            if record['check_in']:
+                record['total_hours'], overtime_hours = hours_worked(record['check_in'], event.at)
+                if overtime_hours is not None:
+                    record['overtime_hours'] = overtime_hours
+            if 'id' in record:
+                updates[record['id']] = record
+        event.result = RECORDED
+    return inserts, updates
+
+
+def apply_batch(events):
+    """Apply check-in/out events in order with batched reads and writes; the caller commits
+
+    New days are inserted with their check-out and hours already folded in.
+    If another process inserted one of those days since the read, the
+    insert fails on the unique key, is rolled back to its savepoint, and the
+    whole batch is planned again against the rows now there, so no event is
+    acknowledged for a write that did not happen.
+    """
+    for attempt in range(INSERT_ATTEMPTS):
+        inserts, updates = _plan(events, _read_existing(events))
+        if not inserts:
+            break
+        try:
+            with db.session.begin_nested():
+                db.session.execute(insert(Attendance), list(inserts.values()))
+            break
+        except IntegrityError:
+            if attempt == INSERT_ATTEMPTS - 1:
+                raise
+    if updates:
+        db.session.execute(update(Attendance), [
+            {name: row[name] for name in UPDATED_COLUMNS} for row in updates.values()
+        ])
+
+    keys = {rollups.period_key(event.employee_id, event.day) for event in events if event.result == RECORDED}
+    if keys:
+        changes.attendance_changed(sorted(keys))
+
+
+def _employee_id(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError('employee_id must be an integer')
+
+
+def _event_time(value):
+    try:
+        at = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise ValueError('timestamp must be an ISO 8601 date and time')
+    if at.tzinfo is not None:
+        # Stored times are naive local time, like datetime.now() in the views
+        at = at.astimezone().replace(tzinfo=None)
+    return at
+
+
+def record_events(items):
+    """Validate and apply {employee_id, timestamp, direction} taps as one batch; the caller commits
+
+    Returns one {'result'} dict per item, in the same order; invalid items
+    get result INVALID and a message and do not stop the others.
+    """
+    employee_ids = set()
+    for item in items:
+        try:
+            employee_ids.add(_employee_id(item.get('employee_id')))
+        except (AttributeError, ValueError):
+            pass
+    active = set(db.session.execute(
+        select(Employee.id).where(Employee.id.in_(employee_ids), Employee.is_active == True)
+    ).scalars()) if employee_ids else set()
+
+    results = [None] * len(items)
+    events = []
+    for i, item in enumerate(items):
+        try:
+            if not isinstance(item, dict):
+                raise ValueError('Event must be an object')
+            kind = DIRECTIONS.get(item.get('direction'))
+            if kind is None:
+                raise ValueError("direction must be 'in' or 'out'")
+            employee_id = _employee_id(item.get('employee_id'))
+            if employee_id not in active:
+                raise ValueError('Unknown or inactive employee')
+            at = _event_time(item.get('timestamp'))
+        except ValueError as e:
+            results[i] = {'result': INVALID, 'message': str(e)}
+            continue
+        events.append((i, IngestEvent(kind, employee_id, at.date(), at)))
+
+    # Apply taps in time order, whatever order the reader buffered them in
+    events.sort(key=lambda pair: pair[1].at)
+    if events:
+        apply_batch([event for _, event in events])
+    for i, event in events:
+        results[i] = {'result': event.result}
+    return results
+
+
+class AttendanceIngestor:
+    def __init__(self, app=None):
+        self.app = None
+        self.queue = None
+        self._started = False
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.queue = queue.Queue(maxsize=app.config['INGEST_QUEUE_SIZE'])
+        app.extensions['attendance_ingest'] = self
+
+    def ensure_started(self):
+        if self._started:
+            return
+        with self._lock:
+            if self._started:
+                return
+            threading.Thread(target=self._flush_forever, name='attendance-ingest', daemon=True).start()
+            self._started = True
+
+    def submit(self, kind, employee_id, day, at):
+        """Queue an event and block until its batch is committed; returns the result"""
+        self.ensure_started()
+        event = IngestEvent(kind, employee_id, day, at)
+        timeout = self.app.config['INGEST_ACK_TIMEOUT']
+        try:
+            self.queue.put(event, timeout=timeout)
+        except queue.Full:
+            return BUSY
+        if not event.done.wait(timeout):
+            # Still queued or being written; the caller must not assume either outcome
+            return BUSY
+        return event.result
+
+    def _next_batch(self):
+        batch = [self.queue.get()]
+        batch_size = self.app.config['INGEST_BATCH_SIZE']
+        deadline = time.monotonic() + self.app.config['INGEST_BATCH_MS'] / 1000.0
+        while len(batch) < batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _flush_forever(self):
+        while True:
+            batch = self._next_batch()
+            with self.app.app_context():
+                try:
+                    apply_batch(batch)
+                    db.session.commit()
+                except Exception as e:
+                    logger.exception('Attendance ingest batch of %s events failed', len(batch))
+                    db.session.rollback()
+                    for event in batch:
+                        event.result, event.error = FAILED, str(e)
+                finally:
+                    db.session.remove()
+            for event in batch:
+                event.done.set()
+
+
+ingestor = AttendanceIngestor()
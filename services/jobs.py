@@ -0,0 +1,268 @@
+"""Database-backed background jobs processed by a thread pool inside each web worker
+
+A job stores its work items in `params['items']` and advances `cursor` one
+chunk at a time. Each chunk's writes are committed together with the job's
+progress, so a job interrupted by a crash resumes at the first uncommitted
+chunk when any worker picks it up again. Kinds whose items are expensive to
+work out (e.g. scanning an uploaded file) register a planner instead and are
+enqueued without items; the worker plans them before the first chunk.
+"""
+from flask import current_app
+from models import db, Job
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import json
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+MAX_RESULT_IDS = 200
+
+HANDLERS = {}
+PLANNERS = {}
+CHUNK_SIZES = {}
+
+
+def handler(kind, chunk_size=None):
+    """Register fn(params, items) -> dict of counters as the processor of a job kind
+
+    The handler writes to db.session without committing; a 'failed' counter
+    in its result is added to the job's failed count. Counters are summed
+    across chunks, except lists (e.g. of skipped ids), which are joined. `chunk_size` overrides
+    JOB_CHUNK_SIZE for kinds whose items are large.
+    """
+    def decorator(fn):
+        HANDLERS[kind] = fn
+        if chunk_size:
+            CHUNK_SIZES[kind] = chunk_size
+        return fn
+    return decorator
+
+
+def planner(kind):
+    """Register fn(params) -> items, run by the worker for jobs enqueued with items=None"""
+    def decorator(fn):
+        PLANNERS[kind] = fn
+        return fn
+    return decorator
+
+
+class JobRunner:
+    def __init__(self, app=None):
+        self.app = None
+        self.executor = None
+        self._started = False
+        self._lock = threading.Lock()
+        self._submitted = set()  # ids waiting in or running on this worker's pool
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.extensions['jobs'] = self
+        # Only processes that serve requests run jobs; CLI commands such as
+        # `flask db upgrade` must not touch the jobs table.
+        app.before_request(self.ensure_started)
+
+    def ensure_started(self):
+        if self._started:
+            return
+        with self._lock:
+            if self._started:
+                return
+            self.executor = ThreadPoolExecutor(self.app.config['JOB_WORKERS'], thread_name_prefix='jobs')
+            threading.Thread(target=self._poll, name='jobs-poller', daemon=True).start()
+            self._started = True
+
+    def submit(self, job_id):
+        """Run a job on this worker's pool unless it is already waiting there or running"""
+        self.ensure_started()
+        with self._lock:
+            if job_id in self._submitted:
+                return
+            self._submitted.add(job_id)
+        self.executor.submit(self._run, job_id)
+
+    def _poll(self):
+        """Pick up jobs left queued or orphaned by a crashed worker"""
+        while True:
+            try:
+                with self.app.app_context():
+                    stale_before = datetime.utcnow() - timedelta(seconds=self.app.config['JOB_STALE_SECONDS'])
+                    job_ids = [job_id for job_id, in db.session.query(Job.id).filter(
+                        db.or_(
+                            Job.status == 'queued',
+                            db.and_(Job.status == 'running', Job.heartbeat_at < stale_before)
+                        )
+                    ).order_by(Job.id)]
+                    db.session.remove()
+                # Jobs already submitted are skipped, so a long queue does not
+                # pile up a new copy of every waiting job on each poll
+                for job_id in job_ids:
+                    self.submit(job_id)
+            except Exception:
+                logger.exception('Job poller failed')
+            time.sleep(self.app.config['JOB_POLL_SECONDS'])
+
+    def _claim(self, job_id):
+        now = datetime.utcnow()
+        stale_before = now - timedelta(seconds=self.app.config['JOB_STALE_SECONDS'])
+        claimed = db.session.query(Job).filter(
+            Job.id == job_id,
+            db.or_(
+                Job.status == 'queued',
+                db.and_(Job.status == 'running', Job.heartbeat_at < stale_before)
+            )
+        ).update({
+            Job.status: 'running',
+            Job.started_at: db.func.coalesce(Job.started_at, now),
+            Job.heartbeat_at: now,
+            # A resumed job is timed from here, not from its first start
+            Job.claimed_at: now,
+            Job.claimed_processed: Job.processed
+        }, synchronize_session=False)
+        db.session.commit()
+        return claimed == 1
+
+    def _keep_alive(self, engine, job_id, stop):
+        """Refresh the heartbeat of a running job until `stop` is set
+
+        Runs beside the worker so a chunk (or a plan) that takes longer than
+        JOB_STALE_SECONDS does not look orphaned and get claimed a second time.
+        """
+        jobs = Job.__table__
+        while not stop.wait(self.app.config['JOB_STALE_SECONDS'] / 3):
+            try:
+                with engine.begin() as conn:
+                    conn.execute(jobs.update().where(jobs.c.id == job_id, jobs.c.status == 'running')
+                                 .values(heartbeat_at=datetime.utcnow()))
+            except Exception:
+                logger.exception('Job %s heartbeat failed', job_id)
+
+    def _run(self, job_id):
+        with self.app.app_context():
+            try:
+                if self._claim(job_id):
+                    stop = threading.Event()
+                    threading.Thread(target=self._keep_alive, args=(db.engine, job_id, stop),
+                                     name=f'jobs-heartbeat-{job_id}', daemon=True).start()
+                    try:
+                        self._process(db.session.get(Job, job_id))
+                    finally:
+                        stop.set()
+            except Exception:
+                logger.exception('Job %s crashed', job_id)
+                db.session.rollback()
+                db.session.query(Job).filter(Job.id == job_id).update(
+                    {Job.status: 'failed', Job.finished_at: datetime.utcnow()}, synchronize_session=False
+                )
+                db.session.commit()
+            finally:
+                db.session.remove()
+                with self._lock:
+                    self._submitted.discard(job_id)
+
+    def _plan(self, job, params):
+        """Work out the items of a job enqueued without them; False if planning failed"""
+        try:
+            params['items'] = list(PLANNERS[job.kind](params))
+        except Exception as e:
+            logger.exception('Job %s could not be planned', job.id)
+            db.session.rollback()
+            job.status = 'failed'
+            job.error = str(e)
+            job.finished_at = datetime.utcnow()
+            db.session.commit()
+            return False
+        job.params = json.dumps(params)
+        job.total = len(params['items'])
+        job.heartbeat_at = datetime.utcnow()
+        db.session.commit()
+        return True
+
+    def _process(self, job):
+        process_chunk = HANDLERS[job.kind]
+        params = json.loads(job.params)
+        if params.get('items') is None and not self._plan(job, params):
+            return
+        items = params['items']
+        chunk_size = CHUNK_SIZES.get(job.kind) or self.app.config['JOB_CHUNK_SIZE']
+
+        while job.cursor < len(items):
+            chunk = items[job.cursor:job.cursor + chunk_size]
+            try:
+                counters = process_chunk(params, chunk)
+                error = None
+            except Exception as e:
+                logger.exception('Job %s failed on items %s-%s', job.id, job.cursor, job.cursor + len(chunk))
+                db.session.rollback()
+                counters = {'failed': len(chunk)}
+                error = f'Items {job.cursor}-{job.cursor + len(chunk) - 1}: {str(e)}'
+
+            result = json.loads(job.result or '{}')
+            for name, value in counters.items():
+                if isinstance(value, list):
+                    # Ids worth reporting, capped so the result stays small
+                    result[name] = (result.get(name, []) + value)[:MAX_RESULT_IDS]
+                else:
+                    result[name] = result.get(name, 0) + value
+            job.result = json.dumps(result)
+            job.failed += counters.get('failed', 0)
+            job.processed += len(chunk)
+            job.cursor += len(chunk)
+            job.heartbeat_at = datetime.utcnow()
+            if error:
+                job.error = error
+            db.session.commit()
+
+        job.status = 'completed'
+        job.finished_at = datetime.utcnow()
+        db.session.commit()
+
+
+runner = JobRunner()
+
+
+def enqueue(kind, items, created_by=None, **params):
+    """Persist a job over `items` and start it on this worker's pool; returns the Job
+
+    Pass items=None for kinds with a planner.
+    """
+    params['items'] = None if items is None else list(items)
+    job = Job(kind=kind, params=json.dumps(params), total=len(params['items'] or ()), created_by=created_by)
+    db.session.add(job)
+    db.session.commit()
+    current_app.extensions['jobs'].submit(job.id)
+    return job
+
+
+def progress(job):
+    """JSON-friendly progress report with an ETA based on the rate of the current run"""
+    eta_seconds = None
+    claimed_at = job.claimed_at or job.started_at
+    done = job.processed - (job.claimed_processed or 0)
+    if job.status == 'running' and claimed_at and done > 0:
+        elapsed = (datetime.utcnow() - claimed_at).total_seconds()
+        rate = done / elapsed if elapsed > 0 else 0
+        if rate:
+            eta_seconds = round((job.total - job.processed) / rate, 1)
+
+    return {
+        'id': job.id,
+        'kind': job.kind,
+        'status': job.status,
+        'total': job.total,
+        'processed': job.processed,
+        'failed': job.failed,
+        # A job still being planned has no total yet
+        'percent': round(100.0 * job.processed / job.total, 1) if job.total
+                   else (100.0 if job.status == 'completed' else 0.0),
+        'eta_seconds': eta_seconds,
+        'result': json.loads(job.result or '{}'),
+        'error': job.error,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None
+    }
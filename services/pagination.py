@@ -0,0 +1,86 @@
+"""Keyset (seek) pagination for the list pages
+
+A page is the first `per_page` rows after the cursor in a fixed order that
+ends with the primary key, so the order is total and the database seeks
+straight to the cursor through the index instead of counting past an
+OFFSET. The cursor holds the sort values of the last row shown, which
+makes the cost of a page depend on its size rather than the table's, and
+rows inserted meanwhile never shift a page.
+"""
+from flask import current_app, request
+from datetime import date, datetime
+from sqlalchemy import and_, or_
+import base64
+import json
+
+MAX_PAGE_SIZE = 500
+
+
+def wants_json():
+    return request.args.get('format') == 'json' or request.accept_mimetypes.best == 'application/json'
+
+
+def page_size():
+    """per_page from the query string, LIST_PAGE_SIZE by default"""
+    per_page = request.args.get('per_page', type=int) or current_app.config['LIST_PAGE_SIZE']
+    return max(1, min(per_page, MAX_PAGE_SIZE))
+
+
+def _plain(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps([_plain(value) for value in values]).encode()).decode()
+
+
+def decode_cursor(cursor, order):
+    """Sort values of a cursor for `order`, or None for the first page; raises ValueError"""
+    if not cursor:
+        return None
+    try:
+        raw = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if len(raw) != len(order):
+            raise ValueError
+        values = []
+        for (column, _), value in zip(order, raw):
+            python_type = column.type.python_type
+            if python_type is datetime:
+                value = datetime.fromisoformat(value)
+            elif python_type is date:
+                value = date.fromisoformat(value)
+            else:
+                value = python_type(value)
+            values.append(value)
+        return values
+    except (TypeError, ValueError):
+        raise ValueError('Invalid cursor')
+
+
+def _after(order, values):
+    # (a, b) after (x, y) is a past x, or a equal to x and b past y
+    clauses = []
+    for i, (column, descending) in enumerate(order):
+        ties = [previous == value for (previous, _), value in zip(order[:i], values[:i])]
+        clauses.append(and_(*ties, column < values[i] if descending else column > values[i]))
+    return or_(*clauses)
+
+
+def keyset_page(query, order, cursor, per_page):
+    """One page of `query` after `cursor`; returns (items, next_cursor)
+
+    `order` is a list of (column, descending) pairs ending with the primary
+    key. next_cursor is None on the last page.
+    """
+    values = decode_cursor(cursor, order)
+    if values is not None:
+        query = query.filter(_after(order, values))
+    query = query.order_by(*[column.desc() if descending else column.asc() for column, descending in order])
+    items = query.limit(per_page + 1).all()
+
+    if len(items) <= per_page:
+        return items, None
+    items = items[:per_page]
+    return items, encode_cursor([getattr(items[-1], column.key) for column, _ in order])
@@ -0,0 +1,75 @@
+"""Payment counts and sums for the report pages, straight from GROUP BY queries
+
+`breakdown` groups the payments matching a filter by (status, payment
+method, department) in one query; the few resulting rows are folded into
+per-status, per-method and per-department totals in Python. `monthly` is
+the time-series variant: one query grouped by month and status over the
+payment_date range of the last N months, zero-filled for months without
+payments. Both return plain dicts, so the routes can cache them.
+"""
+from models import db, Department, Employee, Payment, Payroll
+from services import timeseries
+from services.periods import month_range, recent_months
+from services.sql import total
+from sqlalchemy import and_, func, select
+
+
+def in_month(year, month):
+    """Payments dated in the calendar month, as a range on payment_date"""
+    start, end = month_range(year, month)
+    return and_(Payment.payment_date >= start, Payment.payment_date < end)
+
+
+def in_pay_period(year, month):
+    """Payments of the payrolls of a pay period, whenever they were paid"""
+    return Payment.payroll_id.in_(select(Payroll.id).where(Payroll.year == year, Payroll.month == month))
+
+
+def _add(groups, key, count, amount):
+    group = groups.setdefault(key, {'count': 0, 'amount': 0})
+    group['count'] += count
+    group['amount'] += amount
+
+
+def breakdown(criterion):
+    """Count and amount of the matching payments in total and by status, method and department"""
+    rows = db.session.execute(
+        select(Payment.status, Payment.payment_method, Department.name,
+               func.count(Payment.id), total(Payment.amount))
+        .join(Employee, Payment.employee_id == Employee.id)
+        .outerjoin(Department, Employee.department_id == Department.id)
+        .where(criterion)
+        .group_by(Payment.status, Payment.payment_method, Department.id, Department.name)
+        .order_by(Payment.payment_method, Department.name)
+    ).all()
+
+    stats = {'count': 0, 'amount': 0, 'by_status': {}, 'by_method': {}, 'by_department': {}}
+    for status, method, department, count, amount in rows:
+        stats['count'] += count
+        stats['amount'] += amount
+        _add(stats['by_status'], status, count, amount)
+        _add(stats['by_method'], method, count, amount)
+        _add(stats['by_department'], department, count, amount)
+    return stats
+
+
+def status_total(stats, status, field='amount'):
+    return stats['by_status'].get(status, {}).get(field, 0)
+
+
+def monthly(year, month, count):
+    """Count and amount per status for the `count` months up to (year, month), oldest first"""
+    periods = recent_months(year, month, count)
+    payment_year, payment_month, in_window = timeseries.window('payments', periods)
+
+    series = {(y, m): {'year': y, 'month': m, 'count': 0, 'amount': 0, 'by_status': {}} for y, m in periods}
+    for y, m, status, payments, amount in db.session.execute(
+        select(payment_year, payment_month, Payment.status, func.count(Payment.id), total(Payment.amount))
+        .where(in_window)
+        .group_by(payment_year, payment_month, Payment.status)
+    ):
+        entry = series[(int(y), int(m))]
+        entry['count'] += payments
+        entry['amount'] += amount
+        _add(entry['by_status'], status, payments, amount)
+    return [series[period] for period in periods]
@@ -0,0 +1,69 @@
+"""Queue of generated payrolls that need recalculating after attendance changes"""
+from models import db, Payroll, PayrollDirty
+from sqlalchemy import func, insert, select, update
+from datetime import datetime
+
+
+def mark(keys):
+    """Queue the non-paid payrolls of the given (employee_id, year, month) keys; the caller commits"""
+    periods = {}
+    for employee_id, year, month in keys:
+        periods.setdefault((int(year), int(month)), set()).add(int(employee_id))
+
+    now = datetime.utcnow()
+    for (year, month), employee_ids in periods.items():
+        # Only periods that already have an unpaid payroll need the queue
+        employee_ids = set(db.session.execute(
+            select(Payroll.employee_id).where(
+                Payroll.year == year,
+                Payroll.month == month,
+                Payroll.employee_id.in_(employee_ids),
+                Payroll.status != 'paid'
+            )
+        ).scalars())
+        if not employee_ids:
+            continue
+
+        in_period = (PayrollDirty.year == year, PayrollDirty.month == month,
+                     PayrollDirty.employee_id.in_(employee_ids))
+        # Re-marking bumps the version so a recompute that already read the
+        # old mark will not dequeue this newer change. marked_at alone cannot
+        # guard this: MySQL DATETIME keeps whole seconds.
+        db.session.execute(update(PayrollDirty).where(*in_period).values(
+            marked_at=now, version=PayrollDirty.version + 1
+        ))
+        queued = set(db.session.execute(select(PayrollDirty.employee_id).where(*in_period)).scalars())
+        missing = employee_ids - queued
+        if missing:
+            db.session.execute(insert(PayrollDirty), [
+                {'employee_id': employee_id, 'year': year, 'month': month, 'marked_at': now, 'version': 1}
+                for employee_id in sorted(missing)
+            ])
+
+
+def pending_count(year=None, month=None):
+    query = db.session.query(func.count(PayrollDirty.id))
+    if year is not None:
+        query = query.filter(PayrollDirty.year == year, PayrollDirty.month == month)
+    return query.scalar()
+
+
+def queued():
+    """Every queued mark as (id, employee_id, year, month, marked_at, version) rows"""
+    return db.session.execute(
+        select(PayrollDirty.id, PayrollDirty.employee_id, PayrollDirty.year,
+               PayrollDirty.month, PayrollDirty.marked_at, PayrollDirty.version)
+    ).all()
+
+
+def dequeue(rows):
+    """Remove marks read by queued() unless they were re-marked since"""
+    table = PayrollDirty.__table__
+    if rows:
+        db.session.execute(
+            table.delete().where(
+                table.c.id == db.bindparam('dirty_id'),
+                table.c.version == db.bindparam('dirty_version')
+            ),
+            [{'dirty_id': row.id, 'dirty_version': row.version} for row in rows]
+        )
@@ -0,0 +1,289 @@
+from flask import current_app
+from models import db, Employee, Payroll, Attendance
+from services import changes, jobs, payroll_dirty
+from services.periods import month_range
+from services.sql import total, total_if
+from sqlalchemy import create_engine, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import multiprocessing
+
+WORKING_DAYS_PER_MONTH = 22  # Assuming 22 working days per month
+HOURS_PER_DAY = 8
+OVERTIME_RATE = 1.5  # 1.5x for overtime
+IN_CHUNK = 1000
+
+
+def payroll_components(salary, allowance, working_days, absent_days, overtime_hours):
+    """Salary formula of one employee-month, shared by the batch engine and the simulation"""
+    daily_salary = salary / WORKING_DAYS_PER_MONTH
+    basic_salary = daily_salary * working_days
+    overtime_pay = overtime_hours * (daily_salary / HOURS_PER_DAY) * OVERTIME_RATE
+    bonus = 0  # Can be configured
+    deductions = absent_days * daily_salary
+
+    total_salary = basic_salary + allowance + overtime_pay + bonus - deductions
+
+    return {
+        'basic_salary': round(basic_salary, 2),
+        'allowance': allowance,
+        'overtime_pay': round(overtime_pay, 2),
+        'bonus': bonus,
+        'deductions': round(deductions, 2),
+        'total_salary': round(total_salary, 2),
+        'working_days': working_days,
+        'absent_days': absent_days,
+        'overtime_hours': overtime_hours
+    }
+
+
+def _chunks(ids, size=IN_CHUNK):
+    ids = sorted(ids)
+    for i in range(0, len(ids), size):
+        yield ids[i:i + size]
+
+
+def attendance_aggregates(month, year, employee_ids, connection=None):
+    """Present/absent counts and hour sums per employee with one GROUP BY per chunk"""
+    conn = connection if connection is not None else db.session
+    start_date, end_date = month_range(year, month)
+    aggregates = {}
+    for ids in _chunks(employee_ids):
+        rows = conn.execute(
+            select(
+                Attendance.employee_id,
+                total_if(Attendance.status == 'present'),
+                total_if(Attendance.status == 'absent'),
+                total(Attendance.total_hours),
+                total(Attendance.overtime_hours)
+            ).where(
+                Attendance.employee_id.in_(ids),
+                Attendance.date >= start_date,
+                Attendance.date < end_date
+            ).group_by(Attendance.employee_id)
+        )
+        for employee_id, present, absent, hours, overtime in rows:
+            aggregates[employee_id] = (int(present), int(absent), hours, overtime)
+    return aggregates
+
+
+def calculate_batch(month, year, employee_ids, connection=None):
+    """Calculate payroll data for many employees; returns {employee_id: payroll_data}
+
+    Costs two grouped queries per chunk of employees instead of two queries
+    per employee; tests/test_payroll_engine.py checks it against the
+    per-employee calculation.
+    """
+    conn = connection if connection is not None else db.session
+    employee_ids = {int(employee_id) for employee_id in employee_ids}
+    aggregates = attendance_aggregates(month, year, employee_ids, conn)
+
+    results = {}
+    for ids in _chunks(employee_ids):
+        rows = conn.execute(
+            select(Employee.id, Employee.salary, Employee.allowance).where(Employee.id.in_(ids))
+        )
+        for employee_id, salary, allowance in rows:
+            working_days, absent_days, _, overtime_hours = aggregates.get(employee_id, (0, 0, 0, 0))
+            results[employee_id] = payroll_components(
+                salary, allowance, working_days, absent_days, overtime_hours
+            )
+    return results
+
+
+def existing_payrolls(month, year, employee_ids, connection=None):
+    """Employee ids in `employee_ids` that already have a payroll for the period"""
+    conn = connection if connection is not None else db.session
+    existing = set()
+    for ids in _chunks(employee_ids):
+        existing.update(conn.execute(
+            select(Payroll.employee_id).where(
+                Payroll.month == month,
+                Payroll.year == year,
+                Payroll.employee_id.in_(ids)
+            )
+        ).scalars())
+    return existing
+
+
+def payroll_rows(month, year, results):
+    return [dict(data, employee_id=employee_id, month=month, year=year)
+            for employee_id, data in sorted(results.items())]
+
+
+def insert_payrolls(month, year, rows):
+    """Bulk-insert payroll rows of a period, leaving out employees that already have one
+
+    The unique (employee_id, year, month) constraint turns a generation of
+    the same period that ran at the same time into an IntegrityError; the
+    chunk is then rolled back to its savepoint and retried without the
+    employees whose payroll now exists. Returns the employee ids inserted.
+    """
+    inserted = []
+    for i in range(0, len(rows), IN_CHUNK):
+        chunk = rows[i:i + IN_CHUNK]
+        while chunk:
+            try:
+                with db.session.begin_nested():
+                    db.session.execute(insert(Payroll), chunk)
+            except IntegrityError:
+                existing = existing_payrolls(month, year, [row['employee_id'] for row in chunk])
+                if not existing:
+                    raise
+                chunk = [row for row in chunk if row['employee_id'] not in existing]
+                continue
+            inserted.extend(row['employee_id'] for row in chunk)
+            break
+    return inserted
+
+
+def generate_payrolls(month, year, employee_ids):
+    """Create the missing payrolls of a period in bulk; the caller commits
+
+    Returns (created_keys, skipped_ids, missing_ids): rollup keys of the new
+    payrolls, employees that already had one, and ids with no employee row.
+    """
+    employee_ids = {int(employee_id) for employee_id in employee_ids}
+    skipped_ids = existing_payrolls(month, year, employee_ids)
+    pending_ids = employee_ids - skipped_ids
+
+    results = calculate_batch(month, year, pending_ids)
+    missing_ids = pending_ids - set(results)
+
+    created_ids = insert_payrolls(month, year, payroll_rows(month, year, results))
+    skipped_ids |= set(results) - set(created_ids)
+
+    created_keys = [(employee_id, year, month) for employee_id in sorted(created_ids)]
+    return created_keys, sorted(skipped_ids), sorted(missing_ids)
+
+
+# Parallel mode: the calculation runs in a process pool, one task per
+# department (large departments are split), and the parent writes each
+# shard back with one bulk insert.
+
+_shard_engines = {}
+
+
+def _shard_engine(database_uri, engine_options):
+    engine = _shard_engines.get(database_uri)
+    if engine is None:
+        engine = _shard_engines[database_uri] = create_engine(database_uri, **engine_options)
+    return engine
+
+
+def compute_shard(database_uri, engine_options, month, year, employee_ids):
+    """Process pool entry point: payroll rows for one shard, read over the worker's own engine"""
+    with _shard_engine(database_uri, engine_options).connect() as conn:
+        return payroll_rows(month, year, calculate_batch(month, year, employee_ids, conn))
+
+
+def department_shards(employee_ids, max_size):
+    """Group employee ids by department_id, splitting departments larger than max_size"""
+    departments = {}
+    for ids in _chunks(employee_ids):
+        rows = db.session.execute(
+            select(Employee.id, Employee.department_id).where(Employee.id.in_(ids))
+        )
+        for employee_id, department_id in rows:
+            departments.setdefault(department_id, []).append(employee_id)
+
+    shards = []
+    for ids in departments.values():
+        ids.sort()
+        shards.extend(ids[i:i + max_size] for i in range(0, len(ids), max_size))
+    # Largest shards first so the pool is not left waiting on a big one at the end
+    shards.sort(key=len, reverse=True)
+    return shards
+
+
+def generate_payrolls_parallel(month, year, employee_ids, workers):
+    """generate_payrolls with the calculation spread over `workers` processes; the caller commits"""
+    if workers <= 1:
+        return generate_payrolls(month, year, employee_ids)
+
+    employee_ids = {int(employee_id) for employee_id in employee_ids}
+    skipped_ids = existing_payrolls(month, year, employee_ids)
+    pending_ids = employee_ids - skipped_ids
+
+    shards = department_shards(pending_ids, max(IN_CHUNK, -(-len(pending_ids) // workers)))
+    missing_ids = pending_ids - {employee_id for shard in shards for employee_id in shard}
+
+    database_uri = db.engine.url.render_as_string(hide_password=False)
+    engine_options = current_app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {})
+    # spawn, not fork: the web process has pooled connections and job threads
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(workers, mp_context=context) as pool:
+        futures = [pool.submit(compute_shard, database_uri, engine_options, month, year, shard)
+                   for shard in shards]
+        shard_rows = [future.result() for future in as_completed(futures)]
+
+    # Write only once every worker has finished reading, so this transaction
+    # never holds write locks that the workers' reads would wait on
+    created_ids = []
+    for rows in shard_rows:
+        created_ids.extend(insert_payrolls(month, year, rows))
+    skipped_ids |= {row['employee_id'] for rows in shard_rows for row in rows} - set(created_ids)
+
+    created_keys = [(employee_id, year, month) for employee_id in sorted(created_ids)]
+    return created_keys, sorted(skipped_ids), sorted(missing_ids)
+
+
+def run_payroll(month, year, workers):
+    """Generate and commit the missing payrolls of a period for every active employee"""
+    employee_ids = db.session.execute(select(Employee.id).where(Employee.is_active == True)).scalars().all()
+    created_keys, skipped_ids, missing_ids = generate_payrolls_parallel(month, year, employee_ids, workers)
+    changes.payroll_changed(created_keys)
+    db.session.commit()
+    return created_keys, skipped_ids, missing_ids
+
+
+def recompute_dirty():
+    """Recalculate every queued non-paid payroll in one batch; the caller commits
+
+    Attendance-derived fields are replaced, a manually entered bonus is kept.
+    Returns (recomputed, skipped): skipped marks belonged to payrolls that
+    were paid or deleted in the meantime.
+    """
+    marks = payroll_dirty.queued()
+    periods = {}
+    for mark in marks:
+        periods.setdefault((mark.year, mark.month), set()).add(mark.employee_id)
+
+    now = datetime.utcnow()
+    updates = []
+    keys = []
+    for (year, month), employee_ids in sorted(periods.items()):
+        payrolls = []
+        for ids in _chunks(employee_ids):
+            payrolls.extend(db.session.execute(
+                select(Payroll.id, Payroll.employee_id, Payroll.bonus).where(
+                    Payroll.year == year,
+                    Payroll.month == month,
+                    Payroll.employee_id.in_(ids),
+                    Payroll.status != 'paid'
+                )
+            ))
+
+        results = calculate_batch(month, year, [employee_id for _, employee_id, _ in payrolls])
+        for payroll_id, employee_id, bonus in payrolls:
+            data = results.get(employee_id)
+            if data is None:
+                continue
+            bonus = bonus or 0
+            updates.append(dict(data, id=payroll_id, bonus=bonus, updated_at=now,
+                                total_salary=round(data['total_salary'] + bonus, 2)))
+            keys.append((employee_id, year, month))
+
+    for i in range(0, len(updates), IN_CHUNK):
+        db.session.execute(update(Payroll), updates[i:i + IN_CHUNK])
+    payroll_dirty.dequeue(marks)
+    changes.payroll_changed(keys)
+    return len(updates), len(marks) - len(updates)
+
+
+@jobs.handler('payroll.generate')
+def generate_payrolls_job(params, employee_ids):
+    created_keys, skipped_ids, missing_ids = generate_payrolls(params['month'], params['year'], employee_ids)
+    changes.payroll_changed(created_keys)
+    return {'created': len(created_keys), 'skipped': len(skipped_ids), 'failed': len(missing_ids)}
@@ -0,0 +1,133 @@
+"""What-if payroll simulation: payroll_components' formula evaluated on NumPy arrays
+
+The inputs of a period (salary, allowance and attendance aggregates of every
+active employee, plus their stored payroll total) are loaded once and cached
+by data version; each scenario is then pure array arithmetic.
+"""
+from models import db, Employee, Payroll, Department, AttendanceRollup
+from services import cache
+from services.payroll_engine import WORKING_DAYS_PER_MONTH, HOURS_PER_DAY, OVERTIME_RATE
+import numpy as np
+
+DEFAULT_PARAMS = {
+    'working_days_per_month': WORKING_DAYS_PER_MONTH,
+    'hours_per_day': HOURS_PER_DAY,
+    'overtime_rate': OVERTIME_RATE,
+    'allowance_multiplier': 1.0,
+    'bonus': 0.0
+}
+MAX_SCENARIOS = 50
+NO_DEPARTMENT = -1
+
+
+def _build_inputs(month, year):
+    employees = db.session.query(
+        Employee.id, Employee.department_id, Employee.salary, Employee.allowance
+    ).filter(Employee.is_active == True).order_by(Employee.id).all()
+
+    # Per-employee attendance sums come pre-aggregated from the monthly rollup
+    aggregates = {
+        employee_id: (present, absent, overtime)
+        for employee_id, present, absent, overtime in db.session.query(
+            AttendanceRollup.employee_id,
+            AttendanceRollup.present_days,
+            AttendanceRollup.absent_days,
+            AttendanceRollup.overtime_hours
+        ).filter(AttendanceRollup.year == year, AttendanceRollup.month == month)
+    }
+    stored = dict(db.session.query(Payroll.employee_id, Payroll.total_salary).filter(
+        Payroll.month == month, Payroll.year == year
+    ))
+
+    count = len(employees)
+    inputs = {
+        'employee_id': np.fromiter((e[0] for e in employees), dtype=np.int64, count=count),
+        'department_id': np.fromiter(
+            (NO_DEPARTMENT if e[1] is None else e[1] for e in employees), dtype=np.int64, count=count
+        ),
+        'salary': np.fromiter((e[2] or 0 for e in employees), dtype=np.float64, count=count),
+        'allowance': np.fromiter((e[3] or 0 for e in employees), dtype=np.float64, count=count),
+        'stored_total': np.fromiter(
+            (np.nan if stored.get(e[0]) is None else stored[e[0]] for e in employees),
+            dtype=np.float64, count=count
+        )
+    }
+    attendance = np.array([aggregates.get(e[0], (0, 0, 0)) for e in employees],
+                          dtype=np.float64).reshape(count, 3)
+    inputs['working_days'], inputs['absent_days'], inputs['overtime_hours'] = attendance.T.copy()
+    inputs['departments'] = dict(db.session.query(Department.id, Department.name))
+    return inputs
+
+
+def load_inputs(month, year):
+    """Period inputs as arrays, rebuilt only when employees, attendance or payrolls change"""
+    return cache.cached('payroll_simulation', ('employees', 'departments', 'attendances', 'payrolls'),
+                        (month, year), lambda: _build_inputs(month, year))
+
+
+def scenario_params(overrides):
+    """DEFAULT_PARAMS updated with validated overrides; raises ValueError"""
+    unknown = set(overrides) - set(DEFAULT_PARAMS)
+    if unknown:
+        raise ValueError(f'Unknown parameter(s): {", ".join(sorted(unknown))}')
+
+    params = dict(DEFAULT_PARAMS)
+    for name, value in overrides.items():
+        try:
+            params[name] = float(value)
+        except (TypeError, ValueError):
+            raise ValueError(f'{name} must be a number')
+        if params[name] < 0:
+            raise ValueError(f'{name} must not be negative')
+    if params['working_days_per_month'] == 0 or params['hours_per_day'] == 0:
+        raise ValueError('working_days_per_month and hours_per_day must be positive')
+    return params
+
+
+def simulate(inputs, params, limit=100):
+    """Totals per department and the largest per-employee deltas against stored payrolls"""
+    daily_salary = inputs['salary'] / params['working_days_per_month']
+    basic_salary = daily_salary * inputs['working_days']
+    overtime_pay = inputs['overtime_hours'] * (daily_salary / params['hours_per_day']) * params['overtime_rate']
+    deductions = inputs['absent_days'] * daily_salary
+    allowance = inputs['allowance'] * params['allowance_multiplier']
+    total_salary = np.round(basic_salary + allowance + overtime_pay + params['bonus'] - deductions, 2)
+
+    has_payroll = ~np.isnan(inputs['stored_total'])
+    delta = np.where(has_payroll, total_salary - inputs['stored_total'], 0.0)
+
+    department_ids, department_index = np.unique(inputs['department_id'], return_inverse=True)
+    headcount = np.bincount(department_index, minlength=len(department_ids))
+    department_totals = np.bincount(department_index, weights=total_salary, minlength=len(department_ids))
+    department_deltas = np.bincount(department_index, weights=delta, minlength=len(department_ids))
+
+    departments = []
+    for i, department_id in enumerate(department_ids.tolist()):
+        departments.append({
+            'department_id': None if department_id == NO_DEPARTMENT else department_id,
+            'name': inputs['departments'].get(department_id),
+            'employees': int(headcount[i]),
+            'total_salary': round(float(department_totals[i]), 2),
+            'delta': round(float(department_deltas[i]), 2)
+        })
+
+    changed = np.flatnonzero(has_payroll & (np.abs(delta) >= 0.005))
+    order = changed[np.argsort(-np.abs(delta[changed]), kind='stable')]
+    if limit:
+        order = order[:limit]
+
+    return {
+        'params': params,
+        'employees': int(len(total_salary)),
+        'total_salary': round(float(total_salary.sum()), 2),
+        'stored_total_salary': round(float(inputs['stored_total'][has_payroll].sum()), 2),
+        'delta': round(float(delta.sum()), 2),
+        'changed_employees': int(len(changed)),
+        'departments': departments,
+        'deltas': [{
+            'employee_id': int(inputs['employee_id'][i]),
+            'stored': float(inputs['stored_total'][i]),
+            'simulated': float(total_salary[i]),
+            'delta': round(float(delta[i]), 2)
+        } for i in order.tolist()]
+    }
@@ -0,0 +1,30 @@
+from datetime import date
+from sqlalchemy import and_, or_
+
+
+def next_month(year, month):
+    return (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+def month_range(year, month):
+    """Return the half-open [start, end) date range covering a calendar month"""
+    return date(year, month, 1), date(*next_month(year, month), 1)
+
+
+def recent_months(year, month, count):
+    """Return the last `count` (year, month) periods ending with the given one, oldest first"""
+    periods = []
+    for _ in range(count):
+        periods.append((year, month))
+        year, month = (year - 1, 12) if month == 1 else (year, month - 1)
+    periods.reverse()
+    return periods
+
+
+def period_between(year_column, month_column, start, end):
+    """Rows whose (year, month) columns fall from start to end inclusive, both (year, month)"""
+    (start_year, start_month), (end_year, end_month) = start, end
+    return and_(
+        or_(year_column > start_year, and_(year_column == start_year, month_column >= start_month)),
+        or_(year_column < end_year, and_(year_column == end_year, month_column <= end_month))
+    )
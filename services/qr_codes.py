@@ -0,0 +1,111 @@
+"""Cached PNG rendering of the attendance QR codes
+
+A code only changes when the URL it encodes changes (each QR token
+window), so each image is rendered once per URL and kept in memory and in
+QR_CACHE_DIR, shared by every worker and surviving restarts. The sha256 of
+the URL names the file and doubles as the HTTP ETag.
+"""
+from flask import current_app
+from collections import OrderedDict
+from io import BytesIO
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+import qrcode
+
+logger = logging.getLogger(__name__)
+
+MEMORY_ENTRIES = 8
+KEEP_SECONDS = 3600
+
+_memory = OrderedDict()
+_lock = threading.Lock()
+_rendering = set()
+
+
+def etag_for(url):
+    return hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+
+def _render(url):
+    img = qrcode.make(url)
+    buf = BytesIO()
+    img.save(buf, format='PNG')
+    return buf.getvalue()
+
+
+def _remember(etag, png):
+    with _lock:
+        _memory[etag] = png
+        _memory.move_to_end(etag)
+        while len(_memory) > MEMORY_ENTRIES:
+            _memory.popitem(last=False)
+
+
+def _prune(directory):
+    cutoff = time.time() - KEEP_SECONDS
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except OSError:
+            pass
+
+
+def _load_or_render(directory, url):
+    etag = etag_for(url)
+    path = os.path.join(directory, f'{etag}.png')
+    try:
+        with open(path, 'rb') as f:
+            png = f.read()
+    except OSError:
+        png = _render(url)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(png)
+        os.replace(tmp_path, path)
+        _prune(directory)
+    _remember(etag, png)
+    return png, etag
+
+
+def _directory():
+    directory = current_app.config['QR_CACHE_DIR']
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+
+def qr_png(url):
+    """PNG bytes and ETag of the QR code for `url`, rendered at most once per host"""
+    etag = etag_for(url)
+    with _lock:
+        png = _memory.get(etag)
+        if png is not None:
+            _memory.move_to_end(etag)
+            return png, etag
+    return _load_or_render(_directory(), url)
+
+
+def prerender(url):
+    """Render `url` in a background thread unless it is cached already"""
+    etag = etag_for(url)
+    directory = _directory()
+    with _lock:
+        if etag in _memory or etag in _rendering or os.path.exists(os.path.join(directory, f'{etag}.png')):
+            return
+        _rendering.add(etag)
+
+    def run():
+        try:
+            _load_or_render(directory, url)
+        except Exception:
+            logger.exception('Pre-rendering QR code for %s failed', url)
+        finally:
+            with _lock:
+                _rendering.discard(etag)
+
+    threading.Thread(target=run, name='qr-prerender', daemon=True).start()
@@ -0,0 +1,94 @@
+"""Short-lived signed tokens and employee PINs for QR self check-in
+
+A token is the number of the current QR_TOKEN_SECONDS window plus a
+truncated HMAC-SHA256 of it under a key derived from SECRET_KEY. Issuing and
+verifying are pure CPU, with no database or session access, and a token stops
+verifying one window after the screen has moved on to the next one.
+
+PINs are stored as a per-employee salt and an HMAC-SHA256 of salt and PIN
+under another SECRET_KEY-derived key: microseconds to check, so a morning
+crowd costs nothing, and useless without the server secret. Guessing is
+limited by the self check-in failure backoff, not by a slow hash.
+"""
+from flask import current_app
+import base64
+import hashlib
+import hmac
+import secrets
+import time
+
+SIGNATURE_BYTES = 12
+PIN_SALT_BYTES = 8
+GRACE_WINDOWS = 1  # the code a phone scanned just before the screen rotated
+
+_keys = {}
+
+
+def _key(purpose=b'attendance.qr_token'):
+    secret = current_app.config['SECRET_KEY']
+    key = _keys.get((secret, purpose))
+    if key is None:
+        key = _keys[(secret, purpose)] = hmac.new(str(secret).encode('utf-8'), purpose, hashlib.sha256).digest()
+    return key
+
+
+def _signature(window):
+    digest = hmac.new(_key(), str(window).encode('ascii'), hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest[:SIGNATURE_BYTES]).decode('ascii')
+
+
+def current_window(now=None):
+    return int((time.time() if now is None else now) // current_app.config['QR_TOKEN_SECONDS'])
+
+
+def seconds_left(now=None):
+    """Seconds until the current token is replaced on screen"""
+    now = time.time() if now is None else now
+    period = current_app.config['QR_TOKEN_SECONDS']
+    return max(int(period - now % period), 1)
+
+
+def issue(window=None):
+    window = current_window() if window is None else window
+    return f'{window}.{_signature(window)}'
+
+
+def token_window(token):
+    """The window `token` was issued for if it is still valid, else None
+
+    A window is accepted from the current one or the grace period before it.
+    Self check-in records the window per employee, which makes each token
+    single-use for that employee.
+    """
+    if not token:
+        return None
+    window, _, signature = token.partition('.')
+    try:
+        window = int(window)
+    except ValueError:
+        return None
+    if not 0 <= current_window() - window <= GRACE_WINDOWS:
+        return None
+    return window if hmac.compare_digest(signature, _signature(window)) else None
+
+
+def verify(token):
+    """True if `token` was issued for the current window or the grace period before it"""
+    return token_window(token) is not None
+
+
+def _pin_digest(salt, pin):
+    return hmac.new(_key(b'attendance.checkin_pin'), f'{salt}:{pin}'.encode('utf-8'), hashlib.sha256).hexdigest()
+
+
+def pin_hash(pin):
+    """Stored form of a self check-in PIN: 'salt$hmac'"""
+    salt = secrets.token_hex(PIN_SALT_BYTES)
+    return f'{salt}${_pin_digest(salt, pin)}'
+
+
+def check_pin(stored, pin):
+    """True if `pin` matches `stored`; None (no employee or no PIN) costs the same and is False"""
+    salt, _, digest = (stored or '').partition('$')
+    matches = hmac.compare_digest(digest, _pin_digest(salt, pin))
+    return stored is not None and matches
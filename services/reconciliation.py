@@ -0,0 +1,187 @@
+"""Reconcile payments against a bank statement (CSV or XLSX)
+
+The payments a statement can refer to, those dated within
+RECONCILE_LOOKBACK_DAYS, are loaded with one query into two hash indexes:
+by reference_number, and by (employee code, amount in cents, payment date)
+for lines the bank sent without our reference. The statement is then
+streamed line by line with a dictionary lookup each, the resulting status
+changes are applied with one UPDATE per status and chunk of ids, and lines
+that matched nothing, or a reference several payments share, are written
+to a report.
+"""
+from flask import current_app
+from models import db, Employee, Payment
+from services import changes, uploads
+from services.rollups import period_key
+from services.uploads import cell, parse_date
+from datetime import date, timedelta
+from sqlalchemy import select, update
+import csv
+import os
+
+IN_CHUNK = 1000
+
+# Accepted header names for each field
+COLUMNS = {
+    'reference_number': ('reference_number', 'reference', 'ref', 'transaction_reference'),
+    'employee_code': ('employee_id', 'employee_code', 'code', 'beneficiary_code'),
+    'amount': ('amount', 'credit', 'debit'),
+    'date': ('date', 'value_date', 'transaction_date', 'payment_date'),
+    'status': ('status', 'result')
+}
+REQUIRED_COLUMNS = ('amount', 'date')
+
+# Bank line status -> payment status; lines without a status are settled
+BANK_STATUSES = {
+    '': 'completed',
+    'success': 'completed',
+    'successful': 'completed',
+    'completed': 'completed',
+    'ok': 'completed',
+    'paid': 'completed',
+    'failed': 'failed',
+    'rejected': 'failed',
+    'returned': 'failed',
+    'error': 'failed'
+}
+UNMATCHED_HEADERS = ['Line', 'Reference', 'Employee ID', 'Amount', 'Date', 'Reason']
+UNMATCHED_FILE = 'unmatched.csv'
+
+
+def _cents(amount):
+    return int(round(float(amount) * 100))
+
+
+def _parse_amount(value):
+    # Debit statements show outgoing transfers as negative amounts
+    try:
+        return abs(_cents(value.replace(',', '').replace(' ', '')))
+    except ValueError:
+        raise ValueError(f'Invalid amount {value!r}')
+
+
+def build_index(since):
+    """Hash indexes of the payments dated on or after `since`, from one query
+
+    Returns ({reference_number: [payments]}, {(employee code, cents, date): [payments]}).
+    A reference shared by several payments is ambiguous; _match refuses it.
+    """
+    rows = db.session.execute(
+        select(Payment.id, Payment.employee_id, Payment.amount, Payment.payment_date,
+               Payment.reference_number, Payment.status, Employee.employee_id.label('employee_code'))
+        .join(Employee, Employee.id == Payment.employee_id)
+        .where(Payment.payment_date >= since)
+        .order_by(Payment.id)
+    ).all()
+
+    by_reference = {}
+    by_details = {}
+    for row in rows:
+        if row.reference_number:
+            by_reference.setdefault(row.reference_number, []).append(row)
+        by_details.setdefault((row.employee_code, _cents(row.amount), row.payment_date), []).append(row)
+    return by_reference, by_details
+
+
+def _match(line, by_reference, by_details, matched):
+    """The payment a statement line settles, or raise ValueError with the reason"""
+    reference = line['reference_number']
+    if reference:
+        payments = by_reference.get(reference)
+        if payments and len(payments) > 1:
+            ids = ', '.join(f'#{payment.id}' for payment in payments)
+            raise ValueError(f'Reference shared by payments {ids}')
+        if payments:
+            payment = payments[0]
+            if payment.id in matched:
+                raise ValueError('Payment already matched by an earlier line')
+            if _cents(payment.amount) != line['amount']:
+                raise ValueError(f'Amount differs from payment #{payment.id}')
+            return payment
+
+    key = (line['employee_code'], line['amount'], line['date'])
+    candidates = [payment for payment in by_details.get(key, ()) if payment.id not in matched]
+    # A reference we do not know must not be matched to someone else's payment by details
+    if reference:
+        candidates = [payment for payment in candidates if not payment.reference_number]
+    if not candidates:
+        raise ValueError('No matching payment')
+    return candidates[0]
+
+
+def _apply(statuses, references):
+    """Bulk-apply {payment id: new status} and {payment id: reference}"""
+    by_status = {}
+    for payment_id, status in statuses.items():
+        by_status.setdefault(status, []).append(payment_id)
+    for status, ids in by_status.items():
+        ids.sort()
+        for i in range(0, len(ids), IN_CHUNK):
+            db.session.execute(
+                update(Payment).where(Payment.id.in_(ids[i:i + IN_CHUNK]))
+                .values(status=status).execution_options(synchronize_session=False)
+            )
+    # Lines matched by details teach us the bank's reference for the payment
+    rows = [{'id': payment_id, 'reference_number': reference} for payment_id, reference in references.items()]
+    for i in range(0, len(rows), IN_CHUNK):
+        db.session.execute(update(Payment), rows[i:i + IN_CHUNK])
+
+
+def reconcile(directory, path):
+    """Match a statement to payments and apply the status changes; the caller commits
+
+    Returns counters; unmatched lines are written to UNMATCHED_FILE in `directory`.
+    """
+    since = date.today() - timedelta(days=current_app.config['RECONCILE_LOOKBACK_DAYS'])
+    by_reference, by_details = build_index(since)
+
+    rows = uploads.iter_rows(path)
+    columns = uploads.column_map(next(rows, []), COLUMNS, REQUIRED_COLUMNS)
+
+    matched = set()
+    statuses = {}
+    references = {}
+    period_keys = set()
+    counters = {'lines': 0, 'matched': 0, 'updated': 0, 'unchanged': 0, 'unmatched': 0}
+
+    with open(os.path.join(directory, UNMATCHED_FILE), 'w', encoding='utf-8-sig', newline='') as f:
+        report = csv.writer(f)
+        report.writerow(UNMATCHED_HEADERS)
+        for line_number, row in enumerate(rows, 2):
+            if not any(value.strip() for value in row):
+                continue
+            counters['lines'] += 1
+            raw = {field: cell(row, columns, field) for field in COLUMNS}
+            try:
+                bank_status = raw['status'].lower()
+                if bank_status not in BANK_STATUSES:
+                    raise ValueError(f'Unknown status {raw["status"]}')
+                line = {
+                    'reference_number': raw['reference_number'],
+                    'employee_code': raw['employee_code'],
+                    'amount': _parse_amount(raw['amount']),
+                    'date': parse_date(raw['date'])
+                }
+                payment = _match(line, by_reference, by_details, matched)
+            except ValueError as e:
+                counters['unmatched'] += 1
+                report.writerow([line_number, raw['reference_number'], raw['employee_code'],
+                                 raw['amount'], raw['date'], str(e)])
+                continue
+
+            matched.add(payment.id)
+            counters['matched'] += 1
+            status = BANK_STATUSES[bank_status]
+            if payment.status == status:
+                counters['unchanged'] += 1
+            else:
+                statuses[payment.id] = status
+                period_keys.add(period_key(payment.employee_id, payment.payment_date))
+            if line['reference_number'] and not payment.reference_number:
+                references[payment.id] = line['reference_number']
+
+    _apply(statuses, references)
+    counters['updated'] = len(statuses)
+    changes.payments_changed(sorted(period_keys))
+    return counters
+
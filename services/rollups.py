@@ -0,0 +1,226 @@
+from models import (db, Employee, Attendance, Payroll, Payment,
+                    AttendanceRollup, PayrollRollup, PaymentRollup)
+from services.periods import month_range
+from services.sql import total, total_if
+from sqlalchemy import delete, func, insert, select
+
+IN_CHUNK = 500
+
+
+def period_key(employee_id, day):
+    """Rollup key of an attendance or payment row: (employee_id, year, month)"""
+    return int(employee_id), day.year, day.month
+
+
+def _group_by_period(keys):
+    periods = {}
+    for employee_id, year, month in keys:
+        periods.setdefault((int(year), int(month)), set()).add(int(employee_id))
+    return periods
+
+
+def _chunks(ids, size=IN_CHUNK):
+    ids = sorted(ids)
+    for i in range(0, len(ids), size):
+        yield ids[i:i + size]
+
+
+def _replace(rollup, year, month, employee_ids, rows):
+    db.session.execute(
+        delete(rollup).where(
+            rollup.year == year,
+            rollup.month == month,
+            rollup.employee_id.in_(employee_ids)
+        )
+    )
+    if rows:
+        db.session.execute(insert(rollup), rows)
+
+
+# Grouped aggregates over the raw tables, one row per employee
+
+def _attendance_columns():
+    return [
+        Attendance.employee_id,
+        Employee.department_id,
+        func.count(Attendance.id),
+        total_if(Attendance.status == 'present'),
+        total_if(Attendance.status == 'absent'),
+        total(Attendance.total_hours),
+        total(Attendance.overtime_hours)
+    ]
+
+
+def _payroll_columns():
+    return [
+        Payroll.employee_id,
+        Employee.department_id,
+        func.count(Payroll.id),
+        total_if(Payroll.status == 'paid'),
+        total(Payroll.basic_salary),
+        total(Payroll.allowance),
+        total(Payroll.overtime_pay),
+        total(Payroll.bonus),
+        total(Payroll.deductions),
+        total(Payroll.total_salary),
+        total(Payroll.overtime_hours)
+    ]
+
+
+def _payment_columns():
+    return [
+        Payment.employee_id,
+        Employee.department_id,
+        func.count(Payment.id),
+        total(Payment.amount),
+        total_if(Payment.status == 'completed'),
+        total_if(Payment.status == 'completed', Payment.amount),
+        total_if(Payment.status == 'pending'),
+        total_if(Payment.status == 'pending', Payment.amount),
+        total_if(Payment.status == 'failed'),
+        total_if(Payment.status == 'failed', Payment.amount)
+    ]
+
+
+ATTENDANCE_FIELDS = ['employee_id', 'department_id', 'records', 'present_days', 'absent_days',
+                     'total_hours', 'overtime_hours']
+PAYROLL_FIELDS = ['employee_id', 'department_id', 'payrolls', 'paid_payrolls', 'basic_salary',
+                  'allowance', 'overtime_pay', 'bonus', 'deductions', 'total_salary', 'overtime_hours']
+PAYMENT_FIELDS = ['employee_id', 'department_id', 'payments', 'total_amount',
+                  'completed_count', 'completed_amount', 'pending_count', 'pending_amount',
+                  'failed_count', 'failed_amount']
+
+
+def _rows(fields, result, year, month):
+    return [dict(zip(fields, row), year=year, month=month) for row in result]
+
+
+def _refresh(rollup, fields, query, employee_column, employee_ids, year, month):
+    """Recompute the rollup rows of `employee_ids` from the period's grouped `query`
+
+    Up to IN_CHUNK employees are aggregated with one IN query per chunk; when
+    more changed (a pay run, a bulk import), one grouped scan of the whole
+    period replaces the per-chunk queries.
+    """
+    if len(employee_ids) <= IN_CHUNK:
+        ids = sorted(employee_ids)
+        result = query.filter(employee_column.in_(ids)).all()
+        _replace(rollup, year, month, ids, _rows(fields, result, year, month))
+        return
+
+    by_employee = {}
+    for row in _rows(fields, query.all(), year, month):
+        by_employee[row['employee_id']] = row
+    for ids in _chunks(employee_ids):
+        _replace(rollup, year, month, ids,
+                 [by_employee[employee_id] for employee_id in ids if employee_id in by_employee])
+
+
+def refresh_attendance(keys):
+    """Recompute the attendance rollup rows for the given (employee_id, year, month) keys"""
+    for (year, month), employee_ids in _group_by_period(keys).items():
+        start, end = month_range(year, month)
+        query = db.session.query(*_attendance_columns()).join(
+            Employee, Attendance.employee_id == Employee.id
+        ).filter(
+            Attendance.date >= start,
+            Attendance.date < end
+        ).group_by(Attendance.employee_id, Employee.department_id)
+        _refresh(AttendanceRollup, ATTENDANCE_FIELDS, query, Attendance.employee_id, employee_ids, year, month)
+
+
+def refresh_payroll(keys):
+    """Recompute the payroll rollup rows for the given (employee_id, year, month) keys"""
+    for (year, month), employee_ids in _group_by_period(keys).items():
+        query = db.session.query(*_payroll_columns()).join(
+            Employee, Payroll.employee_id == Employee.id
+        ).filter(
+            Payroll.year == year,
+            Payroll.month == month
+        ).group_by(Payroll.employee_id, Employee.department_id)
+        _refresh(PayrollRollup, PAYROLL_FIELDS, query, Payroll.employee_id, employee_ids, year, month)
+
+
+def refresh_payments(keys):
+    """Recompute the payment rollup rows for the given (employee_id, year, month) keys"""
+    for (year, month), employee_ids in _group_by_period(keys).items():
+        start, end = month_range(year, month)
+        query = db.session.query(*_payment_columns()).join(
+            Employee, Payment.employee_id == Employee.id
+        ).filter(
+            Payment.payment_date >= start,
+            Payment.payment_date < end
+        ).group_by(Payment.employee_id, Employee.department_id)
+        _refresh(PaymentRollup, PAYMENT_FIELDS, query, Payment.employee_id, employee_ids, year, month)
+
+
+def _rebuild_table(rollup, fields, columns, model, period_column, join_column):
+    if period_column is None:
+        year, month = model.year, model.month
+    else:
+        year = func.extract('year', period_column)
+        month = func.extract('month', period_column)
+
+    source = select(year, month, *columns, func.current_timestamp()).join(
+        Employee, join_column == Employee.id
+    ).group_by(year, month, model.employee_id, Employee.department_id)
+
+    db.session.execute(delete(rollup))
+    db.session.execute(
+        insert(rollup).from_select(['year', 'month'] + fields + ['updated_at'], source)
+    )
+
+
+def rebuild():
+    """Recompute every rollup table from scratch with one INSERT ... SELECT per table"""
+    _rebuild_table(AttendanceRollup, ATTENDANCE_FIELDS, _attendance_columns(),
+                   Attendance, Attendance.date, Attendance.employee_id)
+    _rebuild_table(PayrollRollup, PAYROLL_FIELDS, _payroll_columns(),
+                   Payroll, None, Payroll.employee_id)
+    _rebuild_table(PaymentRollup, PAYMENT_FIELDS, _payment_columns(),
+                   Payment, Payment.payment_date, Payment.employee_id)
+    db.session.commit()
+
+
+# Readers used by the dashboard and report pages
+
+def attendance_totals(year, month):
+    row = db.session.query(
+        total(AttendanceRollup.records),
+        total(AttendanceRollup.total_hours),
+        total(AttendanceRollup.overtime_hours)
+    ).filter(AttendanceRollup.year == year, AttendanceRollup.month == month).one()
+    return {'records': int(row[0]), 'total_hours': row[1], 'overtime_hours': row[2]}
+
+
+def payroll_totals(year, month):
+    row = db.session.query(
+        total(PayrollRollup.payrolls),
+        total(PayrollRollup.paid_payrolls),
+        total(PayrollRollup.basic_salary),
+        total(PayrollRollup.allowance),
+        total(PayrollRollup.overtime_pay),
+        total(PayrollRollup.bonus),
+        total(PayrollRollup.deductions),
+        total(PayrollRollup.total_salary),
+        total(PayrollRollup.overtime_hours)
+    ).filter(PayrollRollup.year == year, PayrollRollup.month == month).one()
+    return dict(zip(PAYROLL_FIELDS[2:], row), payrolls=int(row[0]), paid_payrolls=int(row[1]))
+
+
+def payment_totals(year, month):
+    row = db.session.query(
+        total(PaymentRollup.payments),
+        total(PaymentRollup.total_amount),
+        total(PaymentRollup.completed_count),
+        total(PaymentRollup.completed_amount),
+        total(PaymentRollup.pending_count),
+        total(PaymentRollup.pending_amount),
+        total(PaymentRollup.failed_count),
+        total(PaymentRollup.failed_amount)
+    ).filter(PaymentRollup.year == year, PaymentRollup.month == month).one()
+    totals = dict(zip(PAYMENT_FIELDS[2:], row))
+    for field in ('payments', 'completed_count', 'pending_count', 'failed_count'):
+        totals[field] = int(totals[field])
+    return totals
+
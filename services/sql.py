@@ -0,0 +1,43 @@
+from sqlalchemy import Float, case, func
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+
+
+def total(column):
+    """SUM that yields 0 instead of NULL on an empty group"""
+    return func.coalesce(func.sum(column), 0)
+
+
+def total_if(condition, value=1):
+    """Conditional SUM, e.g. count or amount of rows with a given status"""
+    return func.coalesce(func.sum(case((condition, value), else_=0)), 0)
+
+
+class hours_between(FunctionElement):
+    """Hours from datetime `start` to datetime `end` as a float, compiled per dialect"""
+    type = Float()
+    name = 'hours_between'
+    inherit_cache = True
+
+
+def _hours_operands(element, compiler, **kw):
+    start, end = element.clauses
+    return compiler.process(start, **kw), compiler.process(end, **kw)
+
+
+@compiles(hours_between)
+def _hours_between(element, compiler, **kw):
+    start, end = _hours_operands(element, compiler, **kw)
+    return f'EXTRACT(EPOCH FROM ({end} - {start})) / 3600.0'
+
+
+@compiles(hours_between, 'mysql')
+def _hours_between_mysql(element, compiler, **kw):
+    start, end = _hours_operands(element, compiler, **kw)
+    return f'TIMESTAMPDIFF(MICROSECOND, {start}, {end}) / 3600000000.0'
+
+
+@compiles(hours_between, 'sqlite')
+def _hours_between_sqlite(element, compiler, **kw):
+    start, end = _hours_operands(element, compiler, **kw)
+    return f'(julianday({end}) - julianday({start})) * 24.0'
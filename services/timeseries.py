@@ -0,0 +1,62 @@
+"""Per-month counts and sums of attendances, payrolls or payments
+
+A series is one GROUP BY over a range the indexes can seek: attendance
+and payment dates between the first day of the window and the first day
+after it, payrolls on their (year, month) columns. Months without rows are
+filled with zeros in Python, so the result always has one entry per month.
+Series are cached per table, window and sums, and invalidated by the
+table's data version.
+"""
+from models import db, Attendance, Payroll, Payment
+from services import cache
+from services.periods import month_range, period_between, recent_months
+from services.sql import total
+from sqlalchemy import and_, func, select
+
+MODELS = {'attendances': Attendance, 'payrolls': Payroll, 'payments': Payment}
+
+# The date each row counts towards; payrolls carry their period instead
+DATE_COLUMNS = {'attendances': Attendance.date, 'payments': Payment.payment_date}
+
+
+def window(table, periods):
+    """(year expression, month expression, filter) covering the given periods, oldest first"""
+    date_column = DATE_COLUMNS.get(table)
+    if date_column is None:
+        model = MODELS[table]
+        return model.year, model.month, period_between(model.year, model.month, periods[0], periods[-1])
+
+    start, _ = month_range(*periods[0])
+    _, end = month_range(*periods[-1])
+    return (func.extract('year', date_column), func.extract('month', date_column),
+            and_(date_column >= start, date_column < end))
+
+
+def _monthly(table, periods, sums):
+    model = MODELS[table]
+    year, month, in_window = window(table, periods)
+    rows = db.session.execute(
+        select(year, month, func.count(model.id), *[total(getattr(model, name)) for name in sums])
+        .where(in_window)
+        .group_by(year, month)
+    ).all()
+
+    found = {(int(row[0]), int(row[1])): row[2:] for row in rows}
+    series = []
+    for y, m in periods:
+        values = found.get((y, m), (0,) + (0,) * len(sums))
+        series.append(dict(zip(sums, values[1:]), year=y, month=m, count=values[0]))
+    return series
+
+
+def monthly(table, year, month, count, sums=()):
+    """Row count and the `sums` columns totalled per month, for the `count` months up to (year, month)
+
+    `table` is 'attendances', 'payrolls' or 'payments'; `sums` names columns
+    of its model, e.g. ('total_salary',). Returns one dict per month, oldest
+    first.
+    """
+    sums = tuple(sums)
+    periods = recent_months(year, month, count)
+    return cache.cached(f'timeseries.{table}', (table,), (year, month, count, sums),
+                        lambda: _monthly(table, periods, sums))
@@ -0,0 +1,129 @@
+"""Uploaded CSV/XLSX files kept under IMPORT_DIR for background processing
+
+Each upload gets its own directory, which also holds whatever reports the
+processing writes next to it; directories older than KEEP_DAYS are removed
+on the next upload.
+"""
+from flask import current_app
+from datetime import date, datetime, time
+import csv
+import os
+import shutil
+import uuid
+import openpyxl
+
+FORMATS = ('csv', 'xlsx')
+KEEP_DAYS = 7
+
+
+def _directory():
+    directory = current_app.config['IMPORT_DIR']
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+
+def _prune(directory):
+    cutoff = datetime.now().timestamp() - KEEP_DAYS * 86400
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                shutil.rmtree(path, ignore_errors=True)
+        except OSError:
+            pass
+
+
+def save_upload(file_storage):
+    """Store an uploaded CSV/XLSX file; returns (directory, path) or raises ValueError"""
+    fmt = os.path.splitext(file_storage.filename or '')[1].lower().lstrip('.')
+    if fmt not in FORMATS:
+        raise ValueError('Only .csv and .xlsx files can be imported')
+
+    root = _directory()
+    _prune(root)
+    directory = os.path.join(root, uuid.uuid4().hex)
+    os.makedirs(directory)
+    path = os.path.join(directory, f'source.{fmt}')
+    file_storage.save(path)
+    return directory, path
+
+
+def upload_directory(upload_id):
+    """Directory of an earlier upload by its id, or None"""
+    try:
+        upload_id = uuid.UUID(hex=upload_id).hex
+    except ValueError:
+        return None
+    directory = os.path.join(current_app.config['IMPORT_DIR'], upload_id)
+    return directory if os.path.isdir(directory) else None
+
+
+def _text(value):
+    if value is None:
+        return ''
+    if isinstance(value, datetime):
+        return value.isoformat(sep=' ')
+    if isinstance(value, (date, time)):
+        return value.isoformat()
+    return str(value)
+
+
+def _xlsx_rows(path):
+    wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        for row in wb.worksheets[0].iter_rows(values_only=True):
+            yield [_text(value) for value in row]
+    finally:
+        wb.close()
+
+
+def iter_rows(path):
+    """Rows of a CSV or XLSX file as lists of strings, read one at a time"""
+    if path.endswith('.xlsx'):
+        yield from _xlsx_rows(path)
+        return
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        yield from csv.reader(f)
+
+
+def xlsx_to_csv(path, csv_path):
+    """Convert the first sheet of a workbook to CSV, streaming in openpyxl's read-only mode"""
+    with open(csv_path, 'w', encoding='utf-8', newline='') as f:
+        csv.writer(f).writerows(_xlsx_rows(path))
+
+
+def column_map(header, columns, required):
+    """{field: column index} for a header row, given {field: accepted names}; raises ValueError
+
+    Names are compared lowercased, with spaces and dashes as underscores.
+    """
+    names = [str(name or '').strip().lower().replace(' ', '_').replace('-', '_') for name in header]
+    found = {}
+    for field, aliases in columns.items():
+        for alias in aliases:
+            if alias in names:
+                found[field] = names.index(alias)
+                break
+    missing = [field for field in required if field not in found]
+    if missing:
+        raise ValueError(f'Missing column(s): {", ".join(missing)}')
+    return found
+
+
+def cell(row, columns, field):
+    index = columns.get(field)
+    if index is None or index >= len(row):
+        return ''
+    return row[index].strip()
+
+
+def parse_date(value):
+    """A date given as YYYY-MM-DD (optionally with a time) or DD/MM/YYYY"""
+    try:
+        return date.fromisoformat(value[:10])
+    except ValueError:
+        pass
+    try:
+        return datetime.strptime(value, '%d/%m/%Y').date()
+    except ValueError:
+        raise ValueError(f'Invalid date {value!r}')
@@ -0,0 +1,54 @@
+import os
+import sys
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from flask import Flask
+from models import db, Department, Position, Employee
+from services.cache import init_cache
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def app(tmp_path):
+    """An app on a fresh SQLite file with the config the services read, inside an app context"""
+    app = Flask(__name__, root_path=ROOT)
+    app.config.update(
+        SQLALCHEMY_DATABASE_URI=f'sqlite:///{tmp_path / "test.db"}',
+        SQLALCHEMY_TRACK_MODIFICATIONS=False,
+        SECRET_KEY='test',
+        TESTING=True,
+        CACHE_BACKEND='memory',
+        CACHE_DIR=str(tmp_path / 'cache'),
+        CACHE_TTL=60,
+        CACHE_MAX_ENTRIES=64,
+        IMPORT_DIR=str(tmp_path / 'imports'),
+        IMPORT_CHUNK_ROWS=2000,
+        RECONCILE_LOOKBACK_DAYS=120,
+        QR_TOKEN_SECONDS=30,
+        JOB_CHUNK_SIZE=500
+    )
+    db.init_app(app)
+    init_cache(app)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+
+
+@pytest.fixture
+def employees(app):
+    """Three active employees NV001..NV003 in one department"""
+    department = Department(name='Kế toán')
+    position = Position(title='Nhân viên', base_salary=10000000)
+    db.session.add_all([department, position])
+    db.session.flush()
+    rows = [Employee(employee_id=f'NV{i:03d}', first_name='Nguyễn', last_name=f'Văn {i}', email=f'nv{i}@example.com',
+                     department_id=department.id, position_id=position.id, hire_date=date(2020, 1, 1),
+                     salary=10000000 + i * 1000000, allowance=500000, is_active=True) for i in range(1, 4)]
+    db.session.add_all(rows)
+    db.session.commit()
+    return rows
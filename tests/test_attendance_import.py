@@ -0,0 +1,45 @@
+from models import db, Attendance
+from services import attendance_import
+from datetime import date
+
+
+def _run_import(tmp_path, text, chunk_rows):
+    directory = tmp_path / 'upload'
+    directory.mkdir()
+    path = directory / 'source.csv'
+    path.write_text(text, encoding='utf-8')
+    params = {'directory': str(directory), 'path': str(path), 'filename': 'source.csv', 'chunk_rows': chunk_rows}
+    items = attendance_import.plan_import(params)
+    for offset, first_row in items:
+        attendance_import.import_chunk(params, offset, first_row)
+    db.session.commit()
+    return items
+
+
+def test_blank_line_on_chunk_boundary_does_not_drop_rows(app, employees, tmp_path):
+    # Records 1-3 form the first chunk; the blank line is record 4, the first of the second chunk
+    lines = ['employee_id,date,check_in,check_out',
+             'NV001,2025-08-01,08:00,17:00',
+             'NV001,2025-08-02,08:00,17:00',
+             'NV001,2025-08-03,08:00,17:00',
+             '',
+             'NV001,2025-08-04,08:00,17:00',
+             'NV001,2025-08-05,08:00,17:00',
+             'NV001,2025-08-06,08:00,17:00']
+    items = _run_import(tmp_path, '\r\n'.join(lines) + '\r\n', chunk_rows=3)
+
+    assert [first_row for _, first_row in items] == [2, 5, 8]
+    days = sorted(day for (day,) in db.session.query(Attendance.date))
+    assert days == [date(2025, 8, day) for day in range(1, 7)]
+
+
+def test_quoted_newline_does_not_split_a_record(app, employees, tmp_path):
+    lines = ['employee_id,date,check_in,check_out,notes',
+             'NV001,2025-08-01,08:00,17:00,"two',
+             'lines"',
+             'NV002,2025-08-01,08:00,17:00,',
+             'NV003,2025-08-01,08:00,12:00,']
+    _run_import(tmp_path, '\n'.join(lines) + '\n', chunk_rows=1)
+
+    notes = dict(db.session.query(Attendance.employee_id, Attendance.notes))
+    assert notes == {employees[0].id: 'two\nlines', employees[1].id: None, employees[2].id: None}
@@ -0,0 +1,36 @@
+from datetime import date
+from models import db, Payment, Payroll
+from services import bulk_payments
+
+
+def _payrolls(employees, statuses):
+    rows = [Payroll(employee_id=employee.id, month=8, year=2025, basic_salary=1000000,
+                    total_salary=1000000, status=status) for employee, status in zip(employees, statuses)]
+    db.session.add_all(rows)
+    db.session.commit()
+    return [row.id for row in rows]
+
+
+def test_paid_payrolls_are_never_paid_again(app, employees):
+    pending, paid_without_payment, approved = _payrolls(employees, ['pending', 'paid', 'approved'])
+    counters = bulk_payments.create_payments([pending, paid_without_payment, approved, 999],
+                                             date(2025, 9, 5), 'bank_transfer')
+    db.session.commit()
+    assert counters['created'] == 2
+    assert counters['skipped_ids'] == [paid_without_payment] and counters['missing_ids'] == [999]
+
+    # A second job for the same payrolls finds them paid
+    counters = bulk_payments.create_payments([pending, approved], date(2025, 9, 5), 'bank_transfer')
+    db.session.commit()
+    assert counters['created'] == 0 and counters['skipped'] == 2
+    assert Payment.query.count() == 2
+    assert {row.status for row in Payroll.query} == {'paid'}
+
+
+def test_single_payment_sees_the_bulk_payment(app, employees):
+    payroll_id, = _payrolls(employees[:1], ['approved'])
+    assert bulk_payments.active_payment(payroll_id) is None
+    db.session.rollback()
+    bulk_payments.create_payments([payroll_id], date(2025, 9, 5), 'bank_transfer')
+    db.session.commit()
+    assert bulk_payments.active_payment(payroll_id) == Payment.query.one().id
@@ -0,0 +1,27 @@
+from models import db, DataVersion
+from services import cache
+
+
+def _version(name):
+    return dict(cache.versions([name]))[name]
+
+
+def test_bumps_apply_once_after_commit(app):
+    db.session.add(DataVersion(name='attendances', version=0))
+    db.session.commit()
+
+    cache.bump('attendances')
+    with db.session.begin_nested():
+        cache.bump('attendances', 'payrolls')
+    # Nothing is written, and no row locked, before the outer commit
+    assert _version('attendances') == 0
+    db.session.commit()
+    assert _version('attendances') == 1
+    assert _version('payrolls') == 1
+
+
+def test_rolled_back_transaction_drops_its_bumps(app):
+    cache.bump('payments')
+    db.session.rollback()
+    db.session.commit()
+    assert _version('payments') == 0
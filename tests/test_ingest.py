@@ -0,0 +1,32 @@
+from datetime import date, datetime
+from models import db, Attendance
+from services import ingest
+
+
+def test_batch_replans_after_losing_an_insert_race(app, employees, monkeypatch):
+    employee_id = employees[0].id
+    day = date(2025, 8, 4)
+    read_existing = ingest._read_existing
+    calls = []
+
+    def stale_first_read(events):
+        # Another process inserts the day right after this batch read it
+        calls.append(events)
+        if len(calls) == 1:
+            db.session.add(Attendance(employee_id=employee_id, date=day, status='present',
+                                      check_in=datetime(2025, 8, 4, 7, 55)))
+            db.session.flush()
+            return {}
+        return read_existing(events)
+
+    monkeypatch.setattr(ingest, '_read_existing', stale_first_read)
+    events = [ingest.IngestEvent('check_in', employee_id, day, datetime(2025, 8, 4, 8, 0)),
+              ingest.IngestEvent('check_out', employee_id, day, datetime(2025, 8, 4, 17, 55))]
+    ingest.apply_batch(events)
+    db.session.commit()
+
+    assert [event.result for event in events] == [ingest.ALREADY_DONE, ingest.RECORDED]
+    row = Attendance.query.filter_by(employee_id=employee_id, date=day).one()
+    assert row.check_in == datetime(2025, 8, 4, 7, 55)
+    assert row.check_out == datetime(2025, 8, 4, 17, 55)
+    assert row.total_hours == 10.0 and row.overtime_hours == 2.0
@@ -0,0 +1,66 @@
+import json
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import select
+from models import db, Job
+from services.jobs import JobRunner, handler, progress
+
+
+class RecordingExecutor:
+    def __init__(self):
+        self.calls = []
+
+    def submit(self, fn, *args):
+        self.calls.append(args)
+
+
+def test_a_job_is_submitted_once_until_its_run_ends(app):
+    runner = JobRunner()
+    runner.app = app
+    runner.executor = RecordingExecutor()
+    runner._started = True
+
+    # The poller sees the same queued job on every pass
+    for _ in range(3):
+        runner.submit(7)
+    assert runner.executor.calls == [(7,)]
+
+    runner._run(7)  # not in the table, so nothing to claim
+    runner.submit(7)
+    assert runner.executor.calls == [(7,), (7,)]
+
+
+def test_heartbeat_is_refreshed_while_a_long_chunk_runs(app):
+    app.config['JOB_STALE_SECONDS'] = 0.3
+    seen = []
+
+    @handler('test_slow')
+    def process(params, items):
+        with db.engine.connect() as conn:
+            before = conn.execute(select(Job.heartbeat_at).where(Job.id == job_id)).scalar()
+            time.sleep(0.5)
+            seen.append(conn.execute(select(Job.heartbeat_at).where(Job.id == job_id)).scalar() > before)
+        return {}
+
+    job = Job(kind='test_slow', params=json.dumps({'items': [1]}), total=1)
+    db.session.add(job)
+    db.session.commit()
+    job_id = job.id
+
+    runner = JobRunner()
+    runner.app = app
+    runner._run(job_id)
+    assert seen == [True]
+    db.session.expire_all()
+    assert db.session.get(Job, job_id).status == 'completed'
+
+
+def test_eta_of_a_resumed_job_uses_the_rate_since_the_resume(app):
+    now = datetime.utcnow()
+    # Half done a day ago by a worker that crashed, resumed a minute ago
+    job = Job(kind='test_slow', params='{}', status='running', total=200, processed=110,
+              started_at=now - timedelta(days=1), claimed_at=now - timedelta(seconds=60), claimed_processed=100)
+    db.session.add(job)
+    db.session.commit()
+    # 10 items in the last minute leave 90 items, about 9 minutes
+    assert 530 < progress(job)['eta_seconds'] < 550
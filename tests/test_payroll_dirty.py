@@ -0,0 +1,31 @@
+from datetime import datetime
+from models import db
+from services import payroll_dirty
+from services.payroll_engine import generate_payrolls
+
+
+class _FrozenClock(datetime):
+    """utcnow() stuck on one whole second, as MySQL DATETIME stores it"""
+
+    @classmethod
+    def utcnow(cls):
+        return datetime(2025, 9, 1, 8, 0, 0)
+
+
+def test_remark_in_the_same_second_survives_dequeue(app, employees, monkeypatch):
+    monkeypatch.setattr(payroll_dirty, 'datetime', _FrozenClock)
+    employee_id = employees[0].id
+    generate_payrolls(8, 2025, [employee_id])
+    payroll_dirty.mark([(employee_id, 2025, 8)])
+    db.session.commit()
+
+    marks = payroll_dirty.queued()
+    # Attendance changes again while a recompute works from `marks`
+    payroll_dirty.mark([(employee_id, 2025, 8)])
+    payroll_dirty.dequeue(marks)
+    db.session.commit()
+
+    assert payroll_dirty.pending_count() == 1
+    payroll_dirty.dequeue(payroll_dirty.queued())
+    db.session.commit()
+    assert payroll_dirty.pending_count() == 0
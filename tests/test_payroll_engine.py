@@ -0,0 +1,130 @@
+from datetime import date, datetime, timedelta
+from models import db, Attendance, Employee, Payroll
+from services.payroll_engine import calculate_batch, generate_payrolls, insert_payrolls, payroll_rows
+from sqlalchemy import and_
+
+
+# The per-employee calculation routes/payroll.py had before the batch engine,
+# kept verbatim as the reference the engine must reproduce
+def calculate_payroll(employee_id, month, year):
+    """Calculate payroll for an employee for a specific month"""
+    # Get employee
+    employee = Employee.query.get(employee_id)
+    if not employee:
+        return None
+    
+    # Get month boundaries
+    start_date = date(year, month, 1)
+    if month == 12:
+        end_date = date(year + 1, 1, 1) - timedelta(days=1)
+    else:
+        end_date = date(year, month + 1, 1) - timedelta(days=1)
+    
+    # Get attendance records for the month
+    attendances = Attendance.query.filter(
+        and_(
+            Attendance.employee_id == employee_id,
+            Attendance.date >= start_date,
+            Attendance.date <= end_date
+        )
+    ).all()
+    
+    # Calculate working days and hours
+    working_days = len([a for a in attendances if a.status == 'present'])
+    absent_days = len([a for a in attendances if a.status == 'absent'])
+    total_hours = sum([a.total_hours or 0 for a in attendances])
+    overtime_hours = sum([a.overtime_hours or 0 for a in attendances])
+    
+    # Calculate salary components
+    daily_salary = employee.salary / 22  # Assuming 22 working days per month
+    basic_salary = daily_salary * working_days
+    allowance = employee.allowance
+    overtime_pay = overtime_hours * (daily_salary / 8) * 1.5  # 1.5x for overtime
+    bonus = 0  # Can be configured
+    deductions = absent_days * daily_salary
+    
+    total_salary = basic_salary + allowance + overtime_pay + bonus - deductions
+    
+    return {
+        'basic_salary': round(basic_salary, 2),
+        'allowance': allowance,
+        'overtime_pay': round(overtime_pay, 2),
+        'bonus': bonus,
+        'deductions': round(deductions, 2),
+        'total_salary': round(total_salary, 2),
+        'working_days': working_days,
+        'absent_days': absent_days,
+        'overtime_hours': overtime_hours
+    }
+
+
+def _seed_attendance(employees):
+    first, second, _ = employees
+    rows = [
+        # Month boundaries: only August counts
+        (first, date(2025, 7, 31), 'present', 9.5, 1.5),
+        (first, date(2025, 8, 1), 'present', 10.25, 2.25),
+        (first, date(2025, 8, 4), 'late', 7.0, 0.0),
+        (first, date(2025, 8, 5), 'absent', None, None),
+        (first, date(2025, 8, 29), 'present', 8.0, 0.0),
+        (first, date(2025, 9, 1), 'present', 12.0, 4.0),
+        (second, date(2025, 8, 11), 'half-day', 4.0, 0.0),
+        (second, date(2025, 8, 12), 'absent', 0.0, 0.0),
+        (second, date(2025, 8, 13), 'present', 11.33, 3.33),
+        # Year boundary for the December period
+        (second, date(2025, 12, 31), 'present', 9.0, 1.0),
+        (second, date(2026, 1, 1), 'present', 9.0, 1.0),
+    ]
+    db.session.add_all([
+        Attendance(employee_id=employee.id, date=day, status=status, total_hours=hours, overtime_hours=overtime,
+                   check_in=datetime.combine(day, datetime.min.time()) if status != 'absent' else None)
+        for employee, day, status, hours, overtime in rows
+    ])
+    db.session.commit()
+
+
+def test_batch_matches_per_employee_calculation(app, employees):
+    # The third employee has no attendance in either month
+    _seed_attendance(employees)
+    ids = [employee.id for employee in employees]
+
+    for month, year in ((8, 2025), (12, 2025)):
+        results = calculate_batch(month, year, ids)
+        assert results == {employee_id: calculate_payroll(employee_id, month, year) for employee_id in ids}
+
+        generate_payrolls(month, year, ids)
+        db.session.commit()
+        for payroll in Payroll.query.filter_by(month=month, year=year):
+            expected = calculate_payroll(payroll.employee_id, month, year)
+            assert {name: getattr(payroll, name) for name in expected} == expected
+
+
+def _payroll_count(month, year):
+    return Payroll.query.filter_by(month=month, year=year).count()
+
+
+def test_insert_skips_payrolls_created_by_a_concurrent_job(app, employees):
+    ids = [employee.id for employee in employees]
+    rows = payroll_rows(8, 2025, calculate_batch(8, 2025, ids))
+    # Another job created the first employee's payroll after this one checked
+    db.session.execute(db.insert(Payroll), [rows[0]])
+
+    inserted = insert_payrolls(8, 2025, rows)
+    db.session.commit()
+
+    assert inserted == ids[1:]
+    assert _payroll_count(8, 2025) == 3
+
+
+def test_generating_a_period_twice_creates_no_duplicates(app, employees):
+    ids = [employee.id for employee in employees]
+    created_keys, skipped_ids, missing_ids = generate_payrolls(8, 2025, ids + [ids[0]])
+    db.session.commit()
+    assert created_keys == [(employee_id, 2025, 8) for employee_id in ids]
+    assert skipped_ids == [] and missing_ids == []
+
+    created_keys, skipped_ids, missing_ids = generate_payrolls(8, 2025, ids)
+    db.session.commit()
+    assert created_keys == []
+    assert skipped_ids == ids
+    assert _payroll_count(8, 2025) == 3
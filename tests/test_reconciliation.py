@@ -0,0 +1,46 @@
+import csv
+import os
+from datetime import date
+from models import db, Payment, Payroll
+from services import reconciliation
+
+
+def _statement(tmp_path, lines):
+    path = tmp_path / 'statement.csv'
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['Reference', 'Beneficiary Code', 'Amount', 'Value Date', 'Status'])
+        writer.writerows(lines)
+    return str(path)
+
+
+def test_shared_reference_is_reported_not_matched(app, employees, tmp_path):
+    today = date.today()
+    payroll_ids = []
+    for employee in employees:
+        payroll = Payroll(employee_id=employee.id, month=today.month, year=today.year,
+                          basic_salary=1000000, total_salary=1000000)
+        db.session.add(payroll)
+        db.session.flush()
+        payroll_ids.append(payroll.id)
+    first, second, third = [Payment(employee_id=employee.id, payroll_id=payroll_id, amount=1000000,
+                                    payment_date=today, reference_number=reference, status=status)
+                            for employee, payroll_id, reference, status in zip(
+                                employees, payroll_ids, ['TRX1', 'TRX1', 'TRX2'], ['pending', 'pending', 'cancelled'])]
+    db.session.add_all([first, second, third])
+    db.session.commit()
+
+    path = _statement(tmp_path, [
+        ['TRX1', 'NV001', '1000000', today.isoformat(), 'success'],
+        ['TRX2', 'NV003', '1000000', today.isoformat(), 'success']
+    ])
+    counters = reconciliation.reconcile(str(tmp_path), path)
+    db.session.commit()
+
+    assert counters['matched'] == 1 and counters['unmatched'] == 1
+    assert [db.session.get(Payment, payment.id).status for payment in (first, second, third)] == \
+        ['pending', 'pending', 'completed']
+    with open(os.path.join(tmp_path, reconciliation.UNMATCHED_FILE), encoding='utf-8-sig') as f:
+        report = list(csv.reader(f))
+    assert report[1][:2] == ['2', 'TRX1']
+    assert report[1][-1] == f'Reference shared by payments #{first.id}, #{second.id}'
@@ -0,0 +1,75 @@
+import pytest
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit
+from models import db, Attendance
+from routes.attendance import FREE_PIN_FAILURES, bp
+from services import qr_codes, qr_tokens
+
+
+@pytest.fixture
+def client(app, employees):
+    app.register_blueprint(bp)
+    employees[0].checkin_pin_hash = qr_tokens.pin_hash('2468')
+    db.session.commit()
+    return app.test_client()
+
+
+def _post(client, code, pin, token=None):
+    return client.post('/attendance/self-check-in', data={
+        'token': token or qr_tokens.issue(), 'employee_code': code, 'pin': pin
+    })
+
+
+def test_check_in_needs_the_employee_pin(client, employees):
+    token = qr_tokens.issue()
+    assert _post(client, 'NV001', '1357', token).status_code == 403
+    assert Attendance.query.count() == 0
+
+    # A wrong PIN does not spend the token
+    assert _post(client, 'NV001', '2468', token).status_code == 200
+    assert Attendance.query.filter_by(employee_id=employees[0].id).count() == 1
+
+
+def test_wrong_pins_back_off_without_spending_the_token(client, employees):
+    token = qr_tokens.issue()
+    for _ in range(FREE_PIN_FAILURES + 1):
+        assert _post(client, 'NV001', '0000', token).status_code == 403
+    db.session.expire_all()
+    assert employees[0].checkin_retry_at > datetime.now()
+    # During the backoff even the right PIN is refused
+    assert _post(client, 'NV001', '2468', token).status_code == 403
+
+    employees[0].checkin_retry_at = datetime.now() - timedelta(seconds=1)
+    db.session.commit()
+    assert _post(client, 'NV001', '2468', token).status_code == 200
+    db.session.expire_all()
+    assert employees[0].checkin_failures == 0 and employees[0].checkin_retry_at is None
+
+
+def test_token_is_single_use_per_employee(client, employees):
+    token = qr_tokens.issue()
+    assert _post(client, 'NV001', '2468', token).status_code == 200
+    response = _post(client, 'NV001', '2468', token)
+    assert response.status_code == 403
+
+
+def test_unknown_code_gets_the_same_answer_as_a_wrong_pin(client):
+    token = qr_tokens.issue()
+    unknown = _post(client, 'NV999', '2468', token)
+    no_pin = _post(client, 'NV002', '2468', token)
+    wrong_pin = _post(client, 'NV001', '0000', token)
+    assert unknown.status_code == no_pin.status_code == wrong_pin.status_code == 403
+    assert unknown.data == no_pin.data == wrong_pin.data
+
+
+def test_kiosk_qr_opens_the_check_in_form_on_a_plain_scan(app, client, monkeypatch, tmp_path):
+    # A phone camera opens the encoded URL with GET, so it must not point at a POST-only view
+    app.config.update(LOGIN_DISABLED=True, QR_CACHE_DIR=str(tmp_path / 'qr'))
+    encoded = []
+    render = qr_codes.qr_png
+    monkeypatch.setattr(qr_codes, 'qr_png', lambda url: encoded.append(url) or render(url))
+
+    assert client.get('/attendance/qr').status_code == 200
+    response = client.get(urlsplit(encoded[0])._replace(scheme='', netloc='').geturl())
+    assert response.status_code == 200
+    assert b'name="pin"' in response.data